@@ -1,8 +1,13 @@
 from prompt_toolkit import prompt
 from prompt_toolkit.completion import WordCompleter
+from tabulate import tabulate
 
 import utils.input_validation as v
-from db.crud import recordDividend, getDistinctTickersWithPositions
+from db.crud import recordDividend, getDistinctTickersWithPositions, insertDividendEntitlements
+from fetchers.async_fetcher import runFetch
+from fetchers.history_fetcher import fetchDividendHistory
+from fetchers.network import isOffline
+from utils.table_utils import formatCurrency
 
 def dividend(conn, key_bindings):
     """
@@ -28,3 +33,30 @@ def dividend(conn, key_bindings):
             print(f"Failed to update database: {e}")
     except KeyboardInterrupt:
         print("Operation cancelled.")
+
+def syncDividends(conn):
+    """
+    Record dividends for all tickers with active positions from the provider's distribution history.
+    Each distribution is paid on the units held going into its ex-date, and recorded against the ex-date.
+    Distributions already recorded, by a previous sync or manually against their payment date, are skipped,
+    see `insertDividendEntitlements`.
+    """
+    if isOffline(conn):
+        print("Offline, dividends can't be synced.")
+        return
+
+    tickers = getDistinctTickersWithPositions(conn)
+    if not tickers:
+        print("No tickers with active positions found in portfolio.")
+        return
+
+    print(f"Fetching distribution history for {len(tickers)} tickers...")
+    distributions = runFetch(conn, fetchDividendHistory, tickers)
+    recorded = insertDividendEntitlements(conn, distributions)
+    if not recorded:
+        print("No new dividends to record.")
+        return
+
+    rows = [[ticker, date, formatCurrency(value)] for ticker, date, value in sorted(recorded, key=lambda row: (row[1], row[0]))]
+    print(tabulate(rows, headers=['Ticker', 'Ex-Date', 'Value'], tablefmt='rounded_grid', colalign=['left', 'left', 'right']))
+    print(f"Recorded {len(recorded)} dividends totalling {formatCurrency(sum(row[2] for row in recorded))}.\n")
@@ -1,13 +1,101 @@
-import fear_and_greed
+import threading
+import time
 
-def fearAndGreedIndex():
+from db.db_handler import get_connection
+from fetchers.config import FEAR_AND_GREED_CACHE_FILE, FEAR_AND_GREED_CACHE_TTL_SECONDS
+from fetchers.disk_cache import DiskCache
+from fetchers.providers import getProvider, ProviderError
+from utils.settings_utils import getBooleanSetting
+from utils.table_utils import formatAsOf
+
+FEAR_AND_GREED_CACHE_KEY = 'fearAndGreed'
+
+fearAndGreedCache = DiskCache(FEAR_AND_GREED_CACHE_FILE)
+
+def fearAndGreedIndex(conn):
     """
-    Fetches and displays the current CNN Fear and Greed Index.
+    Displays the current CNN Fear and Greed Index, from the cache if fetched within `FEAR_AND_GREED_CACHE_TTL_SECONDS`.
+    If it can't be fetched, eg. when offline, the last fetched index is shown with when it was fetched.
     """
-    data = fear_and_greed.get()
+    cached = getCachedFearAndGreed()
+    if cached is not None and isFearAndGreedFresh(cached[1]):
+        print(f"\nCurrent CNN Fear and Greed Index: {formatFearAndGreed(cached[0])}\n")
+        return
+
+    try:
+        data = fetchFearAndGreed(conn)
+    except ProviderError as e:
+        if cached is None:
+            print(f"\nCould not fetch CNN Fear and Greed Index: {e}\n")
+            return
+
+        data, fetchedAt = cached
+        print(f"\nCNN Fear and Greed Index as of {formatAsOf(fetchedAt)}: {formatFearAndGreed(data)}\n")
+        return
     
     if data:
-        index_value = round(float(data.value), 2)
-        index_classification = data.description
+        print(f"\nCurrent CNN Fear and Greed Index: {formatFearAndGreed(data)}\n")
+
+def startFearAndGreedBanner(conn):
+    """
+    Show the Fear and Greed Index banner at startup without waiting on CNN.
+    A fresh cached index is printed straight away, otherwise it is fetched on a background thread
+    and printed once it arrives, or the last fetched index is printed if it can't be fetched.
+
+    Params:
+    - conn: connection to database
+
+    Returns:
+    - the started fetch thread, or None if the cached index was printed
+    """
+    cached = getCachedFearAndGreed()
+    if cached is not None and isFearAndGreedFresh(cached[1]):
+        print(f"\nCurrent CNN Fear and Greed Index: {formatFearAndGreed(cached[0])}\n")
+        return None
+
+    thread = threading.Thread(target=printFearAndGreedBanner, name='fear-and-greed', daemon=True)
+    thread.start()
+    return thread
+
+def printFearAndGreedBanner():
+    """
+    Fetch and print the Fear and Greed Index banner.
+    Runs on a background thread, so uses its own database connection.
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        fearAndGreedIndex(conn)
+    except (Exception, SystemExit) as e:
+        if conn is not None and getBooleanSetting(conn, 'debug_mode'):
+            print(f"\nBackground Fear and Greed Index fetch failed: {e}")
+    finally:
+        if conn is not None:
+            conn.close()
+
+def fetchFearAndGreed(conn):
+    """
+    Fetch the Fear and Greed Index from the provider, caching it for the startup banner and later commands.
+
+    Raises:
+    - ProviderError: if the provider can't serve the index
+    """
+    data = getProvider(conn).getFearAndGreed()
+    if data:
+        fearAndGreedCache.putMany({FEAR_AND_GREED_CACHE_KEY: data})
+    return data
+
+def getCachedFearAndGreed():
+    """
+    Get the last fetched index as a (data, fetchedAt) tuple however old, or None if never fetched
+    """
+    return fearAndGreedCache.getMany([FEAR_AND_GREED_CACHE_KEY]).get(FEAR_AND_GREED_CACHE_KEY)
+
+def isFearAndGreedFresh(fetchedAt, now=None):
+    now = now if now is not None else time.time()
+    return now - fetchedAt < FEAR_AND_GREED_CACHE_TTL_SECONDS
 
-        print(f"\nCurrent CNN Fear and Greed Index: {index_value}/100 ({index_classification})\n")
+def formatFearAndGreed(data):
+    index_value = round(float(data['value']), 2)
+    index_classification = data['description']
+    return f"{index_value}/100 ({index_classification})"
@@ -1,68 +1,93 @@
-import ast
 import pandas as pd
 from tabulate import tabulate
 
-from db.crud import getSetting
-from fetchers.yfinance_fetcher import getYfinanceTickerData
-from utils.constants.defaults import DEFAULT_INDEX_TICKERS, getDefaultSetting
-from utils.table_utils import formatPercentage, formatCurrency
+from fetchers.async_fetcher import runFetch
+from fetchers.yfinance_fetcher import getFetchDeadline, getYfinanceTickerData
+from utils.refresh_utils import makeQuoteRefreshNotifier
+from utils.settings_utils import getBooleanSetting, getListSetting
+from utils.table_utils import formatAge, formatPercentage, formatCurrency, formatQuoteStatus, formatQuoteStatusNotes, isMissing
 
 OUTPUT_COLUMNS = ['Name', 'Exchange Name', 'Price', 'Currency', '52wk Diff', '52wk Low Diff', '52wk High Diff', '200-Day Avg Diff']
 COL_ALIGN = ['left', 'left', 'right', 'left', 'right', 'right', 'right', 'right']
 MAX_NAME_LENGTH = 25
 MAX_COL_WIDTHS = [MAX_NAME_LENGTH, 11, 12, 8, 10, 10, 10, 10]
 INDICES_SETTING_KEY = 'indices_of_interest'
+AGE_COLUMN = 'Age'
+AGE_COL_WIDTH = 4
+INDEX_FIELDS = [
+    'fullName',
+    'shortName',
+    'fullExchangeName',
+    'currency',
+    'regularMarketPrice',
+    'regularMarketPreviousClose',
+    'fiftyTwoWeekChangePercent',
+    'fiftyTwoWeekLowChangePercent',
+    'fiftyTwoWeekHighChangePercent',
+    'twoHundredDayAverageChangePercent'
+]
 
 def indexPerformance(conn):
     """
     Gets performance of key indices. Uses default indices if not set by settings.
     """
-    default_indices = getDefaultSetting(INDICES_SETTING_KEY)
-    indices_str = getSetting(conn, INDICES_SETTING_KEY, default_indices)
-    try:
-        indices = ast.literal_eval(indices_str)
-    except (ValueError, SyntaxError):
-        print("\nError parsing indices from settings. Using default indices.")
-        indices = ast.literal_eval(default_indices)
+    indices = getListSetting(conn, INDICES_SETTING_KEY)
+    showAge = getBooleanSetting(conn, 'stale_while_revalidate')
+    onRefresh = makeQuoteRefreshNotifier('index-performance') if showAge else None
     
-    data = getYfinanceTickerData(conn, indices)    
+    quotes = runFetch(
+        conn,
+        getYfinanceTickerData,
+        indices,
+        fields=INDEX_FIELDS + ['fetchedAt', 'quoteStatus'],
+        asFrame=True,
+        onRefresh=onRefresh,
+        deadline=getFetchDeadline(conn)
+    )
+    quotes = quotes.reindex([index for index in indices if index in quotes.index])
+
+    prices = quotes['regularMarketPrice'].fillna(quotes['regularMarketPreviousClose'])
+    lowDiffs = quotes['fiftyTwoWeekLowChangePercent'] * 100
+    highDiffs = quotes['fiftyTwoWeekHighChangePercent'] * 100
+    twoHundredDayDiffs = quotes['twoHundredDayAverageChangePercent'] * 100
     
     outputDfRows = []
 
-    for index in indices:
-        if index not in data:
-            continue
-
-        outputDfRows.append([
-            getIndexDisplayName(data[index]),
-            data[index]['fullExchangeName'] if data[index]['fullExchangeName'] else '-',
-            formatCurrency(getIndexPrice(data[index]), includeDollarSign=False),
-            data[index]['currency'],
-            formatPercentage(data[index]['fiftyTwoWeekChangePercent']),
-            formatPercentage(data[index]['fiftyTwoWeekLowChangePercent'] * 100),
-            formatPercentage(data[index]['fiftyTwoWeekHighChangePercent'] * 100),
-            formatPercentage(data[index]['twoHundredDayAverageChangePercent'] * 100)
-        ])
+    for index, quote in quotes.iterrows():
+        row = [
+            formatQuoteStatus(getIndexDisplayName(index, quote), quote['quoteStatus']),
+            quote['fullExchangeName'] if quote['fullExchangeName'] else '-',
+            formatCurrency(prices[index], includeDollarSign=False) if not isMissing(prices[index]) else '-',
+            quote['currency'],
+            formatPercentage(quote['fiftyTwoWeekChangePercent']),
+            formatPercentage(lowDiffs[index]),
+            formatPercentage(highDiffs[index]),
+            formatPercentage(twoHundredDayDiffs[index])
+        ]
+        if showAge:
+            row.append(formatAge(quote['fetchedAt']))
+        outputDfRows.append(row)
     
-    df = pd.DataFrame(outputDfRows, columns=OUTPUT_COLUMNS)
+    columns = OUTPUT_COLUMNS + [AGE_COLUMN] if showAge else OUTPUT_COLUMNS
+    df = pd.DataFrame(outputDfRows, columns=columns)
     table = tabulate(
         df, 
         headers='keys', 
         tablefmt='rounded_grid', 
         showindex=False, 
-        colalign=COL_ALIGN,
-        maxcolwidths=MAX_COL_WIDTHS
+        colalign=COL_ALIGN + ['right'] if showAge else COL_ALIGN,
+        maxcolwidths=MAX_COL_WIDTHS + [AGE_COL_WIDTH] if showAge else MAX_COL_WIDTHS
     )
     print(table)
 
-def getIndexDisplayName(indexData):
+    notes = formatQuoteStatusNotes(quotes['quoteStatus'], quotes['fetchedAt'])
+    if notes:
+        print(notes)
+
+def getIndexDisplayName(ticker, indexData):
     if indexData['fullName']:
         return indexData['fullName'][:MAX_NAME_LENGTH]
     elif indexData['shortName']:
         return indexData['shortName'][:MAX_NAME_LENGTH]
     else:
-        return indexData['ticker'][:MAX_NAME_LENGTH]
-
-def getIndexPrice(indexData):
-    # print(indexData)
-    return indexData['regularMarketPrice'] if indexData['regularMarketPrice'] is not None else indexData['regularMarketPreviousClose']
\ No newline at end of file
+        return ticker[:MAX_NAME_LENGTH]
@@ -2,11 +2,13 @@ import pandas as pd
 from tabulate import tabulate
 
 from db.crud import getDistinctTickersWithPositions
-from fetchers.yfinance_fetcher import getYfinanceTickerData
-from utils.table_utils import formatPercentage, formatRatio
+from fetchers.async_fetcher import runFetch
+from fetchers.yfinance_fetcher import getFetchDeadline, getYfinanceTickerData
+from utils.table_utils import formatPercentage, formatQuoteStatus, formatQuoteStatusNotes, formatRatio
 
 OUTPUT_COLUMNS = ['Ticker', 'Name', 'YTD', '3Y', '5Y', 'P/E Ratio']
 COL_ALIGN = ['left', 'left', 'right', 'right', 'right', 'right']
+PERFORMANCE_FIELDS = ['fullName', 'ytdReturn', 'threeYrReturn', 'fiveYrReturn', 'peRatio', 'fetchedAt', 'quoteStatus']
 
 def investmentPerformance(conn):
     """
@@ -20,28 +22,28 @@ def investmentPerformance(conn):
         print("No tickers found in current portfolio.")
         return
 
-    data = getYfinanceTickerData(conn, tickers)
+    quotes = runFetch(conn, getYfinanceTickerData, tickers, fields=PERFORMANCE_FIELDS, asFrame=True, deadline=getFetchDeadline(conn))
+    quotes = quotes.reindex([ticker for ticker in tickers if ticker in quotes.index])
 
-    outputDfRows = []
+    threeYrReturns = quotes['threeYrReturn'] * 100
+    fiveYrReturns = quotes['fiveYrReturn'] * 100
 
-    for ticker in tickers:
-        if ticker not in data:
-            continue
-        
-        ytd = formatPercentage(data[ticker]['ytdReturn'])
-        threeYrReturn = formatPercentage(data[ticker]['threeYrReturn'] * 100 if data[ticker]['threeYrReturn'] is not None else None)
-        fiveYrReturn = formatPercentage(data[ticker]['fiveYrReturn'] * 100 if data[ticker]['fiveYrReturn'] is not None else None)
-        peRatio = formatRatio(data[ticker]['peRatio'])
+    outputDfRows = []
 
+    for ticker, quote in quotes.iterrows():
         outputDfRows.append([
-            ticker, 
-            data[ticker]['fullName'],
-            ytd,
-            threeYrReturn,
-            fiveYrReturn,
-            peRatio
+            formatQuoteStatus(ticker, quote['quoteStatus']), 
+            quote['fullName'],
+            formatPercentage(quote['ytdReturn']),
+            formatPercentage(threeYrReturns[ticker]),
+            formatPercentage(fiveYrReturns[ticker]),
+            formatRatio(quote['peRatio'])
         ])
 
     df = pd.DataFrame(outputDfRows, columns=OUTPUT_COLUMNS)
     table = tabulate(df, headers='keys', tablefmt='rounded_grid', showindex=False, colalign=COL_ALIGN)
     print(table)
+
+    notes = formatQuoteStatusNotes(quotes['quoteStatus'], quotes['fetchedAt'])
+    if notes:
+        print(notes)
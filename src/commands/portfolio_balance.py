@@ -0,0 +1,106 @@
+import pandas as pd
+from tabulate import tabulate
+
+from db.crud import getCurrentPortfolioData, getDistinctTickersWithPositions
+from fetchers.async_fetcher import runFetches
+from fetchers.exposure_fetcher import EXPOSURE_TYPES, getLookThroughExposures
+from fetchers.fx import getBaseCurrency, getTickerFxRates, toBaseCurrency
+from fetchers.yfinance_fetcher import getFetchDeadline, getYfinancePriceData
+from utils.table_utils import formatCurrency, formatPercentage
+
+EXPOSURE_TITLES = {'sector': 'Sector', 'region': 'Region', 'holding': 'Holding'}
+COL_ALIGN = ['left', 'right', 'right']
+
+# Largest underlying holdings listed, the rest are summed into one row
+TOP_HOLDINGS_COUNT = 15
+
+# Label for the part of the portfolio a breakdown doesn't cover, eg. fund holdings outside the published top holdings
+UNCLASSIFIED = 'Unclassified'
+
+def portfolioBalance(conn):
+    """
+    Show look-through exposure of the current portfolio: the sector, region and underlying holding weights
+    across every position, with each fund broken down into its own holdings and sectors.
+    """
+    tickers = getDistinctTickersWithPositions(conn)
+    if not tickers:
+        print("No tickers found in current portfolio.")
+        return
+
+    deadline = getFetchDeadline(conn)
+    # Exchange rates and fund exposures are looked up while the prices are fetched
+    rates, prices, exposures = runFetches(
+        conn,
+        (getTickerFxRates, (tickers,), {'deadline': deadline}),
+        (getYfinancePriceData, (tickers,), {'deadline': deadline}),
+        (getLookThroughExposures, (tickers,), {})
+    )
+
+    volumes = pd.Series({ticker: data['volume'] for ticker, data in getCurrentPortfolioData(conn, tickers).items()}, dtype=float)
+    values = toBaseCurrency(pd.Series({ticker: prices[ticker]['price'] for ticker in tickers}, dtype=float) * volumes, rates)
+
+    unpricedTickers = list(values.index[values.isna()])
+    values = values.dropna()
+    if values.sum() <= 0:
+        print("No prices available to value the portfolio.")
+        return
+
+    balance = aggregateExposures(values, exposures)
+    for exposureType in EXPOSURE_TYPES:
+        rows = balance[balance['exposureType'] == exposureType]
+        if exposureType == 'holding':
+            rows = limitHoldings(rows)
+
+        outputDfRows = [[row['name'], formatCurrency(row['value']), formatPercentage(row['weight'] * 100)] for _, row in rows.iterrows()]
+        df = pd.DataFrame(outputDfRows, columns=[EXPOSURE_TITLES[exposureType], 'Value', 'Weight'])
+        print(tabulate(df, headers='keys', tablefmt='rounded_grid', showindex=False, colalign=COL_ALIGN))
+
+    print(f"Values in {getBaseCurrency(conn)}. {UNCLASSIFIED} is the part not broken down by the fund's provider, eg. regions of funds.")
+    if unpricedTickers:
+        print(f"Positions without a price are excluded: {', '.join(unpricedTickers)}")
+
+def aggregateExposures(values, exposures):
+    """
+    Aggregate position values into look-through exposures.
+    Every ticker's weights are laid out as one (ticker, exposure) matrix, so the exposure values
+    of every sector, region and holding come from a single multiply of the position values by it.
+
+    Params:
+    - values: pandas Series of ticker to position value
+    - exposures: pandas DataFrame of exposure weights, from `getLookThroughExposures`
+
+    Returns:
+    - pandas DataFrame with `exposureType`, `name`, `value` and `weight` columns, weight as a fraction of the total value.
+      Exposure types are in `EXPOSURE_TYPES` order, each largest first and ending with its `UNCLASSIFIED` remainder.
+    """
+    weights = exposures.pivot_table(index='ticker', columns=['exposureType', 'name'], values='weight', aggfunc='sum', fill_value=0.0)
+    weights = weights.reindex(index=values.index, fill_value=0.0)
+
+    exposureValues = pd.Series(values.to_numpy() @ weights.to_numpy(), index=weights.columns, dtype=float)
+    totalValue = values.sum()
+
+    frames = []
+    for exposureType in EXPOSURE_TYPES:
+        typeValues = exposureValues[exposureType] if exposureType in exposureValues.index.get_level_values(0) else pd.Series(dtype=float)
+        typeValues = typeValues[typeValues > 0].sort_values(ascending=False)
+        remainder = totalValue - typeValues.sum()
+        if remainder > totalValue * 1e-9:
+            typeValues[UNCLASSIFIED] = remainder
+
+        frames.append(pd.DataFrame({'exposureType': exposureType, 'name': typeValues.index, 'value': typeValues.to_numpy()}))
+
+    balance = pd.concat(frames, ignore_index=True)
+    balance['weight'] = balance['value'] / totalValue
+    return balance
+
+def limitHoldings(rows):
+    """
+    Keep the `TOP_HOLDINGS_COUNT` largest holdings, summing the rest, including the `UNCLASSIFIED` remainder, into an 'Other' row
+    """
+    named = rows[rows['name'] != UNCLASSIFIED]
+    if len(named) <= TOP_HOLDINGS_COUNT:
+        return rows
+
+    rest = rows.drop(named.index[:TOP_HOLDINGS_COUNT])
+    other = pd.DataFrame([{'exposureType': 'holding', 'name': 'Other', 'value': rest['value'].sum(), 'weight': rest['weight'].sum()}])
+    return pd.concat([named.iloc[:TOP_HOLDINGS_COUNT], other], ignore_index=True)
@@ -1,11 +1,16 @@
 import pandas as pd
 from tabulate import tabulate
 
-from db.crud import getDistinctTickers, getSetting
-from fetchers.yfinance_fetcher import getYfinanceTickerData
+from db.crud import getCurrentPortfolioData, getDistinctTickers, getSetting
+from fetchers.config import QUOTE_STATUS_UNAVAILABLE
+from fetchers.async_fetcher import runFetches
+from fetchers.fx import getBaseCurrency, getTickerFxRates, toBaseCurrency
+from fetchers.yfinance_fetcher import getFetchDeadline, getYfinancePriceData
 from utils.constants.defaults import getDefaultSetting
-from utils.data_processing import tickerValueExtractor
-from utils.table_utils import formatCurrency, formatPercentage
+from utils.data_processing import calculateTickerValues
+from utils.refresh_utils import makeQuoteRefreshNotifier
+from utils.settings_utils import getBooleanSetting
+from utils.table_utils import StreamingTable, formatAge, formatCurrency, formatPercentage, formatQuoteStatus, formatQuoteStatusNotes, formatVolume
 
 OUTPUT_COLUMNS_FULL = ['Ticker', 'Full Name', 'Price', 'Vol', 'Cost', 'Value', 'Dividends', 'Gain', 'Net Gain', '% Gain', '% NetGain']
 OUTPUT_COLUMNS_MIN = ['Ticker', 'Cost', 'Value', 'Dividends', 'Gain', 'Net Gain', '% Gain', '% NetGain']
@@ -17,88 +22,235 @@ COL_ALIGN_MIN = ['left'] + ['right'] * (len(OUTPUT_COLUMNS_MIN) - 1)
 # Indices of columns to keep for minimal output
 MINIMAL_INDICES = [0, 4, 5, 6, 7, 8, 9, 10]
 
+# Quote age column shown when stale quotes may be served
+AGE_COLUMN = 'Age'
+AGE_COL_WIDTH = 4
+
+# Current portfolio figures that are amounts of money, converted to the base currency
+PORTFOLIO_AMOUNT_FIELDS = ['cost', 'buy_brokerage', 'sell_brokerage', 'dividends', 'realized_profit']
+
 def portfolioValue(conn, fullOutput=False):
     tickers = getDistinctTickers(conn)
 
-    data = getYfinanceTickerData(conn, tickers)
+    showAge = getBooleanSetting(conn, 'stale_while_revalidate')
+    onRefresh = makeQuoteRefreshNotifier('value --full' if fullOutput else 'value') if showAge else None
+
+    columns = OUTPUT_COLUMNS_FULL if fullOutput else OUTPUT_COLUMNS_MIN
+    maxColWidths = MAX_COL_WIDTHS_FULL if fullOutput else MAX_COL_WIDTHS_MIN
+    colAlign = COL_ALIGN_FULL if fullOutput else COL_ALIGN_MIN
+    if showAge:
+        columns = columns + [AGE_COLUMN]
+        maxColWidths = maxColWidths + [AGE_COL_WIDTH]
+        colAlign = colAlign + ['right']
+
+    # Database figures don't depend on prices, so are all read before anything is fetched
+    portfolioData = getCurrentPortfolioData(conn, tickers)
+    heldTickers = [ticker for ticker in tickers if portfolioData[ticker]['volume'] > 0]
+    soldTickers = [ticker for ticker in tickers if ticker not in heldTickers]
+    deadline = getFetchDeadline(conn)
+
+    if getBooleanSetting(conn, 'progressive_render'):
+        streamPortfolioValue(conn, heldTickers, soldTickers, fullOutput, showAge, onRefresh, StreamingTable(columns, maxColWidths, colAlign), portfolioData, deadline)
+        return
+
+    # Trades are recorded in each ticker's trading currency, so every amount is converted to the base currency.
+    # Exchange rates are fetched alongside the prices, sold out positions need no price and only use cached currencies
+    fetches = [(getTickerFxRates, (heldTickers,), {'deadline': deadline, 'cachedTickers': soldTickers})]
+    if heldTickers:
+        fetches.append((getYfinancePriceData, (heldTickers,), {'includeNames': fullOutput, 'onRefresh': onRefresh, 'deadline': deadline}))
+    results = runFetches(conn, *fetches)
+    rates = results[0]
+    data = results[1] if heldTickers else {}
+
+    portfolioData = toBasePortfolioData(portfolioData, rates)
+    prices = toBaseCurrency(pd.Series({ticker: quote['price'] for ticker, quote in data.items()}, dtype=float), rates)
     outputDfRows = []
+    quoteStatuses = []
+    fetchedAts = []
+    totals = makePortfolioTotals()
 
-    totalCost = 0
-    totalValue = 0
-    totalDividend = 0
-    totalGain = 0
-    totalNetGain = 0
-    totalBrokerage = 0
-    totalRealisedGains = 0
-
-    soldPositionsTotalProfit = 0
-    soldPositionDividends = 0
-    soldPositionBrokerages = 0
-    soldRealisedGains = 0
-
-    for ticker in data.keys():
-        tickerData = tickerValueExtractor(conn, data[ticker])
-        tickerVolume = tickerData[3]
-
-        if tickerVolume > 0:
-            row = convertDataRowToTableRow(tickerData[:-1])
-            if not fullOutput:
-                row = [row[i] for i in MINIMAL_INDICES]
-            outputDfRows.append(row)
-
-            totalCost += tickerData[4]
-            totalValue += tickerData[5]
-            totalDividend += tickerData[10]
-            totalBrokerage += tickerData[11] + tickerData[12]
-            totalRealisedGains += tickerData[13]
-        else:
-            currentTickerRealisedGains = tickerData[13]
-            currentTickerDividends = tickerData[10]
-            currentTickerBrokerage = tickerData[11] + tickerData[12]
-
-            soldRealisedGains += currentTickerRealisedGains
-            soldPositionDividends += currentTickerDividends
-            soldPositionBrokerages += currentTickerBrokerage
-
-            tickerProfit = currentTickerRealisedGains + currentTickerDividends - currentTickerBrokerage
-            soldPositionsTotalProfit += tickerProfit
-
-            debug = getSetting(conn, 'debug_mode', getDefaultSetting('debug_mode')).lower() == 'true'
-            if debug:
-                print(f"\nFor ticker {ticker}:")
-                print(f"  Realised Gains: {formatCurrency(currentTickerRealisedGains)}")
-                print(f"  Dividends: {formatCurrency(currentTickerDividends)}")
-                print(f"  Total Brokerage: {formatCurrency(currentTickerBrokerage)}")
-                print(f"  Ticker Profit: {formatCurrency(tickerProfit)}")
-                print(f"Running total of Sold Positions Profit: {formatCurrency(soldPositionsTotalProfit)}")
-
-    totalCost -= soldPositionsTotalProfit
-    totalGain = totalValue - totalCost
-    totalNetGain = (totalValue + totalDividend + totalRealisedGains) - (totalCost + totalBrokerage)
+    for ticker in heldTickers:
+        quote = {**data[ticker], 'price': None if pd.isna(prices[ticker]) else float(prices[ticker])}
+        tickerData = calculateTickerValues(quote, portfolioData[ticker])
+        quoteStatuses.append(quote.get('quoteStatus'))
+        fetchedAts.append(quote.get('fetchedAt'))
+        outputDfRows.append(buildPositionRow(tickerData, quote, fullOutput, showAge))
+        addPositionToTotals(totals, tickerData, quote.get('quoteStatus'))
 
-    if totalCost <= 0:
-        percGain = "N/A"
-        netPercGain = "N/A"
-    else:
-        percGain = round((totalGain / totalCost) * 100, 2)
-        netPercGain = round((totalNetGain / totalCost) * 100, 2)
+    for ticker in soldTickers:
+        addSoldPositionToTotals(conn, totals, ticker, calculateTickerValues({'ticker': ticker, 'price': None}, portfolioData[ticker]))
 
     # Sort data rows by Value column before adding totals and sold rows
-    if fullOutput:
-        df = pd.DataFrame(outputDfRows, columns=OUTPUT_COLUMNS_FULL)
-        df = df.sort_values(by='Value', ascending=False, key=lambda x: x.str.replace('$', '').str.replace(',', '').astype(float))
-        outputDfRows = df.values.tolist()
-    else:
-        df = pd.DataFrame(outputDfRows, columns=OUTPUT_COLUMNS_MIN)
-        df = df.sort_values(by='Value', ascending=False, key=lambda x: x.str.replace('$', '').str.replace(',', '').astype(float))
-        outputDfRows = df.values.tolist()
+    df = pd.DataFrame(outputDfRows, columns=columns)
+    df = df.sort_values(by='Value', ascending=False, key=lambda x: pd.to_numeric(x.str.replace('$', '').str.replace(',', ''), errors='coerce'))
+    outputDfRows = df.values.tolist()
+
+    outputDfRows.append(buildSoldRow(totals, fullOutput, showAge))
+    outputDfRows.append(buildTotalRow(totals, fullOutput, showAge))
+
+    df = pd.DataFrame(outputDfRows, columns=columns)
+    table = tabulate(
+        df, 
+        headers='keys', 
+        tablefmt='rounded_grid', 
+        showindex=False, 
+        maxcolwidths=maxColWidths,
+        colalign=colAlign
+    )
+    print(table)
+
+    printPortfolioNotes(quoteStatuses, fetchedAts)
+    printCurrencyNotes(conn, rates)
+
+def toBasePortfolioData(portfolioData, rates):
+    """
+    Convert every amount in the current portfolio figures to the base currency in one pass.
+
+    Params:
+    - portfolioData: dictionary of ticker to its `getCurrentPortfolioData` row
+    - rates: pandas Series of ticker to exchange rate, from `getTickerFxRates`
+
+    Returns:
+    - dictionary of ticker to a copy of its row with the `PORTFOLIO_AMOUNT_FIELDS` converted
+    """
+    if not portfolioData:
+        return portfolioData
+
+    amounts = pd.DataFrame.from_dict(portfolioData, orient='index')[PORTFOLIO_AMOUNT_FIELDS].astype(float)
+    amounts = toBaseCurrency(amounts, rates).astype(object)
+    amounts = amounts.where(amounts.notna(), None)
+    return {ticker: {**portfolioData[ticker], **row.to_dict()} for ticker, row in amounts.iterrows()}
+
+def fetchFxRates(conn, heldTickers, soldTickers, deadline, onRates):
+    """
+    Fetch the exchange rates of held positions, and of sold out positions from cached currencies, and pass them to `onRates`.
+    Use through `runFetches`, with `onRates` as a caller callback.
+    """
+    rates = getTickerFxRates(conn, heldTickers, deadline, cachedTickers=soldTickers)
+    onRates(rates)
+    return rates
+
+def streamPortfolioValue(conn, heldTickers, soldTickers, fullOutput, showAge, onRefresh, table, portfolioData, deadline):
+    """
+    Print the portfolio value table progressively: the header straight away, sold out positions once exchange rates arrive,
+    each held position as soon as both its quote and the exchange rates have arrived, and the totals once every quote has resolved.
+    Exchange rates are fetched alongside the prices rather than before them.
+    Rows appear in the order quotes arrive rather than sorted by value, so this is opt-in with the `progressive_render` setting.
+    Rows are printed on this thread as results are handed back from the fetch threads.
+
+    Params:
+    - conn: connection to database
+    - heldTickers: list of tickers with units held
+    - soldTickers: list of sold out tickers
+    - fullOutput, showAge: see `portfolioValue`
+    - onRefresh: stale quote refresh callback, see `getYfinancePriceData`
+    - table: `StreamingTable` to print to
+    - portfolioData: each ticker's figures in its trading currency, from `getCurrentPortfolioData`
+    - deadline: `time.monotonic()` value to stop waiting for quotes at, see `getFetchDeadline`
+    """
+    quoteStatuses = []
+    fetchedAts = []
+    totals = makePortfolioTotals()
+    converted = {}
+    pendingQuotes = []
+
+    table.printHeader()
+
+    def printPosition(ticker, quote):
+        rate = converted['rates'].get(ticker)
+        if quote['price'] is not None and not pd.isna(rate):
+            quote = {**quote, 'price': quote['price'] * rate}
+        tickerData = calculateTickerValues(quote, converted['portfolioData'][ticker])
+        quoteStatuses.append(quote.get('quoteStatus'))
+        fetchedAts.append(quote.get('fetchedAt'))
+        table.printRow(buildPositionRow(tickerData, quote, fullOutput, showAge))
+        addPositionToTotals(totals, tickerData, quote.get('quoteStatus'))
 
+    def onRates(rates):
+        converted['rates'] = rates
+        converted['portfolioData'] = toBasePortfolioData(portfolioData, rates)
+        for ticker in soldTickers:
+            addSoldPositionToTotals(conn, totals, ticker, calculateTickerValues({'ticker': ticker, 'price': None}, converted['portfolioData'][ticker]))
+        table.printRow(buildSoldRow(totals, fullOutput, showAge))
+
+        for ticker, quote in pendingQuotes:
+            printPosition(ticker, quote)
+
+    def onQuote(ticker, quote):
+        if 'rates' in converted:
+            printPosition(ticker, quote)
+        else:
+            pendingQuotes.append((ticker, quote))
+
+    fetches = [(fetchFxRates, (heldTickers, soldTickers, deadline), {'onRates': onRates, 'callerCallbacks': ['onRates']})]
+    if heldTickers:
+        fetches.append((
+            getYfinancePriceData,
+            (heldTickers,),
+            {'includeNames': fullOutput, 'onRefresh': onRefresh, 'deadline': deadline, 'onQuote': onQuote, 'callerCallbacks': ['onQuote']}
+        ))
+    rates = runFetches(conn, *fetches)[0]
+
+    table.printRow(buildTotalRow(totals, fullOutput, showAge))
+    table.printFooter()
+
+    printPortfolioNotes(quoteStatuses, fetchedAts)
+    printCurrencyNotes(conn, rates)
+
+def makePortfolioTotals():
+    return {
+        'cost': 0,
+        'value': 0,
+        'dividend': 0,
+        'brokerage': 0,
+        'realisedGains': 0,
+        'soldPositionsProfit': 0
+    }
+
+def addPositionToTotals(totals, tickerData, quoteStatus):
+    # Positions without a price can't be valued, so are left out of the totals
+    if quoteStatus == QUOTE_STATUS_UNAVAILABLE or tickerData[5] is None:
+        return
+
+    totals['cost'] += tickerData[4]
+    totals['value'] += tickerData[5]
+    totals['dividend'] += tickerData[10]
+    totals['brokerage'] += tickerData[11] + tickerData[12]
+    totals['realisedGains'] += tickerData[13]
+
+def addSoldPositionToTotals(conn, totals, ticker, tickerData):
+    currentTickerRealisedGains = tickerData[13]
+    currentTickerDividends = tickerData[10]
+    currentTickerBrokerage = tickerData[11] + tickerData[12]
+
+    tickerProfit = currentTickerRealisedGains + currentTickerDividends - currentTickerBrokerage
+    totals['soldPositionsProfit'] += tickerProfit
+
+    debug = getSetting(conn, 'debug_mode', getDefaultSetting('debug_mode')).lower() == 'true'
+    if debug:
+        print(f"\nFor ticker {ticker}:")
+        print(f"  Realised Gains: {formatCurrency(currentTickerRealisedGains)}")
+        print(f"  Dividends: {formatCurrency(currentTickerDividends)}")
+        print(f"  Total Brokerage: {formatCurrency(currentTickerBrokerage)}")
+        print(f"  Ticker Profit: {formatCurrency(tickerProfit)}")
+        print(f"Running total of Sold Positions Profit: {formatCurrency(totals['soldPositionsProfit'])}")
+
+def buildPositionRow(tickerData, quote, fullOutput, showAge):
+    row = convertDataRowToTableRow(tickerData[:-1])
+    row[0] = formatQuoteStatus(row[0], quote.get('quoteStatus'))
+    if not fullOutput:
+        row = [row[i] for i in MINIMAL_INDICES]
+    if showAge:
+        row.append(formatAge(quote.get('fetchedAt')))
+    return row
+
+def buildSoldRow(totals, fullOutput, showAge):
     soldRow = [
         '*',
         'Sold Out Positions',
         '-',
         '-',
-        formatCurrency(soldPositionsTotalProfit * -1),
+        formatCurrency(totals['soldPositionsProfit'] * -1),
         '-',
         '-',
         '-',
@@ -108,7 +260,23 @@ def portfolioValue(conn, fullOutput=False):
     ]
     if not fullOutput:
         soldRow = [soldRow[i] for i in MINIMAL_INDICES]
-    outputDfRows.append(soldRow)
+    if showAge:
+        soldRow.append('')
+    return soldRow
+
+def buildTotalRow(totals, fullOutput, showAge):
+    totalCost = totals['cost'] - totals['soldPositionsProfit']
+    totalValue = totals['value']
+    totalDividend = totals['dividend']
+    totalGain = totalValue - totalCost
+    totalNetGain = (totalValue + totalDividend + totals['realisedGains']) - (totalCost + totals['brokerage'])
+
+    if totalCost <= 0:
+        percGain = "N/A"
+        netPercGain = "N/A"
+    else:
+        percGain = round((totalGain / totalCost) * 100, 2)
+        netPercGain = round((totalNetGain / totalCost) * 100, 2)
 
     totalRow = [
         'Total', 
@@ -125,36 +293,32 @@ def portfolioValue(conn, fullOutput=False):
     ]
     if not fullOutput:
         totalRow = [totalRow[i] for i in MINIMAL_INDICES]
-    outputDfRows.append(totalRow)
-
-    if fullOutput:
-        df = pd.DataFrame(outputDfRows, columns=OUTPUT_COLUMNS_FULL)
-        table = tabulate(
-            df, 
-            headers='keys', 
-            tablefmt='rounded_grid', 
-            showindex=False, 
-            maxcolwidths=MAX_COL_WIDTHS_FULL,
-            colalign=COL_ALIGN_FULL
-        )
-    else:
-        df = pd.DataFrame(outputDfRows, columns=OUTPUT_COLUMNS_MIN)
-        table = tabulate(
-            df, 
-            headers='keys', 
-            tablefmt='rounded_grid', 
-            showindex=False, 
-            maxcolwidths=MAX_COL_WIDTHS_MIN,
-            colalign=COL_ALIGN_MIN
-        )
-    print(table)
+    if showAge:
+        totalRow.append('')
+    return totalRow
+
+def printPortfolioNotes(quoteStatuses, fetchedAts):
+    notes = formatQuoteStatusNotes(quoteStatuses, fetchedAts)
+    if notes:
+        print(notes)
+    if QUOTE_STATUS_UNAVAILABLE in quoteStatuses:
+        print("Positions without a price are excluded from the totals.")
+
+def printCurrencyNotes(conn, rates):
+    baseCurrency = getBaseCurrency(conn)
+    if (rates.dropna() != 1.0).any():
+        print(f"Amounts converted to {baseCurrency} at current exchange rates.")
+        print("Cost, dividends and realised profit are converted at today's rates too, not the rates when they were paid, so gains leave out currency moves.")
+    unconverted = list(rates.index[rates.isna()])
+    if unconverted:
+        print(f"No exchange rate to {baseCurrency} for {', '.join(unconverted)}, shown in trading currency.")
 
 def convertDataRowToTableRow(dataRow):
     return [
         dataRow[0],                     # Ticker
         dataRow[1],                     # Full Name
         formatCurrency(dataRow[2]),     # Price
-        dataRow[3],                     # Volume
+        formatVolume(dataRow[3]),       # Volume
         formatCurrency(dataRow[4]),     # Cost
         formatCurrency(dataRow[5]),     # Value
         formatCurrency(dataRow[10]),    # Dividends
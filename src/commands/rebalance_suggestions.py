@@ -8,8 +8,10 @@ from db.crud import (
     getTargetBalance, 
     clearTargetBalance, 
     insertTargetBalance, 
-    getCurrentPortfolioTickerData
+    getCurrentPortfolioData
 )
+from fetchers.async_fetcher import runFetches
+from fetchers.fx import getTickerFxRates, toBaseCurrency
 from fetchers.yfinance_fetcher import getYfinanceTickerData
 from utils.db_utils import postgresArrayToList
 from utils.table_utils import formatPercentage, formatRatio, formatCurrency, formatTickerGroup
@@ -20,6 +22,8 @@ SUGGESTIONS_COLUMNS = ['Ticker Group', 'Current %', 'Target %', 'Value', 'Target
 COL_ALIGN_PORTFOLIO_BALANCE = ['left', 'right']
 COL_ALIGN_VALUATIONS = ['left', 'right', 'right', 'right', 'right', 'right', 'right', 'right']
 COL_ALIGN_SUGGESTIONS = ['left', 'right', 'right', 'right', 'right', 'right']
+VALUATION_FIELDS = ['price', 'peRatio', 'priceToBook', 'beta', 'fiftyTwoWkHigh', 'fiftyTwoWkLow', 'fiftyDayAvg', 'twoHundredDayAvg']
+REFERENCE_PRICE_FIELDS = ['fiftyTwoWkHigh', 'fiftyTwoWkLow', 'fiftyDayAvg', 'twoHundredDayAvg']
 
 def updatePortfolioBalanceTargets(conn, key_bindings):
     """
@@ -130,11 +134,18 @@ def rebalanceSuggestions(conn, key_bindings):
     totalValue = 0
     buckets = {}
     allTickers = []
-    allLiveTickerData = {}
 
     # Get live data for all tickers in single yfinance call
     allTickers.extend([ticker for bucket in targetBalance for ticker in postgresArrayToList(bucket[0])])
-    allLiveTickerData = getYfinanceTickerData(conn, allTickers)
+    # Exchange rates are looked up while the quotes are fetched
+    rates, quotes = runFetches(
+        conn,
+        (getTickerFxRates, (allTickers,), {}),
+        (getYfinanceTickerData, (allTickers,), {'fields': VALUATION_FIELDS, 'asFrame': True})
+    )
+    # Bucket values are compared across tickers, so are all in the base currency
+    basePrices = toBaseCurrency(quotes['price'], rates)
+    portfolioData = getCurrentPortfolioData(conn, allTickers)
 
     for bucket, perc in targetBalance:
         bucketInfo = {}
@@ -143,8 +154,8 @@ def rebalanceSuggestions(conn, key_bindings):
 
         bucketValue = 0
         for ticker in bucketInfo['tickers']:
-            volume = getCurrentPortfolioTickerData(conn, ticker)['volume']
-            bucketValue += round(allLiveTickerData[ticker]['price'] * volume, 2)
+            volume = portfolioData[ticker]['volume']
+            bucketValue += round(basePrices[ticker] * volume, 2)
 
         bucketInfo['value'] = bucketValue
         totalValue += bucketValue
@@ -164,24 +175,22 @@ def rebalanceSuggestions(conn, key_bindings):
     if not targetTotalValue:
         targetTotalValue = buckets[highestBucket]['value'] * (100 / buckets[highestBucket]['targetPerc'])
     
-    valuationsDfRows = []
+    # Percentage difference of price from each reference price, for all tickers at once
+    referencePrices = quotes[REFERENCE_PRICE_FIELDS]
+    priceDiffs = (referencePrices.rsub(quotes['price'], axis=0) / referencePrices * 100).round(2)
 
-    for ticker in allLiveTickerData:
-        price = allLiveTickerData[ticker]['price']
-        prcFromFiftyTwoWkHigh = round(((price - allLiveTickerData[ticker]['fiftyTwoWkHigh']) / allLiveTickerData[ticker]['fiftyTwoWkHigh']) * 100, 2)
-        prcFromFiftyTwoWkLow = round(((price - allLiveTickerData[ticker]['fiftyTwoWkLow']) / allLiveTickerData[ticker]['fiftyTwoWkLow']) * 100, 2)
-        prcFromFiftyDayAvg = round(((price - allLiveTickerData[ticker]['fiftyDayAvg']) / allLiveTickerData[ticker]['fiftyDayAvg']) * 100, 2)
-        prcFromTwoHundredDayAvg = round(((price - allLiveTickerData[ticker]['twoHundredDayAvg']) / allLiveTickerData[ticker]['twoHundredDayAvg']) * 100, 2)
+    valuationsDfRows = []
 
+    for ticker, quote in quotes.iterrows():
         valuationsDfRows.append([
             ticker,
-            formatRatio(allLiveTickerData[ticker]['peRatio']),
-            formatRatio(allLiveTickerData[ticker]['priceToBook']),
-            formatRatio(allLiveTickerData[ticker]['beta']),
-            formatPercentage(prcFromFiftyTwoWkHigh),
-            formatPercentage(prcFromFiftyTwoWkLow),
-            formatPercentage(prcFromFiftyDayAvg),
-            formatPercentage(prcFromTwoHundredDayAvg)
+            formatRatio(quote['peRatio']),
+            formatRatio(quote['priceToBook']),
+            formatRatio(quote['beta']),
+            formatPercentage(priceDiffs.at[ticker, 'fiftyTwoWkHigh']),
+            formatPercentage(priceDiffs.at[ticker, 'fiftyTwoWkLow']),
+            formatPercentage(priceDiffs.at[ticker, 'fiftyDayAvg']),
+            formatPercentage(priceDiffs.at[ticker, 'twoHundredDayAvg'])
         ])
 
     valuationsDf = pd.DataFrame(valuationsDfRows, columns=VALUATIONS_COLUMNS)
@@ -0,0 +1,26 @@
+from db.crud import getDistinctTickers
+from fetchers.async_fetcher import runFetch
+from fetchers.network import isOffline
+from fetchers.yfinance_fetcher import fetchTickerMetadata
+from utils.settings_utils import getListSetting
+
+def refreshMetadata(conn):
+    """
+    Re-fetch names, currencies and exchanges of portfolio tickers and indices of interest,
+    replacing the cached metadata regardless of its age.
+    """
+    if isOffline(conn):
+        print("Offline, metadata can't be refreshed.")
+        return
+
+    tickers = getDistinctTickers(conn)
+    tickers += [index for index in getListSetting(conn, 'indices_of_interest') if index not in tickers]
+    if not tickers:
+        print("No tickers to refresh.")
+        return
+
+    print(f"Refreshing metadata for {len(tickers)} tickers...")
+    metadata = runFetch(conn, fetchTickerMetadata, tickers)
+
+    refreshedCount = len([fields for fields in metadata.values() if any(fields.values())])
+    print(f"Refreshed metadata for {refreshedCount} of {len(tickers)} tickers.")
@@ -4,7 +4,7 @@ from prompt_toolkit import prompt
 from prompt_toolkit.completion import NestedCompleter
 
 from db.crud import getAllSettings, updateSetting, deleteSetting
-from utils.input_validation import SettingBooleanValidator, SettingJsonValidator
+from utils.input_validation import SettingBooleanValidator, SettingChoiceValidator, SettingIntegerValidator, SettingJsonValidator
 from utils.constants.defaults import SUPPORTED_SETTINGS, getDefaultSetting
 
 def getSettingsWithDefaults(conn):
@@ -67,14 +67,16 @@ def getSettingNameFromUser():
         
         print(f"Error: Unknown setting '{input_value}'")
 
-def getSettingValueFromUser(setting_type, current_value):
+def getSettingValueFromUser(setting_type, current_value, choices=None, minimum=1):
     """
     Prompts user for a new setting value with appropriate validator.
     Pass empty input to reset to default value.
     
     Params:
-    - setting_type: type of the setting (boolean, json, or other)
+    - setting_type: type of the setting (boolean, integer, choice, json, or other)
     - current_value: current value to display
+    - choices: allowed values for choice settings
+    - minimum: smallest allowed value for integer settings
     
     Returns:
     - str: new value, or None if cancelled, or '__DEFAULT__' to reset to default
@@ -87,6 +89,18 @@ def getSettingValueFromUser(setting_type, current_value):
                 validator=SettingBooleanValidator(),
                 completer=bool_completer
             ).strip().lower()
+        elif setting_type == 'integer':
+            new_value = prompt(
+                f"Enter value as whole number [current: {current_value}] (leave empty for default): ",
+                validator=SettingIntegerValidator(minimum)
+            ).strip()
+        elif setting_type == 'choice':
+            choice_completer = NestedCompleter.from_nested_dict({choice: None for choice in choices})
+            new_value = prompt(
+                f"Enter value ({'/'.join(choices)}) [current: {current_value}] (leave empty for default): ",
+                validator=SettingChoiceValidator(choices),
+                completer=choice_completer
+            ).strip().lower()
         elif setting_type == 'json':
             new_value = prompt(
                 f"Enter value as list [current: {current_value}] (leave empty for default): ",
@@ -147,7 +161,9 @@ def settingsCommand(conn, kb):
         current_value = settings.get(setting_name, SUPPORTED_SETTINGS[setting_name]['default'])
         setting_type = SUPPORTED_SETTINGS[setting_name]['type']
         
-        new_value = getSettingValueFromUser(setting_type, current_value)
+        new_value = getSettingValueFromUser(
+            setting_type, current_value, SUPPORTED_SETTINGS[setting_name].get('choices'), SUPPORTED_SETTINGS[setting_name].get('minimum', 1)
+        )
         if new_value is None:
             continue
         
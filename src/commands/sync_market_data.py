@@ -0,0 +1,33 @@
+from db.crud import getDistinctTickers, upsertCorporateActions
+from fetchers.async_fetcher import runFetch
+from fetchers.history_fetcher import fetchSplitHistory, syncPriceHistory
+from fetchers.network import isOffline
+from utils.settings_utils import getListSetting
+
+def syncMarketData(conn):
+    """
+    Download daily price history for portfolio tickers and indices of interest into the local database.
+    Only dates not already stored are downloaded.
+    Stock splits of portfolio tickers are synced first, so trades are restated in post-split units
+    and tickers with new splits have their full price history downloaded again on the post-split scale.
+    """
+    if isOffline(conn):
+        print("Offline, market data can't be synced.")
+        return
+
+    portfolioTickers = getDistinctTickers(conn)
+    tickers = portfolioTickers + [index for index in getListSetting(conn, 'indices_of_interest') if index not in portfolioTickers]
+    if not tickers:
+        print("No tickers to sync.")
+        return
+
+    splits = runFetch(conn, fetchSplitHistory, portfolioTickers)
+    adjustedTickers = upsertCorporateActions(conn, splits)
+    if adjustedTickers:
+        print(f"Adjusted trades for new stock splits in {', '.join(adjustedTickers)}, refetching their price history.")
+
+    print(f"Syncing daily prices for {len(tickers)} tickers...")
+    storedCounts = runFetch(conn, syncPriceHistory, tickers, refetchTickers=adjustedTickers)
+
+    syncedCount = len([count for count in storedCounts.values() if count > 0])
+    print(f"Stored {sum(storedCounts.values())} daily prices for {syncedCount} of {len(tickers)} tickers.")
@@ -21,3 +21,6 @@ BACKUP_PREFIX = "stock-gains-db_"
 BACKUP_DATETIME_STRF = "%Y%m%d%H%M%S"
 BACKUP_EXTENSION = '.backup'
 DEFAULT_BACKUPS_NUM = 3
+
+# Days after an ex-date a distribution's payment may be recorded, see `insertDividendEntitlements`
+DIVIDEND_PAYMENT_WINDOW_DAYS = 60
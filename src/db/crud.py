@@ -1,6 +1,11 @@
+import io
+import csv
+import math
 import psycopg2
+from psycopg2.extras import Json, execute_values
 
 import db.queries as q
+from db.config import DIVIDEND_PAYMENT_WINDOW_DAYS
 
 def getDistinctTickers(conn):
     """
@@ -9,6 +14,7 @@ def getDistinctTickers(conn):
     try:
         with conn:
             with conn.cursor() as cur:
+                refreshDirtyPortfolio(cur)
                 cur.execute(q.distinctTickersQuery())
                 result = cur.fetchall()
 
@@ -27,6 +33,7 @@ def getDistinctTickersWithPositions(conn):
     try:
         with conn:
             with conn.cursor() as cur:
+                refreshDirtyPortfolio(cur)
                 cur.execute(q.distinctTickersWithPositions())
                 result = cur.fetchall()
 
@@ -47,6 +54,7 @@ def checkIfTickerExists(cur, ticker):
     - ticker: ticker to check
     """
     try:
+        refreshDirtyPortfolio(cur)
         cur.execute(q.tickerExistsQuery(), (ticker,))
         result = cur.fetchone()
         return result[0] if result is not None else False
@@ -70,38 +78,86 @@ def getCurrentPortfolioTickerData(conn, ticker):
     try:
         with conn:
             with conn.cursor() as cur:
+                refreshDirtyPortfolio(cur)
                 cur.execute(q.currentPortfolioTickerQuery(), (ticker,))
                 result = cur.fetchone()
                 if not result:
-                    return {
-                        'ticker': ticker,
-                        'cost': 0.0,
-                        'volume': 0,
-                        'buy_brokerage': 0.0,
-                        'sell_brokerage': 0.0,
-                        'dividends': 0.0,
-                        'realized_profit': 0.0
-                    }
+                    return emptyPortfolioTickerData(ticker)
                 else:
-                    tickerData = {
-                        'ticker': result[0],
-                        'cost': float(result[1]) if result[1] is not None else None,
-                        'volume': int(result[2]),
-                        'buy_brokerage': float(result[3]),
-                        'sell_brokerage': float(result[4]),
-                        'dividends': float(result[5]),
-                        'realized_profit': float(result[6])
-                    }
-
-                return tickerData
+                    return toPortfolioTickerData(result)
 
     except psycopg2.Error as e:
         print(f"Database error: {e}")
         return []
 
+def getCurrentPortfolioData(conn, tickers=None):
+    """
+    Returns data from the current_portfolio table for many tickers in a single query,
+    in the same format as `getCurrentPortfolioTickerData`.
+
+    Params:
+    - conn: db connection
+    - tickers: list of tickers to lookup. Default: None (every ticker in the portfolio)
+    Returns:
+    - dictionary of ticker to tickerData dictionary. Requested tickers not in the portfolio have zeroed data.
+    """
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                refreshDirtyPortfolio(cur)
+                cur.execute(q.currentPortfolioQuery(), {'tickers': list(tickers) if tickers is not None else None})
+                portfolioData = {row[0]: toPortfolioTickerData(row) for row in cur.fetchall()}
+
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        portfolioData = {}
+
+    if tickers is None:
+        return portfolioData
+    return {ticker: portfolioData.get(ticker, emptyPortfolioTickerData(ticker)) for ticker in tickers}
+
+def refreshDirtyPortfolio(cur):
+    """
+    Recompute the `current_portfolio` rows of tickers marked dirty since the last read.
+    Writes to investment_history only mark their tickers, so a batch of trades is recomputed once, by the next reader.
+    Tickers another session is already recomputing are skipped, so readers never wait on each other.
+
+    Note: Function does not contain a try/with block, it runs in the reader's transaction before it queries `current_portfolio`.
+
+    Params:
+    - cur: db connection cursor
+    """
+    cur.execute(q.refreshDirtyPortfolio())
+
+def toPortfolioTickerData(row):
+    """
+    Convert a current_portfolio row from `currentPortfolioTickerQuery` or `currentPortfolioQuery` into a tickerData dictionary
+    """
+    return {
+        'ticker': row[0],
+        'cost': float(row[1]) if row[1] is not None else None,
+        'volume': float(row[2]),
+        'buy_brokerage': float(row[3]),
+        'sell_brokerage': float(row[4]),
+        'dividends': float(row[5]),
+        'realized_profit': float(row[6])
+    }
+
+def emptyPortfolioTickerData(ticker):
+    return {
+        'ticker': ticker,
+        'cost': 0.0,
+        'volume': 0.0,
+        'buy_brokerage': 0.0,
+        'sell_brokerage': 0.0,
+        'dividends': 0.0,
+        'realized_profit': 0.0
+    }
+
 def insertNewInvestmentHistory(cur, ticker, price, volume, brokerage, date, status):
     """
-    Insert new investment history into investment_history table
+    Insert new investment history into investment_history table.
+    A trigger on the table marks the ticker dirty, its `current_portfolio` row is recomputed on the next read.
 
     Note: Function does not contain a try/with block as it's meant to be use in an atomic function with a separate db call.
 
@@ -115,7 +171,6 @@ def insertNewInvestmentHistory(cur, ticker, price, volume, brokerage, date, stat
     - status: BUY or SELL status
     """
     cur.execute(q.investmentHistoryInsert(), (ticker, price, volume, brokerage, date, status,))
-    cur.execute(q.refreshCurrentPortfolio())
 
 def recordDividend(cur, ticker, value, date):
     """
@@ -128,7 +183,6 @@ def recordDividend(cur, ticker, value, date):
     - date (str): The date of the dividend payment.
     """
     cur.execute(q.dividendsInsert(), (ticker, date, value,))
-    cur.execute(q.refreshCurrentPortfolio())
 
 def getInvestmentHistory(conn):
     """
@@ -328,3 +382,290 @@ def deleteSetting(conn, attribute):
     except psycopg2.Error as e:
         print(f"Database error: {e}")
         return False, f"Error deleting setting: {e}"
+
+def toJsonSafe(value):
+    """
+    Replace NaN and infinite floats, which JSONB can't store, with None. Recurses into dictionaries and lists.
+    """
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    elif isinstance(value, dict):
+        return {key: toJsonSafe(item) for key, item in value.items()}
+    elif isinstance(value, list):
+        return [toJsonSafe(item) for item in value]
+    return value
+
+def getQuotesCache(conn, tickers):
+    """
+    Returns quotes stored in the `quotes_cache` table for the given tickers.
+
+    Params:
+    - conn: db connection
+    - tickers: list of tickers to lookup
+
+    Returns:
+    - dict: ticker -> (quote, fetchedAt) for tickers with a stored quote, fetchedAt in epoch seconds
+    """
+    if not tickers:
+        return {}
+
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(q.quotesCacheQuery(), (list(tickers),))
+                result = cur.fetchall()
+                return {row[0]: (row[1], float(row[2])) for row in result}
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return {}
+
+def upsertQuotesCache(conn, quotes, fetchedAt):
+    """
+    Inserts or replaces quotes in the `quotes_cache` table in a single statement.
+    Stored quotes fetched more recently than `fetchedAt` are kept.
+
+    Params:
+    - conn: db connection
+    - quotes: dictionary of ticker to quote dictionary
+    - fetchedAt: epoch seconds the quotes were fetched at
+    """
+    if not quotes:
+        return
+
+    rows = []
+    for ticker, quote in quotes.items():
+        quote = toJsonSafe(quote)
+        rows.append((ticker, quote.get('price'), quote.get('marketState'), Json(quote), fetchedAt))
+
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                execute_values(cur, q.quotesCacheUpsert(), rows, template=q.quotesCacheUpsertTemplate())
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+
+def getPriceHistoryRanges(conn, tickers):
+    """
+    Returns the first and last dates stored in the `price_history` table for the given tickers.
+
+    Params:
+    - conn: db connection
+    - tickers: list of tickers to lookup
+
+    Returns:
+    - dict: ticker -> (firstDate, lastDate) for tickers with stored prices
+    """
+    if not tickers:
+        return {}
+
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(q.priceHistoryRangesQuery(), (list(tickers),))
+                return {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return {}
+
+def getFirstInvestmentDates(conn, tickers):
+    """
+    Returns the date of the first transaction for each of the given tickers.
+
+    Params:
+    - conn: db connection
+    - tickers: list of tickers to lookup
+
+    Returns:
+    - dict: ticker -> date for tickers with investment history
+    """
+    if not tickers:
+        return {}
+
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(q.firstInvestmentDatesQuery(), (list(tickers),))
+                return {row[0]: row[1] for row in cur.fetchall()}
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return {}
+
+def getPriceHistory(conn, ticker, startDate=None, endDate=None):
+    """
+    Returns daily prices stored for a ticker, oldest first.
+
+    Params:
+    - conn: db connection
+    - ticker: ticker to lookup
+    - startDate: first date to include. Default: None (from the first stored date)
+    - endDate: last date to include. Default: None (up to the last stored date)
+
+    Returns:
+    - list of (date, open, high, low, close, adj_close) tuples
+    """
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(q.priceHistoryQuery(), (ticker, startDate, endDate))
+                return cur.fetchall()
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return []
+
+def upsertPriceHistory(conn, rows, replaceTickers=()):
+    """
+    Inserts or replaces daily prices in the `price_history` table.
+    Rows are streamed into a staging table with COPY and merged in one statement,
+    so large downloads don't need a round trip per row.
+
+    Params:
+    - conn: db connection
+    - rows: iterable of (ticker, date, open, high, low, close, adj_close) tuples, missing prices as None
+    - replaceTickers: tickers whose stored prices are all deleted first, in the same transaction,
+      eg. after a split restates their whole history. Default: ()
+
+    Returns:
+    - number of rows written, 0 on error
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    rowCount = 0
+    for row in rows:
+        writer.writerow(['' if value is None else value for value in row])
+        rowCount += 1
+
+    if rowCount == 0:
+        return 0
+    buffer.seek(0)
+
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                if replaceTickers:
+                    cur.execute(q.priceHistoryDeleteTickers(), (list(replaceTickers),))
+                cur.execute(q.createPriceHistoryStaging())
+                cur.copy_expert(q.copyPriceHistoryStaging(), buffer)
+                cur.execute(q.priceHistoryUpsertFromStaging())
+        return rowCount
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return 0
+
+def insertDividendEntitlements(conn, distributions):
+    """
+    Records dividends from per unit distributions, paid on the units held going into each ex-date,
+    in a single statement.
+    Distributions while no units were held are skipped, as are distributions with a dividend already recorded
+    from their ex-date up to `DIVIDEND_PAYMENT_WINDOW_DAYS` later or the ticker's next ex-date, whichever is sooner.
+    Manually recorded dividends are dated by payment date, so this keeps a sync from recording them again.
+
+    Params:
+    - conn: db connection
+    - distributions: list of (ticker, exDate, amountPerUnit) tuples
+
+    Returns:
+    - list of (ticker, date, value) tuples recorded, empty on error
+    """
+    if not distributions:
+        return []
+
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                # One page, so each distribution's payment window can see the ticker's next ex-date
+                recorded = execute_values(
+                    cur,
+                    q.dividendEntitlementsInsert(),
+                    [(*distribution, DIVIDEND_PAYMENT_WINDOW_DAYS) for distribution in distributions],
+                    template=q.dividendEntitlementsTemplate(),
+                    page_size=len(distributions),
+                    fetch=True
+                )
+                return recorded
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return []
+
+def upsertCorporateActions(conn, splits):
+    """
+    Records stock splits in the `corporate_actions` table. Adjustment factors are recomputed only for tickers
+    with new or changed splits, and their `current_portfolio` rows are marked to be recomputed on the next read.
+
+    Params:
+    - conn: db connection
+    - splits: list of (ticker, exDate, ratio) tuples
+
+    Returns:
+    - sorted list of tickers with new or changed splits, empty on error
+    """
+    if not splits:
+        return []
+
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                changed = execute_values(
+                    cur,
+                    q.corporateActionsUpsert(),
+                    splits,
+                    template=q.corporateActionsTemplate(),
+                    fetch=True
+                )
+                tickers = sorted({row[0] for row in changed})
+                if tickers:
+                    cur.execute(q.recomputeAdjustmentFactors(), (tickers,))
+                    cur.execute(q.markPortfolioTickersDirty(), (tickers,))
+                return tickers
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return []
+
+def getFundExposures(conn, tickers):
+    """
+    Returns the look-through exposures stored in the `fund_exposures` table for the given tickers.
+
+    Params:
+    - conn: db connection
+    - tickers: list of tickers to lookup
+
+    Returns:
+    - list of (ticker, exposureType, name, weight, fetchedAt) tuples, fetchedAt in epoch seconds
+    """
+    if not tickers:
+        return []
+
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(q.fundExposuresQuery(), (list(tickers),))
+                return [(row[0], row[1], row[2], row[3], float(row[4])) for row in cur.fetchall()]
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return []
+
+def replaceFundExposures(conn, exposures, fetchedAt):
+    """
+    Replaces every stored exposure of the given tickers in a single transaction,
+    so exposures no longer reported by the provider don't linger.
+
+    Params:
+    - conn: db connection
+    - exposures: dictionary of ticker to list of (exposureType, name, weight) tuples
+    - fetchedAt: epoch seconds the exposures were fetched at
+    """
+    if not exposures:
+        return
+
+    rows = [
+        (ticker, exposureType, name, weight, fetchedAt)
+        for ticker, tickerExposures in exposures.items()
+        for exposureType, name, weight in tickerExposures
+    ]
+
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(q.deleteFundExposures(), (list(exposures.keys()),))
+                execute_values(cur, q.fundExposuresInsert(), rows, template=q.fundExposuresTemplate())
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
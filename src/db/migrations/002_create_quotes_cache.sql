@@ -0,0 +1,11 @@
+-- Migration: Create quotes_cache table
+-- Purpose: Share fetched quotes between sessions and machines using the same database
+-- Created: 2026-10-18
+
+CREATE TABLE IF NOT EXISTS quotes_cache (
+    ticker VARCHAR(255) PRIMARY KEY,
+    price DOUBLE PRECISION,
+    market_state VARCHAR(32),
+    quote JSONB NOT NULL,
+    fetched_at TIMESTAMPTZ NOT NULL
+);
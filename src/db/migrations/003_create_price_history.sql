@@ -0,0 +1,14 @@
+-- Migration: Create price_history table
+-- Purpose: Store daily prices locally so history is only downloaded once per ticker and date
+-- Created: 2026-10-18
+
+CREATE TABLE IF NOT EXISTS price_history (
+    ticker VARCHAR(255) NOT NULL,
+    date DATE NOT NULL,
+    open DOUBLE PRECISION,
+    high DOUBLE PRECISION,
+    low DOUBLE PRECISION,
+    close DOUBLE PRECISION,
+    adj_close DOUBLE PRECISION,
+    PRIMARY KEY (ticker, date)
+);
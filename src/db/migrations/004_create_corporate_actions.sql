@@ -0,0 +1,145 @@
+-- Migration: Create corporate_actions table
+-- Purpose: Adjust trades for stock splits, so FIFO/highest-cost matching and values use post-split units
+-- Created: 2026-10-18
+
+-- One row per split ex-date. `ratio` is units received per unit held, eg. 2 for a 2:1 split.
+-- Trades dated from `applies_from` up to, not including, `date` are restated by `cumulative_factor`,
+-- the product of this and every later split ratio for the ticker.
+CREATE TABLE IF NOT EXISTS corporate_actions (
+    ticker VARCHAR(255) NOT NULL,
+    date DATE NOT NULL,
+    ratio DOUBLE PRECISION NOT NULL CHECK (ratio > 0),
+    applies_from DATE NOT NULL DEFAULT '-infinity',
+    cumulative_factor DOUBLE PRECISION NOT NULL DEFAULT 1,
+    PRIMARY KEY (ticker, date)
+);
+
+-- Recreate the materialized view on split adjusted trades
+DROP MATERIALIZED VIEW IF EXISTS current_portfolio;
+
+CREATE MATERIALIZED VIEW current_portfolio AS
+-- Trades restated in post-split units: volume scaled up and price scaled down by every split after the trade
+WITH adjusted_history AS (
+    SELECT
+        i.ticker,
+        i.price / COALESCE(c.cumulative_factor, 1) AS price,
+        i.volume * COALESCE(c.cumulative_factor, 1) AS volume,
+        i.brokerage,
+        i.date,
+        i.status,
+        i.id
+    FROM investment_history i
+    LEFT JOIN corporate_actions c
+        ON c.ticker = i.ticker
+       AND i.date >= c.applies_from
+       AND i.date < c.date
+),
+buys AS (
+    SELECT *
+    FROM adjusted_history
+    WHERE status = 'BUY'
+),
+sells AS (
+    SELECT
+        ticker,
+        SUM(volume) AS total_sold
+    FROM adjusted_history
+    WHERE status = 'SELL'
+    GROUP BY ticker
+),
+ordered_buys AS (
+    SELECT *,
+           volume AS original_volume,
+           SUM(volume) OVER (
+               PARTITION BY ticker
+               ORDER BY price DESC, date ASC, id ASC
+           ) AS cumulative_volume
+    FROM buys
+),
+remaining AS (
+    SELECT 
+        b.ticker,
+        b.price,
+        GREATEST(0, b.volume - GREATEST(0, COALESCE(s.total_sold, 0) - (b.cumulative_volume - b.volume))) AS remaining_volume,
+        b.volume AS original_volume
+    FROM ordered_buys b
+    LEFT JOIN sells s ON b.ticker = s.ticker
+    WHERE COALESCE(s.total_sold, 0) < b.cumulative_volume
+),
+matched_sales AS (
+    SELECT
+        b.ticker,
+        b.price AS buy_price,
+        LEAST(
+            b.original_volume,
+            GREATEST(0, COALESCE(s.total_sold, 0) - (b.cumulative_volume - b.original_volume))
+        ) AS sold_volume
+    FROM ordered_buys b
+    LEFT JOIN sells s ON b.ticker = s.ticker
+    WHERE COALESCE(s.total_sold, 0) > (b.cumulative_volume - b.original_volume)
+),
+avg_sell_prices AS (
+    SELECT
+        ticker,
+        SUM(volume * price)::numeric / SUM(volume) AS avg_sell_price
+    FROM adjusted_history
+    WHERE status = 'SELL'
+    GROUP BY ticker
+),
+realized_profits AS (
+    SELECT
+        m.ticker,
+        ROUND(SUM(m.sold_volume * (s.avg_sell_price - m.buy_price))::numeric, 2) AS realized_profit
+    FROM matched_sales m
+    JOIN avg_sell_prices s ON m.ticker = s.ticker
+    GROUP BY m.ticker
+),
+aggregated AS (
+    SELECT
+        r.ticker,
+        SUM(r.remaining_volume) AS total_volume,
+        ROUND((SUM(r.remaining_volume * r.price)::numeric / NULLIF(SUM(r.remaining_volume), 0)::numeric)::numeric, 2) AS average_price
+    FROM remaining r
+    GROUP BY r.ticker
+),
+buy_brokerage_totals AS (
+    SELECT
+        ticker,
+        ROUND(SUM(brokerage)::numeric, 2) AS buy_brokerage
+    FROM adjusted_history
+    WHERE status = 'BUY'
+    GROUP BY ticker
+),
+sell_brokerage_totals AS (
+    SELECT
+        ticker,
+        ROUND(SUM(brokerage)::numeric, 2) AS sell_brokerage
+    FROM adjusted_history
+    WHERE status = 'SELL'
+    GROUP BY ticker
+)
+SELECT
+    a.ticker,
+    a.total_volume,
+    a.average_price,
+    COALESCE(p.realized_profit, 0) AS realized_profit,
+    COALESCE(bb.buy_brokerage, 0) AS buy_brokerage,
+    COALESCE(sb.sell_brokerage, 0) AS sell_brokerage
+FROM aggregated a
+LEFT JOIN realized_profits p ON a.ticker = p.ticker
+LEFT JOIN buy_brokerage_totals bb ON a.ticker = bb.ticker
+LEFT JOIN sell_brokerage_totals sb ON a.ticker = sb.ticker
+UNION
+SELECT
+    p.ticker,
+    0 AS total_volume,
+    NULL::numeric AS average_price,
+    p.realized_profit,
+    COALESCE(bb.buy_brokerage, 0) AS buy_brokerage,
+    COALESCE(sb.sell_brokerage, 0) AS sell_brokerage
+FROM realized_profits p
+LEFT JOIN buy_brokerage_totals bb ON p.ticker = bb.ticker
+LEFT JOIN sell_brokerage_totals sb ON p.ticker = sb.ticker
+WHERE NOT EXISTS (
+    SELECT 1 FROM aggregated a WHERE a.ticker = p.ticker
+);
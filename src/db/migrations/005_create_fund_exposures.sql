@@ -0,0 +1,13 @@
+-- Migration: Create fund_exposures table
+-- Purpose: Cache fund holdings and sector weights for look-through portfolio balance
+-- Created: 2026-10-18
+
+-- Weights are fractions of the ticker's value. Every row of a ticker is replaced together, so share a fetched_at.
+CREATE TABLE IF NOT EXISTS fund_exposures (
+    ticker VARCHAR(255) NOT NULL,
+    exposure_type VARCHAR(16) NOT NULL CHECK (exposure_type IN ('sector', 'region', 'holding')),
+    name TEXT NOT NULL,
+    weight DOUBLE PRECISION NOT NULL,
+    fetched_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (ticker, exposure_type, name)
+);
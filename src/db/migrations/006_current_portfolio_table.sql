@@ -0,0 +1,187 @@
+-- Migration: Replace the current_portfolio materialized view with a table maintained per ticker
+-- Purpose: Writes recompute only the tickers they touch, instead of refreshing every position on every insert
+-- Created: 2026-10-18
+
+DROP MATERIALIZED VIEW IF EXISTS current_portfolio;
+
+CREATE TABLE IF NOT EXISTS current_portfolio (
+    ticker VARCHAR(255) PRIMARY KEY,
+    total_volume DOUBLE PRECISION NOT NULL,
+    average_price NUMERIC,
+    realized_profit NUMERIC NOT NULL,
+    buy_brokerage NUMERIC NOT NULL,
+    sell_brokerage NUMERIC NOT NULL
+);
+
+-- Positions are recomputed from a ticker's own trades, so the cost grows with that ticker's history only
+CREATE INDEX IF NOT EXISTS idx_investment_history_ticker ON investment_history (ticker, date);
+
+-- Recompute the current_portfolio rows of the given tickers, with the same matching as the view it replaces
+CREATE OR REPLACE FUNCTION refresh_portfolio_tickers(p_tickers TEXT[]) RETURNS VOID AS $$
+BEGIN
+    DELETE FROM current_portfolio WHERE ticker = ANY(p_tickers);
+
+    INSERT INTO current_portfolio (ticker, total_volume, average_price, realized_profit, buy_brokerage, sell_brokerage)
+    -- Trades restated in post-split units: volume scaled up and price scaled down by every split after the trade
+    WITH adjusted_history AS (
+        SELECT
+            i.ticker,
+            i.price / COALESCE(c.cumulative_factor, 1) AS price,
+            i.volume * COALESCE(c.cumulative_factor, 1) AS volume,
+            i.brokerage,
+            i.date,
+            i.status,
+            i.id
+        FROM investment_history i
+        LEFT JOIN corporate_actions c
+            ON c.ticker = i.ticker
+           AND i.date >= c.applies_from
+           AND i.date < c.date
+        WHERE i.ticker = ANY(p_tickers)
+    ),
+    buys AS (
+        SELECT *
+        FROM adjusted_history
+        WHERE status = 'BUY'
+    ),
+    sells AS (
+        SELECT
+            ticker,
+            SUM(volume) AS total_sold
+        FROM adjusted_history
+        WHERE status = 'SELL'
+        GROUP BY ticker
+    ),
+    ordered_buys AS (
+        SELECT *,
+               volume AS original_volume,
+               SUM(volume) OVER (
+                   PARTITION BY ticker
+                   ORDER BY price DESC, date ASC, id ASC
+               ) AS cumulative_volume
+        FROM buys
+    ),
+    remaining AS (
+        SELECT 
+            b.ticker,
+            b.price,
+            GREATEST(0, b.volume - GREATEST(0, COALESCE(s.total_sold, 0) - (b.cumulative_volume - b.volume))) AS remaining_volume,
+            b.volume AS original_volume
+        FROM ordered_buys b
+        LEFT JOIN sells s ON b.ticker = s.ticker
+        WHERE COALESCE(s.total_sold, 0) < b.cumulative_volume
+    ),
+    matched_sales AS (
+        SELECT
+            b.ticker,
+            b.price AS buy_price,
+            LEAST(
+                b.original_volume,
+                GREATEST(0, COALESCE(s.total_sold, 0) - (b.cumulative_volume - b.original_volume))
+            ) AS sold_volume
+        FROM ordered_buys b
+        LEFT JOIN sells s ON b.ticker = s.ticker
+        WHERE COALESCE(s.total_sold, 0) > (b.cumulative_volume - b.original_volume)
+    ),
+    avg_sell_prices AS (
+        SELECT
+            ticker,
+            SUM(volume * price)::numeric / SUM(volume) AS avg_sell_price
+        FROM adjusted_history
+        WHERE status = 'SELL'
+        GROUP BY ticker
+    ),
+    realized_profits AS (
+        SELECT
+            m.ticker,
+            ROUND(SUM(m.sold_volume * (s.avg_sell_price - m.buy_price))::numeric, 2) AS realized_profit
+        FROM matched_sales m
+        JOIN avg_sell_prices s ON m.ticker = s.ticker
+        GROUP BY m.ticker
+    ),
+    aggregated AS (
+        SELECT
+            r.ticker,
+            SUM(r.remaining_volume) AS total_volume,
+            ROUND((SUM(r.remaining_volume * r.price)::numeric / NULLIF(SUM(r.remaining_volume), 0)::numeric)::numeric, 2) AS average_price
+        FROM remaining r
+        GROUP BY r.ticker
+    ),
+    buy_brokerage_totals AS (
+        SELECT
+            ticker,
+            ROUND(SUM(brokerage)::numeric, 2) AS buy_brokerage
+        FROM adjusted_history
+        WHERE status = 'BUY'
+        GROUP BY ticker
+    ),
+    sell_brokerage_totals AS (
+        SELECT
+            ticker,
+            ROUND(SUM(brokerage)::numeric, 2) AS sell_brokerage
+        FROM adjusted_history
+        WHERE status = 'SELL'
+        GROUP BY ticker
+    )
+    SELECT
+        a.ticker,
+        a.total_volume,
+        a.average_price,
+        COALESCE(p.realized_profit, 0) AS realized_profit,
+        COALESCE(bb.buy_brokerage, 0) AS buy_brokerage,
+        COALESCE(sb.sell_brokerage, 0) AS sell_brokerage
+    FROM aggregated a
+    LEFT JOIN realized_profits p ON a.ticker = p.ticker
+    LEFT JOIN buy_brokerage_totals bb ON a.ticker = bb.ticker
+    LEFT JOIN sell_brokerage_totals sb ON a.ticker = sb.ticker
+    UNION
+    SELECT
+        p.ticker,
+        0 AS total_volume,
+        NULL::numeric AS average_price,
+        p.realized_profit,
+        COALESCE(bb.buy_brokerage, 0) AS buy_brokerage,
+        COALESCE(sb.sell_brokerage, 0) AS sell_brokerage
+    FROM realized_profits p
+    LEFT JOIN buy_brokerage_totals bb ON p.ticker = bb.ticker
+    LEFT JOIN sell_brokerage_totals sb ON p.ticker = sb.ticker
+    WHERE NOT EXISTS (
+        SELECT 1 FROM aggregated a WHERE a.ticker = p.ticker
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement level, so a bulk insert recomputes each ticker it touches once rather than once per row
+CREATE OR REPLACE FUNCTION refresh_portfolio_for_trades() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM refresh_portfolio_tickers(ARRAY(SELECT DISTINCT ticker FROM new_trades)::text[]);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM refresh_portfolio_tickers(ARRAY(SELECT DISTINCT ticker FROM old_trades)::text[]);
+    ELSE
+        PERFORM refresh_portfolio_tickers(ARRAY(SELECT ticker FROM old_trades UNION SELECT ticker FROM new_trades)::text[]);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS investment_history_insert_refresh ON investment_history;
+CREATE TRIGGER investment_history_insert_refresh
+AFTER INSERT ON investment_history
+REFERENCING NEW TABLE AS new_trades
+FOR EACH STATEMENT EXECUTE FUNCTION refresh_portfolio_for_trades();
+
+DROP TRIGGER IF EXISTS investment_history_update_refresh ON investment_history;
+CREATE TRIGGER investment_history_update_refresh
+AFTER UPDATE ON investment_history
+REFERENCING OLD TABLE AS old_trades NEW TABLE AS new_trades
+FOR EACH STATEMENT EXECUTE FUNCTION refresh_portfolio_for_trades();
+
+DROP TRIGGER IF EXISTS investment_history_delete_refresh ON investment_history;
+CREATE TRIGGER investment_history_delete_refresh
+AFTER DELETE ON investment_history
+REFERENCING OLD TABLE AS old_trades
+FOR EACH STATEMENT EXECUTE FUNCTION refresh_portfolio_for_trades();
+
+-- Build every position once
+SELECT refresh_portfolio_tickers(ARRAY(SELECT DISTINCT ticker FROM investment_history)::text[]);
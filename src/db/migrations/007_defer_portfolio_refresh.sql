@@ -0,0 +1,70 @@
+-- Migration: Defer current_portfolio recomputes until the portfolio is next read
+-- Purpose: A batch of trades marks its tickers dirty once, and each ticker is recomputed once on the next read
+-- Created: 2026-10-18
+
+CREATE TABLE IF NOT EXISTS portfolio_dirty_tickers (
+    ticker VARCHAR(255) PRIMARY KEY
+);
+
+-- Recompute every dirty ticker. Tickers another session is already recomputing are skipped rather than waited on,
+-- so concurrent readers are never blocked and see the last committed rows instead.
+CREATE OR REPLACE FUNCTION refresh_dirty_portfolio() RETURNS VOID AS $$
+DECLARE
+    dirty TEXT[];
+BEGIN
+    WITH flushed AS (
+        DELETE FROM portfolio_dirty_tickers
+        WHERE ticker IN (
+            SELECT ticker
+            FROM portfolio_dirty_tickers
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING ticker
+    )
+    SELECT array_agg(ticker) INTO dirty FROM flushed;
+
+    IF dirty IS NOT NULL THEN
+        PERFORM refresh_portfolio_tickers(dirty);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Writes only mark the tickers they touch, the recompute itself waits for `refresh_dirty_portfolio`
+CREATE OR REPLACE FUNCTION mark_portfolio_dirty_for_trades() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO portfolio_dirty_tickers (ticker)
+        SELECT DISTINCT ticker FROM new_trades
+        ON CONFLICT (ticker) DO NOTHING;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO portfolio_dirty_tickers (ticker)
+        SELECT DISTINCT ticker FROM old_trades
+        ON CONFLICT (ticker) DO NOTHING;
+    ELSE
+        INSERT INTO portfolio_dirty_tickers (ticker)
+        SELECT ticker FROM old_trades UNION SELECT ticker FROM new_trades
+        ON CONFLICT (ticker) DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS investment_history_insert_refresh ON investment_history;
+CREATE TRIGGER investment_history_insert_refresh
+AFTER INSERT ON investment_history
+REFERENCING NEW TABLE AS new_trades
+FOR EACH STATEMENT EXECUTE FUNCTION mark_portfolio_dirty_for_trades();
+
+DROP TRIGGER IF EXISTS investment_history_update_refresh ON investment_history;
+CREATE TRIGGER investment_history_update_refresh
+AFTER UPDATE ON investment_history
+REFERENCING OLD TABLE AS old_trades NEW TABLE AS new_trades
+FOR EACH STATEMENT EXECUTE FUNCTION mark_portfolio_dirty_for_trades();
+
+DROP TRIGGER IF EXISTS investment_history_delete_refresh ON investment_history;
+CREATE TRIGGER investment_history_delete_refresh
+AFTER DELETE ON investment_history
+REFERENCING OLD TABLE AS old_trades
+FOR EACH STATEMENT EXECUTE FUNCTION mark_portfolio_dirty_for_trades();
+
+DROP FUNCTION IF EXISTS refresh_portfolio_for_trades();
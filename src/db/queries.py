@@ -1,6 +1,6 @@
-##################################
-# current_portfolio view queries #
-##################################
+###################################
+# current_portfolio table queries #
+###################################
 def distinctTickersQuery():
     return """
         SELECT DISTINCT 
@@ -51,9 +51,37 @@ def currentPortfolioTickerQuery():
             c.realized_profit;
     """
 
-def refreshCurrentPortfolio():
+def currentPortfolioQuery():
+    # Dividends are totalled per ticker before the join, so each position is a single row without regrouping
     return """
-        REFRESH MATERIALIZED VIEW current_portfolio;
+        SELECT 
+            c.ticker, 
+            ROUND((c.total_volume * c.average_price)::numeric, 2) AS calculated_cost, 
+            c.total_volume, 
+            c.buy_brokerage, 
+            c.sell_brokerage,
+            COALESCE(d.total_dividends, 0) AS total_dividends,
+            c.realized_profit
+        FROM current_portfolio c 
+        LEFT JOIN (
+            SELECT ticker, SUM(distribution_value) AS total_dividends
+            FROM dividends
+            GROUP BY ticker
+        ) d ON c.ticker = d.ticker
+        WHERE %(tickers)s::text[] IS NULL OR c.ticker = ANY(%(tickers)s);
+    """
+
+def markPortfolioTickersDirty():
+    # Trades mark their tickers through triggers on investment_history, this is for changes to what they are adjusted by
+    return """
+        INSERT INTO portfolio_dirty_tickers (ticker)
+        SELECT UNNEST(%s::text[])
+        ON CONFLICT (ticker) DO NOTHING;
+    """
+
+def refreshDirtyPortfolio():
+    return """
+        SELECT refresh_dirty_portfolio();
     """
 
 
@@ -87,6 +115,56 @@ def dividendsInsert():
         VALUES (%s, %s, %s);
     """
 
+def dividendEntitlementsInsert():
+    # Units held going into each ex-date are buys less sells dated before it,
+    # in post-split units as distributions are split adjusted.
+    # Manual dividends are dated by payment date, so one recorded between the ex-date and the end of its
+    # payment window, cut short by the ticker's next ex-date, is taken to be this distribution
+    return """
+        WITH d AS (
+            SELECT
+                ticker,
+                ex_date,
+                amount,
+                LEAST(
+                    ex_date + payment_window_days,
+                    LEAD(ex_date) OVER (PARTITION BY ticker ORDER BY ex_date)
+                ) AS paid_by
+            FROM (VALUES %s) AS v (ticker, ex_date, amount, payment_window_days)
+        )
+        INSERT INTO dividends (ticker, date, distribution_value)
+        SELECT
+            d.ticker,
+            d.ex_date,
+            ROUND((d.amount * h.units)::numeric, 2)::double precision
+        FROM d
+        CROSS JOIN LATERAL (
+            SELECT COALESCE(SUM(
+                CASE WHEN i.status = 'BUY' THEN i.volume ELSE -i.volume END * COALESCE(c.cumulative_factor, 1)
+            ), 0) AS units
+            FROM investment_history i
+            LEFT JOIN corporate_actions c
+                ON c.ticker = i.ticker
+               AND i.date >= c.applies_from
+               AND i.date < c.date
+            WHERE i.ticker = d.ticker
+              AND i.date < d.ex_date
+        ) h
+        WHERE h.units > 0
+          AND NOT EXISTS (
+            SELECT 1
+            FROM dividends r
+            WHERE r.ticker = d.ticker
+              AND r.date >= d.ex_date
+              AND r.date < d.paid_by
+          )
+        ON CONFLICT (ticker, date) DO NOTHING
+        RETURNING ticker, date, distribution_value;
+    """
+
+def dividendEntitlementsTemplate():
+    return "(%s, %s::date, %s::double precision, %s::integer)"
+
 
 ############################
 # investment_history table #
@@ -183,3 +261,162 @@ def deleteSettingQuery():
         DELETE FROM settings 
         WHERE attribute = %s;
     """
+
+######################
+# quotes_cache table #
+######################
+
+def quotesCacheQuery():
+    return """
+        SELECT ticker, quote, EXTRACT(EPOCH FROM fetched_at)
+        FROM quotes_cache
+        WHERE ticker = ANY(%s);
+    """
+
+def quotesCacheUpsert():
+    return """
+        INSERT INTO quotes_cache (ticker, price, market_state, quote, fetched_at)
+        VALUES %s
+        ON CONFLICT (ticker) DO UPDATE
+        SET 
+            price = EXCLUDED.price,
+            market_state = EXCLUDED.market_state,
+            quote = EXCLUDED.quote,
+            fetched_at = EXCLUDED.fetched_at
+        WHERE quotes_cache.fetched_at <= EXCLUDED.fetched_at;
+    """
+
+def quotesCacheUpsertTemplate():
+    return "(%s, %s, %s, %s, to_timestamp(%s))"
+
+
+#######################
+# price_history table #
+#######################
+
+def priceHistoryRangesQuery():
+    return """
+        SELECT ticker, MIN(date), MAX(date)
+        FROM price_history
+        WHERE ticker = ANY(%s)
+        GROUP BY ticker;
+    """
+
+def firstInvestmentDatesQuery():
+    return """
+        SELECT ticker, MIN(date)
+        FROM investment_history
+        WHERE ticker = ANY(%s)
+        GROUP BY ticker;
+    """
+
+def priceHistoryQuery():
+    return """
+        SELECT date, open, high, low, close, adj_close
+        FROM price_history
+        WHERE ticker = %s
+          AND date >= COALESCE(%s, '-infinity'::date)
+          AND date <= COALESCE(%s, 'infinity'::date)
+        ORDER BY date;
+    """
+
+def priceHistoryDeleteTickers():
+    return """
+        DELETE FROM price_history
+        WHERE ticker = ANY(%s);
+    """
+
+def createPriceHistoryStaging():
+    return """
+        CREATE TEMP TABLE price_history_staging (LIKE price_history) ON COMMIT DROP;
+    """
+
+def copyPriceHistoryStaging():
+    return """
+        COPY price_history_staging (ticker, date, open, high, low, close, adj_close)
+        FROM STDIN WITH (FORMAT csv);
+    """
+
+def priceHistoryUpsertFromStaging():
+    return """
+        INSERT INTO price_history (ticker, date, open, high, low, close, adj_close)
+        SELECT DISTINCT ON (ticker, date) ticker, date, open, high, low, close, adj_close
+        FROM price_history_staging
+        ON CONFLICT (ticker, date) DO UPDATE
+        SET
+            open = EXCLUDED.open,
+            high = EXCLUDED.high,
+            low = EXCLUDED.low,
+            close = EXCLUDED.close,
+            adj_close = EXCLUDED.adj_close;
+    """
+
+
+###########################
+# corporate_actions table #
+###########################
+
+def corporateActionsUpsert():
+    # Only new or changed splits are returned, so only their tickers are recomputed
+    return """
+        INSERT INTO corporate_actions (ticker, date, ratio)
+        VALUES %s
+        ON CONFLICT (ticker, date) DO UPDATE
+        SET ratio = EXCLUDED.ratio
+        WHERE corporate_actions.ratio IS DISTINCT FROM EXCLUDED.ratio
+        RETURNING ticker;
+    """
+
+def corporateActionsTemplate():
+    return "(%s, %s::date, %s::double precision)"
+
+def recomputeAdjustmentFactors():
+    # Cumulative factor is the product of the ratios of this and every later split, summed as logs
+    return """
+        UPDATE corporate_actions c
+        SET
+            applies_from = f.applies_from,
+            cumulative_factor = f.cumulative_factor
+        FROM (
+            SELECT
+                ticker,
+                date,
+                COALESCE(LAG(date) OVER (PARTITION BY ticker ORDER BY date), '-infinity'::date) AS applies_from,
+                ROUND(EXP(SUM(LN(ratio::numeric)) OVER (PARTITION BY ticker ORDER BY date DESC)), 10)::double precision AS cumulative_factor
+            FROM corporate_actions
+            WHERE ticker = ANY(%s)
+        ) f
+        WHERE c.ticker = f.ticker
+          AND c.date = f.date;
+    """
+
+
+########################
+# fund_exposures table #
+########################
+
+def fundExposuresQuery():
+    return """
+        SELECT ticker, exposure_type, name, weight, EXTRACT(EPOCH FROM fetched_at)
+        FROM fund_exposures
+        WHERE ticker = ANY(%s);
+    """
+
+def deleteFundExposures():
+    return """
+        DELETE FROM fund_exposures
+        WHERE ticker = ANY(%s);
+    """
+
+def fundExposuresInsert():
+    return """
+        INSERT INTO fund_exposures (ticker, exposure_type, name, weight, fetched_at)
+        VALUES %s
+        ON CONFLICT (ticker, exposure_type, name) DO UPDATE
+        SET
+            weight = EXCLUDED.weight,
+            fetched_at = EXCLUDED.fetched_at;
+    """
+
+def fundExposuresTemplate():
+    return "(%s, %s, %s, %s, to_timestamp(%s))"
@@ -29,6 +29,19 @@ CREATE TABLE IF NOT EXISTS settings (
     attribute_value TEXT NOT NULL
 );
 
+-- Schema for Corporate Actions Table
+-- One row per split ex-date. `ratio` is units received per unit held, eg. 2 for a 2:1 split.
+-- Trades dated from `applies_from` up to, not including, `date` are restated by `cumulative_factor`,
+-- the product of this and every later split ratio for the ticker.
+CREATE TABLE IF NOT EXISTS corporate_actions (
+    ticker VARCHAR(255) NOT NULL,
+    date DATE NOT NULL,
+    ratio DOUBLE PRECISION NOT NULL CHECK (ratio > 0),
+    applies_from DATE NOT NULL DEFAULT '-infinity',
+    cumulative_factor DOUBLE PRECISION NOT NULL DEFAULT 1,
+    PRIMARY KEY (ticker, date)
+);
+
 -- Add indexes to improve query performance
 DO $$
 BEGIN
@@ -51,20 +64,34 @@ BEGIN
     END IF;
 END $$;
 
--- Create current portfolio view
-DROP MATERIALIZED VIEW IF EXISTS current_portfolio;
-
-CREATE MATERIALIZED VIEW current_portfolio AS
-WITH buys AS (
+-- Create current portfolio view. Migrations replace it with a table maintained per ticker, which is left as is.
+CREATE MATERIALIZED VIEW IF NOT EXISTS current_portfolio AS
+-- Trades restated in post-split units: volume scaled up and price scaled down by every split after the trade
+WITH adjusted_history AS (
+    SELECT
+        i.ticker,
+        i.price / COALESCE(c.cumulative_factor, 1) AS price,
+        i.volume * COALESCE(c.cumulative_factor, 1) AS volume,
+        i.brokerage,
+        i.date,
+        i.status,
+        i.id
+    FROM investment_history i
+    LEFT JOIN corporate_actions c
+        ON c.ticker = i.ticker
+       AND i.date >= c.applies_from
+       AND i.date < c.date
+),
+buys AS (
     SELECT *
-    FROM investment_history
+    FROM adjusted_history
     WHERE status = 'BUY'
 ),
 sells AS (
     SELECT
         ticker,
         SUM(volume) AS total_sold
-    FROM investment_history
+    FROM adjusted_history
     WHERE status = 'SELL'
     GROUP BY ticker
 ),
@@ -103,7 +130,7 @@ avg_sell_prices AS (
     SELECT
         ticker,
         SUM(volume * price)::numeric / SUM(volume) AS avg_sell_price
-    FROM investment_history
+    FROM adjusted_history
     WHERE status = 'SELL'
     GROUP BY ticker
 ),
@@ -119,7 +146,7 @@ aggregated AS (
     SELECT
         r.ticker,
         SUM(r.remaining_volume) AS total_volume,
-        ROUND(SUM(r.remaining_volume * r.price)::numeric / NULLIF(SUM(r.remaining_volume), 0), 2) AS average_price
+        ROUND((SUM(r.remaining_volume * r.price)::numeric / NULLIF(SUM(r.remaining_volume), 0)::numeric)::numeric, 2) AS average_price
     FROM remaining r
     GROUP BY r.ticker
 ),
@@ -127,7 +154,7 @@ buy_brokerage_totals AS (
     SELECT
         ticker,
         ROUND(SUM(brokerage)::numeric, 2) AS buy_brokerage
-    FROM investment_history
+    FROM adjusted_history
     WHERE status = 'BUY'
     GROUP BY ticker
 ),
@@ -135,7 +162,7 @@ sell_brokerage_totals AS (
     SELECT
         ticker,
         ROUND(SUM(brokerage)::numeric, 2) AS sell_brokerage
-    FROM investment_history
+    FROM adjusted_history
     WHERE status = 'SELL'
     GROUP BY ticker
 )
@@ -0,0 +1,179 @@
+import sys
+import asyncio
+import threading
+from prompt_toolkit.input import create_input
+from prompt_toolkit.keys import Keys
+
+from db.db_handler import get_connection
+from fetchers.scheduler import INTERACTIVE, getScheduler
+
+# Keys that cancel a running fetch
+CANCEL_KEYS = [Keys.Escape, Keys.ControlC]
+# Seconds to wait for the rest of an escape sequence before treating a lone ESC as a key press
+ESCAPE_FLUSH_SECONDS = 0.05
+
+# Connections of cancelled fetches still running in the background, see `isFetchCancelled`
+cancelledConnections = set()
+cancelledLock = threading.Lock()
+
+class FetchCancelled(Exception):
+    """
+    Raised when the user cancels a fetch with ESC or Ctrl-C.
+    """
+
+def isFetchCancelled(conn):
+    """
+    Check if the fetch using `conn` has been cancelled by the user.
+    Fetchers check this before writing to the database, so a cancelled fetch stops storing its results.
+
+    Params:
+    - conn: connection the fetch was given
+    """
+    with cancelledLock:
+        return conn in cancelledConnections
+
+async def fetchAsync(conn, fetch, *args, callerCallbacks=(), **kwargs):
+    """
+    Await a blocking fetcher, eg. `getYfinancePriceData`, run on a daemon thread.
+    The fetcher is given its own database connection, so it never shares `conn` with the awaiting thread.
+
+    If the awaiting task is cancelled, interactive requests still queued on the request scheduler are dropped.
+    Requests already sent can't be aborted, so finish in the background and their quotes still reach the on-disk caches,
+    but the fetch stops writing to the database, see `isFetchCancelled`.
+
+    Params:
+    - conn: connection to database, only used on the awaiting thread
+    - fetch: fetcher taking a database connection as its first argument
+    - args, kwargs: further arguments for `fetch`
+    - callerCallbacks: names of callback keyword arguments to call on the awaiting thread rather than the fetch thread,
+      eg. `onQuote` to print rows as quotes arrive. Calls made before the fetch returns all run before its result. Default: ()
+
+    Returns:
+    - the fetcher's result
+    """
+    loop = asyncio.get_running_loop()
+    result = loop.create_future()
+
+    def setResult(value, error):
+        if result.done():
+            return
+        if error is not None:
+            result.set_exception(error)
+        else:
+            result.set_result(value)
+
+    def callOnLoop(callback):
+        def runCallback(*callbackArgs):
+            if not result.done():
+                callback(*callbackArgs)
+
+        def call(*callbackArgs):
+            if not loop.is_closed():
+                try:
+                    loop.call_soon_threadsafe(runCallback, *callbackArgs)
+                except RuntimeError:
+                    pass
+        return call
+
+    kwargs.update({name: callOnLoop(kwargs[name]) for name in callerCallbacks if kwargs.get(name) is not None})
+
+    scheduler = getScheduler(conn)
+    fetchConn = get_connection()
+    finished = False
+
+    def run():
+        nonlocal finished
+        try:
+            value, error = fetch(fetchConn, *args, **kwargs), None
+        except BaseException as e:
+            value, error = None, e
+        finally:
+            with cancelledLock:
+                finished = True
+                cancelledConnections.discard(fetchConn)
+            fetchConn.close()
+
+        if not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(setResult, value, error)
+            except RuntimeError:
+                pass
+
+    threading.Thread(target=run, name='async-fetch', daemon=True).start()
+    try:
+        return await result
+    except asyncio.CancelledError:
+        with cancelledLock:
+            if not finished:
+                cancelledConnections.add(fetchConn)
+        scheduler.cancelQueued(INTERACTIVE)
+        raise
+
+async def awaitCancellable(awaitable):
+    """
+    Await `awaitable`, cancelling it if ESC or Ctrl-C is pressed. Keys are only watched when stdin is a terminal.
+
+    Raises:
+    - FetchCancelled: if cancelled by a key press
+    """
+    task = asyncio.ensure_future(awaitable)
+    if not sys.stdin.isatty():
+        return await task
+
+    loop = asyncio.get_running_loop()
+    keyInput = create_input()
+
+    def cancelOnKeys(keyPresses):
+        if any(keyPress.key in CANCEL_KEYS for keyPress in keyPresses):
+            task.cancel()
+
+    def flushEscape():
+        cancelOnKeys(keyInput.flush_keys())
+
+    def onInput():
+        cancelOnKeys(keyInput.read_keys())
+        # A lone ESC stays buffered in case more of an escape sequence follows
+        loop.call_later(ESCAPE_FLUSH_SECONDS, flushEscape)
+
+    with keyInput.raw_mode(), keyInput.attach(onInput):
+        try:
+            return await task
+        except asyncio.CancelledError:
+            raise FetchCancelled()
+
+def runFetch(conn, fetch, *args, **kwargs):
+    """
+    Run a fetcher from a command, letting the user cancel it with ESC or Ctrl-C. See `fetchAsync`.
+
+    Params:
+    - conn: connection to database
+    - fetch: fetcher taking `conn` as its first argument
+    - args, kwargs: further arguments for `fetch`, and `callerCallbacks`
+
+    Returns:
+    - the fetcher's result
+
+    Raises:
+    - FetchCancelled: if the user cancelled the fetch
+    """
+    return asyncio.run(awaitCancellable(fetchAsync(conn, fetch, *args, **kwargs)))
+
+def runFetches(conn, *fetches):
+    """
+    Run several fetchers at once, each on its own thread and database connection,
+    letting the user cancel them all with ESC or Ctrl-C. See `fetchAsync`.
+
+    Params:
+    - conn: connection to database
+    - fetches: (fetch, args, kwargs) tuples, as passed to `runFetch`
+
+    Returns:
+    - list of the fetchers' results, in the order of `fetches`
+
+    Raises:
+    - FetchCancelled: if the user cancelled the fetches
+    """
+    async def fetchAll():
+        return await asyncio.gather(*(fetchAsync(conn, fetch, *args, **kwargs) for fetch, args, kwargs in fetches))
+
+    return asyncio.run(awaitCancellable(fetchAll()))
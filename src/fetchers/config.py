@@ -0,0 +1,70 @@
+import os
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+CACHE_DIRECTORY_NAME = "cache"
+CACHE_DIRECTORY = os.path.join(current_dir, CACHE_DIRECTORY_NAME)
+
+QUOTE_CACHE_FILE_NAME = "quote_cache.json"
+QUOTE_CACHE_FILE = os.path.join(CACHE_DIRECTORY, QUOTE_CACHE_FILE_NAME)
+
+PRICE_CACHE_FILE_NAME = "price_cache.json"
+PRICE_CACHE_FILE = os.path.join(CACHE_DIRECTORY, PRICE_CACHE_FILE_NAME)
+
+# Prefix of price-only quote keys in the shared `quotes_cache` table, which full quotes are stored in by ticker
+PRICE_QUOTE_KEY_PREFIX = "price:"
+
+METADATA_CACHE_FILE_NAME = "metadata_cache.json"
+METADATA_CACHE_FILE = os.path.join(CACHE_DIRECTORY, METADATA_CACHE_FILE_NAME)
+
+FEAR_AND_GREED_CACHE_FILE_NAME = "fear_and_greed_cache.json"
+FEAR_AND_GREED_CACHE_FILE = os.path.join(CACHE_DIRECTORY, FEAR_AND_GREED_CACHE_FILE_NAME)
+
+PRICE_STORE_DIRECTORY_NAME = "price_history"
+PRICE_STORE_DIRECTORY = os.path.join(CACHE_DIRECTORY, PRICE_STORE_DIRECTORY_NAME)
+
+RECORDINGS_DIRECTORY_NAME = "recordings"
+RECORDINGS_DIRECTORY = os.path.join(CACHE_DIRECTORY, RECORDINGS_DIRECTORY_NAME)
+RECORDINGS_FILE_NAME = "provider_recordings.json"
+
+# Seconds the cached CNN Fear and Greed Index is shown without fetching it again
+FEAR_AND_GREED_CACHE_TTL_SECONDS = 60 * 60
+
+# Period of daily closes downloaded for price-only lookups, long enough to span weekends and holidays
+PRICE_HISTORY_PERIOD = "5d"
+
+# Years of daily prices stored for tickers never invested in, eg. indices. Invested tickers start from their first transaction.
+PRICE_HISTORY_DEFAULT_YEARS = 10
+
+# Seconds a cached quote is considered fresh, keyed by yfinance `marketState`
+QUOTE_CACHE_TTLS = {
+    'PREPRE': 15 * 60,
+    'PRE': 5 * 60,
+    'REGULAR': 60,
+    'POST': 60 * 60,
+    'POSTPOST': 4 * 60 * 60,
+    'CLOSED': 4 * 60 * 60,
+}
+DEFAULT_QUOTE_CACHE_TTL = 5 * 60
+
+# Seconds after which an expired quote is too old to show while it refreshes, and is fetched before showing instead.
+# Long enough for Friday's closing quotes to be shown on Monday.
+MAX_STALE_QUOTE_AGE = 3 * 24 * 60 * 60
+
+# `quoteStatus` values for quotes that are not live
+QUOTE_STATUS_STALE = "stale"                # expired cached quote, refreshing in the background
+QUOTE_STATUS_LAST_KNOWN = "last-known"      # not fetched before the deadline, previous quote served instead
+QUOTE_STATUS_UNAVAILABLE = "unavailable"    # not fetched before the deadline, no previous quote
+QUOTE_STATUS_OFFLINE = "offline"            # offline, expired quote served as the last known price
+
+# Retries for throttled provider requests, backing off exponentially from the base delay up to the max
+FETCH_MAX_RETRIES = 3
+FETCH_BACKOFF_BASE_SECONDS = 1
+FETCH_BACKOFF_MAX_SECONDS = 30
+
+# Reachability probe used to detect offline mode. Connecting is bounded by the timeout,
+# and the result is reused for the TTL so commands don't each wait on the probe.
+NETWORK_PROBE_HOST = "query1.finance.yahoo.com"
+NETWORK_PROBE_PORT = 443
+NETWORK_PROBE_TIMEOUT_SECONDS = 0.5
+NETWORK_PROBE_TTL_SECONDS = 60
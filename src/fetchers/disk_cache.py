@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import threading
+
+class DiskCache:
+    """
+    JSON file backed key/value store. Every entry records when it was written so
+    callers can apply their own expiry rules.
+
+    The file is re-read whenever it changes on disk, so separate sessions sharing
+    the same cache file see each other's writes.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._mtime = None
+
+    def _fileMtime(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def _reload(self):
+        """
+        Reloads entries from disk if the file changed since it was last read.
+        Must be called with the lock held.
+        """
+        mtime = self._fileMtime()
+        if mtime == self._mtime:
+            return
+
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+            self._entries = entries if isinstance(entries, dict) else {}
+        except (OSError, json.JSONDecodeError):
+            self._entries = {}
+        self._mtime = mtime
+
+    def _write(self):
+        """
+        Atomically writes entries to disk. Must be called with the lock held.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmpPath = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmpPath, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmpPath, self.path)
+        self._mtime = self._fileMtime()
+
+    def getMany(self, keys):
+        """
+        Get cached entries for keys.
+
+        Params:
+        - keys: list of keys to look up
+
+        Returns:
+        - dictionary of key to (value, fetchedAt) tuples for keys present in the cache
+        """
+        with self._lock:
+            self._reload()
+            result = {}
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    result[key] = (entry['value'], entry['fetchedAt'])
+            return result
+
+    def putMany(self, values, fetchedAt=None):
+        """
+        Store values in the cache and persist them to disk.
+
+        Params:
+        - values: dictionary of key to value mappings. Values must be JSON serialisable.
+        - fetchedAt: epoch seconds the values were fetched at. Default: now
+        """
+        if not values:
+            return
+
+        fetchedAt = fetchedAt if fetchedAt is not None else time.time()
+        with self._lock:
+            self._reload()
+            for key, value in values.items():
+                self._entries[key] = {'value': value, 'fetchedAt': fetchedAt}
+            try:
+                self._write()
+            except OSError as e:
+                print(f"Warning: Failed to write cache file {self.path}: {e}")
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        with self._lock:
+            self._entries = {}
+            try:
+                self._write()
+            except OSError as e:
+                print(f"Warning: Failed to write cache file {self.path}: {e}")
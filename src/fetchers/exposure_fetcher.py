@@ -0,0 +1,87 @@
+import time
+from concurrent.futures import as_completed
+import pandas as pd
+
+from db.crud import getFundExposures, replaceFundExposures
+from fetchers.async_fetcher import isFetchCancelled
+from fetchers.network import isOffline
+from fetchers.providers import ProviderError, getProvider
+from fetchers.scheduler import INTERACTIVE, getScheduler
+from utils.settings_utils import getIntegerSetting
+
+EXPOSURE_TYPES = ['sector', 'region', 'holding']
+EXPOSURE_COLUMNS = ['ticker', 'exposureType', 'name', 'weight']
+
+def toExposureRows(ticker, exposures):
+    """
+    Convert exposures from `MarketDataProvider.getFundExposures` into (exposureType, name, weight) rows.
+    A ticker without any holdings counts as its own only holding, so is still stored and not fetched again until it expires.
+    """
+    rows = [
+        (exposureType, name, weight)
+        for exposureType in EXPOSURE_TYPES
+        for name, weight in exposures.get(exposureType, {}).items()
+    ]
+    if not exposures.get('holding'):
+        rows.append(('holding', ticker, 1.0))
+    return rows
+
+def fetchFundExposures(conn, tickers, priority=INTERACTIVE):
+    """
+    Fetch exposures for tickers from the provider, one request per ticker queued on the request scheduler.
+
+    Params:
+    - conn: connection to database
+    - tickers: list of tickers
+    - priority: request scheduler lane. Default: `INTERACTIVE`
+
+    Returns:
+    - dictionary of ticker to list of (exposureType, name, weight) rows, for tickers fetched successfully
+    """
+    scheduler = getScheduler(conn)
+    provider = getProvider(conn)
+    futures = {scheduler.submit(provider.getFundExposures, ticker, priority=priority): ticker for ticker in tickers}
+
+    fetched = {}
+    for future in as_completed(futures):
+        if future.cancelled():
+            continue
+
+        ticker = futures[future]
+        try:
+            fetched[ticker] = toExposureRows(ticker, future.result())
+        except ProviderError as e:
+            print(f"\nCouldn't fetch holdings for {ticker}: {e}")
+
+    return fetched
+
+def getLookThroughExposures(conn, tickers, priority=INTERACTIVE):
+    """
+    Get the sector, region and holding weights of tickers from the `fund_exposures` table,
+    fetching tickers stored longer ago than the `fund_exposure_ttl_days` setting.
+    Fund holdings change slowly, so expired exposures are still served if they can't be fetched, eg. offline.
+
+    Params:
+    - conn: connection to database
+    - tickers: list of tickers
+    - priority: request scheduler lane. Default: `INTERACTIVE`
+
+    Returns:
+    - pandas DataFrame with a row per ticker, exposure type and name, and `EXPOSURE_COLUMNS` columns
+    """
+    maxAge = getIntegerSetting(conn, 'fund_exposure_ttl_days') * 24 * 60 * 60
+    stored = getFundExposures(conn, tickers)
+
+    now = time.time()
+    fetchedAts = {row[0]: row[4] for row in stored}
+    expiredTickers = [ticker for ticker in tickers if ticker not in fetchedAts or now - fetchedAts[ticker] >= maxAge]
+
+    if expiredTickers and not isOffline(conn):
+        fetched = fetchFundExposures(conn, expiredTickers, priority)
+        if not isFetchCancelled(conn):
+            replaceFundExposures(conn, fetched, now)
+        stored = [row for row in stored if row[0] not in fetched] + [
+            (ticker, *row, now) for ticker, rows in fetched.items() for row in rows
+        ]
+
+    return pd.DataFrame([row[:4] for row in stored], columns=EXPOSURE_COLUMNS)
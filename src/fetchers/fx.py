@@ -0,0 +1,95 @@
+import pandas as pd
+
+from db.crud import getSetting
+from fetchers.scheduler import INTERACTIVE
+from fetchers.yfinance_fetcher import getCachedTickerMetadata, getTickerMetadata, getYfinancePriceData
+from utils.constants.defaults import getDefaultSetting
+
+# Currencies quoted in minor units, eg. London listings in pence, to their major currency and size of one minor unit
+MINOR_CURRENCY_UNITS = {
+    'GBp': ('GBP', 0.01),
+    'GBX': ('GBP', 0.01),
+    'ZAc': ('ZAR', 0.01),
+    'ILA': ('ILS', 0.01),
+}
+
+def getBaseCurrency(conn):
+    """
+    Get the currency portfolio values are shown in, from the `base_currency` setting
+    """
+    return getSetting(conn, 'base_currency', getDefaultSetting('base_currency')).strip().upper()
+
+def getFxPairTicker(currency, baseCurrency):
+    """
+    Get the Yahoo Finance ticker quoting one unit of `currency` in `baseCurrency`, eg. 'USDAUD=X'
+    """
+    return f"{currency}{baseCurrency}=X"
+
+def getFxRates(conn, currencies, deadline=None, priority=INTERACTIVE):
+    """
+    Get exchange rates from currencies to the base currency.
+    Every pair needed is fetched in one batched price request, and cached like any other quote,
+    so rates are reused across commands and sessions until their TTL runs out.
+
+    Params:
+    - conn: connection to database
+    - currencies: list of currency codes, as in a quote's `currency` field
+    - deadline: `time.monotonic()` value to stop waiting for rates at, see `getFetchDeadline`. Default: None
+    - priority: request scheduler lane. Default: `INTERACTIVE`
+
+    Returns:
+    - pandas Series of currency to the base currency value of one unit, NaN for rates not available
+    """
+    baseCurrency = getBaseCurrency(conn)
+    units = {currency: MINOR_CURRENCY_UNITS.get(currency, (currency, 1.0)) for currency in set(currencies) if currency}
+
+    pairs = sorted({getFxPairTicker(major, baseCurrency) for major, _ in units.values() if major != baseCurrency})
+    prices = getYfinancePriceData(conn, pairs, deadline=deadline, priority=priority) if pairs else {}
+
+    rates = {}
+    for currency, (major, unitSize) in units.items():
+        if major == baseCurrency:
+            rates[currency] = unitSize
+        else:
+            price = prices.get(getFxPairTicker(major, baseCurrency), {}).get('price')
+            rates[currency] = price * unitSize if price is not None else float('nan')
+
+    return pd.Series(rates, dtype=float)
+
+def getTickerFxRates(conn, tickers, deadline=None, priority=INTERACTIVE, cachedTickers=()):
+    """
+    Get the exchange rate from each ticker's trading currency to the base currency.
+    Currencies come from the metadata cache, tickers without a known currency are assumed to trade in the base currency.
+
+    Params:
+    - conn: connection to database
+    - tickers: list of tickers
+    - deadline, priority: see `getFxRates`
+    - cachedTickers: further tickers to get rates for from cached metadata only, never fetching their metadata,
+      eg. sold out positions nobody is waiting on. Their pairs are fetched in the same batch as the rest. Default: ()
+
+    Returns:
+    - pandas Series of ticker to exchange rate, NaN for rates not available
+    """
+    metadata = getTickerMetadata(conn, tickers, deadline, priority)
+    metadata.update(getCachedTickerMetadata([ticker for ticker in cachedTickers if ticker not in tickers]))
+    baseCurrency = getBaseCurrency(conn)
+    allTickers = list(tickers) + [ticker for ticker in cachedTickers if ticker not in tickers]
+    currencies = pd.Series({ticker: metadata.get(ticker, {}).get('currency') or baseCurrency for ticker in allTickers}, dtype=object)
+
+    rates = getFxRates(conn, list(currencies), deadline, priority)
+    return pd.Series(rates.reindex(currencies.values).values, index=currencies.index, dtype=float)
+
+def toBaseCurrency(values, rates):
+    """
+    Convert amounts indexed by ticker to the base currency, every row in one vectorised multiply.
+    Amounts without an exchange rate are left as they are.
+
+    Params:
+    - values: pandas Series or DataFrame of amounts, indexed by ticker
+    - rates: pandas Series of ticker to exchange rate, from `getTickerFxRates`
+
+    Returns:
+    - values converted, same shape as `values`
+    """
+    return values.mul(rates.reindex(values.index).fillna(1.0), axis=0)
@@ -0,0 +1,201 @@
+from collections import defaultdict
+from concurrent.futures import as_completed
+from datetime import date, timedelta
+
+from db.crud import getFirstInvestmentDates, getPriceHistory, getPriceHistoryRanges, upsertPriceHistory
+from fetchers.async_fetcher import isFetchCancelled
+from fetchers.config import PRICE_HISTORY_DEFAULT_YEARS
+from fetchers.price_store import priceStore
+from fetchers.providers import getProvider, ProviderError
+from fetchers.scheduler import INTERACTIVE, getScheduler
+
+def getMissingPriceHistoryRanges(conn, tickers, today=None, refetchTickers=()):
+    """
+    Get the date ranges of daily prices missing from the `price_history` table for each ticker.
+    - Tickers without stored prices need everything from their first transaction, or `PRICE_HISTORY_DEFAULT_YEARS` ago.
+    - Stored tickers need everything after their last stored date. The last date is included again,
+      as it may have been stored mid session.
+    - Stored tickers bought before their first stored date also need that earlier range.
+    - Refetched tickers need one range covering every stored date as well as the above.
+
+    Params:
+    - conn: connection to database
+    - tickers: list of tickers
+    - today: last date to fetch up to. Default: current date
+    - refetchTickers: tickers to fetch the full history of, eg. after a split. Default: ()
+
+    Returns:
+    - dictionary of ticker to list of (start, end) date ranges, `end` excluded
+    """
+    today = today or date.today()
+    end = today + timedelta(days=1)
+    defaultStart = today - timedelta(days=365 * PRICE_HISTORY_DEFAULT_YEARS)
+
+    storedRanges = getPriceHistoryRanges(conn, tickers)
+    firstInvestmentDates = getFirstInvestmentDates(conn, tickers)
+
+    missingRanges = {}
+    for ticker in tickers:
+        if ticker not in storedRanges:
+            missingRanges[ticker] = [(firstInvestmentDates.get(ticker, defaultStart), end)]
+            continue
+
+        firstStored, lastStored = storedRanges[ticker]
+        if ticker in refetchTickers:
+            missingRanges[ticker] = [(min(firstStored, firstInvestmentDates.get(ticker, firstStored)), end)]
+            continue
+
+        missingRanges[ticker] = [(lastStored, end)]
+        if ticker in firstInvestmentDates and firstInvestmentDates[ticker] < firstStored:
+            missingRanges[ticker].insert(0, (firstInvestmentDates[ticker], firstStored))
+
+    return missingRanges
+
+def toPriceHistoryRows(ticker, bars):
+    """
+    Convert daily bars from `MarketDataProvider.getPriceHistory` into `price_history` rows
+    """
+    return [
+        (ticker, bar['date'], bar['open'], bar['high'], bar['low'], bar['close'], bar['adjClose'])
+        for bar in bars
+    ]
+
+def toPriceBars(rows):
+    """
+    Convert `price_history` rows from `getPriceHistory` into daily bars in `MarketDataProvider.getPriceHistory` format
+    """
+    return [
+        {'date': row[0].isoformat(), 'open': row[1], 'high': row[2], 'low': row[3], 'close': row[4], 'adjClose': row[5]}
+        for row in rows
+    ]
+
+def syncPriceHistory(conn, tickers, priority=INTERACTIVE, today=None, refetchTickers=()):
+    """
+    Download the daily prices missing from the `price_history` table and store them,
+    both in the table and in the memory mapped `priceStore` used for analytics.
+    Tickers missing the same date range, usually every ticker synced together before, are downloaded
+    in one bulk request, with the requests sent through the request scheduler.
+    Each download is stored in one COPY and merge, see `upsertPriceHistory`.
+
+    Params:
+    - conn: connection to database
+    - tickers: list of tickers
+    - priority: request scheduler lane. Default: `INTERACTIVE`
+    - today: last date to fetch up to. Default: current date
+    - refetchTickers: tickers whose stored prices are all replaced by a fresh download of their full history,
+      eg. after a split restated it. Tickers the provider returns nothing for keep their stored prices. Default: ()
+
+    Returns:
+    - dictionary of ticker to number of daily prices stored
+    """
+    scheduler = getScheduler(conn)
+    provider = getProvider(conn)
+
+    tickersByRange = defaultdict(list)
+    for ticker, ranges in getMissingPriceHistoryRanges(conn, tickers, today, refetchTickers).items():
+        for dateRange in ranges:
+            tickersByRange[dateRange].append(ticker)
+
+    futures = {
+        scheduler.submit(provider.getPriceHistory, rangeTickers, start.isoformat(), end.isoformat(), priority=priority): rangeTickers
+        for (start, end), rangeTickers in tickersByRange.items()
+    }
+
+    # Tickers synced before the price store existed get their full history from the table instead
+    unstoredTickers = [ticker for ticker in tickers if ticker not in refetchTickers and priceStore.getLastDate(ticker) is None]
+
+    storedCounts = {ticker: 0 for ticker in tickers}
+    for future in as_completed(futures):
+        if future.cancelled() or isFetchCancelled(conn):
+            continue
+
+        try:
+            history = future.result()
+        except ProviderError as e:
+            # Tickers not downloaded keep what is stored, and are fetched again on the next sync
+            print(f"\nCouldn't fetch price history for {', '.join(futures[future])}: {e}")
+            continue
+
+        rowsByTicker = {ticker: toPriceHistoryRows(ticker, history.get(ticker, [])) for ticker in futures[future]}
+        replaceTickers = [ticker for ticker, rows in rowsByTicker.items() if ticker in refetchTickers and rows]
+        if upsertPriceHistory(conn, [row for rows in rowsByTicker.values() for row in rows], replaceTickers):
+            for ticker, rows in rowsByTicker.items():
+                storedCounts[ticker] += len(rows)
+
+        for ticker in futures[future]:
+            if ticker in replaceTickers:
+                priceStore.replace(ticker, history[ticker])
+            elif ticker not in unstoredTickers:
+                priceStore.write(ticker, history.get(ticker, []))
+
+    for ticker in unstoredTickers:
+        priceStore.write(ticker, toPriceBars(getPriceHistory(conn, ticker)))
+
+    return storedCounts
+
+def fetchSinceFirstInvestment(conn, tickers, fetch, field, description, priority):
+    """
+    Fetch per ticker events since each ticker was first bought, in one batched request from the earliest first date.
+
+    Params:
+    - conn: connection to database
+    - tickers: list of tickers
+    - fetch: provider method taking (tickers, start), eg. `getDividends`
+    - field: event field to return alongside the ticker and date
+    - description: what is fetched, for the message shown if the provider can't serve it, eg. 'dividends'
+    - priority: request scheduler lane
+
+    Returns:
+    - list of (ticker, date, value) tuples, dates as ISO strings. Empty if the provider can't serve the request
+    """
+    firstInvestmentDates = getFirstInvestmentDates(conn, tickers)
+    if not firstInvestmentDates:
+        return []
+
+    start = min(firstInvestmentDates.values()).isoformat()
+    try:
+        events = getScheduler(conn).submit(
+            fetch,
+            list(firstInvestmentDates.keys()),
+            start,
+            priority=priority
+        ).result()
+    except ProviderError as e:
+        print(f"\nCouldn't fetch {description}: {e}")
+        return []
+
+    return [
+        (ticker, event['date'], event[field])
+        for ticker, tickerEvents in events.items()
+        for event in tickerEvents
+        if event['date'] >= firstInvestmentDates[ticker].isoformat()
+    ]
+
+def fetchDividendHistory(conn, tickers, priority=INTERACTIVE):
+    """
+    Fetch the per unit distributions of tickers since each was first bought, in one batched request.
+
+    Params:
+    - conn: connection to database
+    - tickers: list of tickers
+    - priority: request scheduler lane. Default: `INTERACTIVE`
+
+    Returns:
+    - list of (ticker, exDate, amountPerUnit) tuples, ex-dates as ISO strings
+    """
+    return fetchSinceFirstInvestment(conn, tickers, getProvider(conn).getDividends, 'amount', 'dividends', priority)
+
+def fetchSplitHistory(conn, tickers, priority=INTERACTIVE):
+    """
+    Fetch the stock splits of tickers since each was first bought, in one batched request.
+    Splits before a ticker was first bought never apply to its trades, so aren't needed.
+
+    Params:
+    - conn: connection to database
+    - tickers: list of tickers
+    - priority: request scheduler lane. Default: `INTERACTIVE`
+
+    Returns:
+    - list of (ticker, exDate, ratio) tuples, ex-dates as ISO strings
+    """
+    return fetchSinceFirstInvestment(conn, tickers, getProvider(conn).getSplits, 'ratio', 'stock splits', priority)
@@ -0,0 +1,69 @@
+import socket
+import threading
+import time
+
+from fetchers.config import (
+    NETWORK_PROBE_HOST,
+    NETWORK_PROBE_PORT,
+    NETWORK_PROBE_TIMEOUT_SECONDS,
+    NETWORK_PROBE_TTL_SECONDS
+)
+from utils.settings_utils import getChoiceSetting
+
+probeLock = threading.Lock()
+lastProbe = {'reachable': None, 'probedAt': 0}
+
+def probeNetwork(host=NETWORK_PROBE_HOST, port=NETWORK_PROBE_PORT, timeout=NETWORK_PROBE_TIMEOUT_SECONDS):
+    """
+    Check if the market data host accepts connections within `timeout` seconds.
+    The probe runs on a daemon thread so a slow DNS lookup can't hold up the caller past the timeout.
+
+    Params:
+    - host: host to connect to. Default: `NETWORK_PROBE_HOST`
+    - port: port to connect to. Default: `NETWORK_PROBE_PORT`
+    - timeout: seconds to wait for the connection. Default: `NETWORK_PROBE_TIMEOUT_SECONDS`
+    """
+    result = {'reachable': False}
+
+    def connect():
+        try:
+            socket.create_connection((host, port), timeout=timeout).close()
+            result['reachable'] = True
+        except OSError:
+            pass
+
+    thread = threading.Thread(target=connect, name='network-probe', daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return result['reachable']
+
+def isNetworkReachable():
+    """
+    Check if the network is reachable, reusing the last probe for `NETWORK_PROBE_TTL_SECONDS`.
+    """
+    with probeLock:
+        now = time.monotonic()
+        if lastProbe['reachable'] is None or now - lastProbe['probedAt'] >= NETWORK_PROBE_TTL_SECONDS:
+            lastProbe['reachable'] = probeNetwork()
+            lastProbe['probedAt'] = now
+        return lastProbe['reachable']
+
+def isOffline(conn):
+    """
+    Check if remote market data requests should be skipped, from the `offline_mode` setting:
+    - 'on': always offline
+    - 'off': never offline
+    - 'auto': offline while the network is unreachable
+
+    Replayed provider responses need no network, so the replay provider is never offline.
+
+    Params:
+    - conn: connection to database
+    """
+    if getChoiceSetting(conn, 'market_data_provider') == 'replay':
+        return False
+
+    mode = getChoiceSetting(conn, 'offline_mode')
+    if mode == 'auto':
+        return not isNetworkReachable()
+    return mode == 'on'
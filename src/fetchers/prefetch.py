@@ -0,0 +1,50 @@
+import threading
+
+from db.crud import getDistinctTickers
+from db.db_handler import get_connection
+from fetchers.network import isOffline
+from fetchers.scheduler import BACKGROUND
+from fetchers.yfinance_fetcher import getYfinanceTickerData
+from utils.settings_utils import getBooleanSetting, getListSetting
+
+def prefetchQuotes(tickers):
+    """
+    Fetch quotes for tickers into the session and on-disk quote caches.
+    Runs on a background thread, so uses its own database connection.
+
+    Params:
+    - tickers: list of tickers
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        getYfinanceTickerData(conn, tickers, priority=BACKGROUND)
+    except (Exception, SystemExit) as e:
+        if conn is not None and getBooleanSetting(conn, 'debug_mode'):
+            print(f"\nBackground quote prefetch failed: {e}")
+    finally:
+        if conn is not None:
+            conn.close()
+
+def startQuotePrefetch(conn):
+    """
+    Start warming the quote caches in the background with the current portfolio tickers
+    and indices of interest, so the first `value` or `index-performance` can be served from cache.
+
+    Params:
+    - conn: connection to database
+
+    Returns:
+    - the started prefetch thread, or None if prefetching is disabled or offline
+    """
+    if not getBooleanSetting(conn, 'prefetch_quotes') or isOffline(conn):
+        return None
+
+    tickers = getDistinctTickers(conn)
+    tickers += [index for index in getListSetting(conn, 'indices_of_interest') if index not in tickers]
+    if not tickers:
+        return None
+
+    thread = threading.Thread(target=prefetchQuotes, args=(tickers,), name='quote-prefetch', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,141 @@
+import os
+import threading
+import numpy as np
+
+from fetchers.config import PRICE_STORE_DIRECTORY
+
+# Rows of each ticker's price matrix. Dates are stored as days since the epoch so every row shares one float dtype.
+PRICE_STORE_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'adjClose']
+PRICE_COLUMNS = PRICE_STORE_COLUMNS[1:]
+
+class PriceStore:
+    """
+    Daily price history stored as one `.npy` file per ticker, for analytics over many tickers and years.
+
+    Each file holds a (column, date) float matrix, so every column is contiguous on disk.
+    Files are memory mapped, and `read` slices the requested date window out of the mapping
+    without copying, so only the pages a computation touches are read from disk.
+    Files are replaced atomically, and reopened when they change, so readers never see a partial write.
+    """
+    def __init__(self, directory=PRICE_STORE_DIRECTORY):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._mapped = {}
+
+    def _path(self, ticker):
+        return os.path.join(self.directory, f"{ticker.replace(os.sep, '_')}.npy")
+
+    def _open(self, ticker):
+        """
+        Get the memory mapped matrix for a ticker, or None if nothing is stored.
+        """
+        path = self._path(ticker)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+
+        with self._lock:
+            mapped = self._mapped.get(ticker)
+            if mapped is None or mapped[0] != mtime:
+                mapped = (mtime, np.load(path, mmap_mode='r'))
+                self._mapped[ticker] = mapped
+            return mapped[1]
+
+    def read(self, ticker, start=None, end=None):
+        """
+        Read a ticker's daily prices between two dates, both included.
+
+        Params:
+        - ticker: ticker to read
+        - start: first date to include, as a `date` or ISO string. Default: None (first stored date)
+        - end: last date to include, as a `date` or ISO string. Default: None (last stored date)
+
+        Returns:
+        - dictionary of column in `PRICE_STORE_COLUMNS` to numpy array, None if nothing is stored.
+          Price columns are read only views into the file, `date` is a `datetime64[D]` array.
+        """
+        matrix = self._open(ticker)
+        if matrix is None:
+            return None
+
+        days = matrix[0]
+        first = 0 if start is None else np.searchsorted(days, toDay(start), side='left')
+        last = len(days) if end is None else np.searchsorted(days, toDay(end), side='right')
+
+        window = {'date': days[first:last].astype('int64').astype('datetime64[D]')}
+        for i, column in enumerate(PRICE_COLUMNS, start=1):
+            window[column] = matrix[i, first:last]
+        return window
+
+    def getLastDate(self, ticker):
+        """
+        Get the last date stored for a ticker as a `datetime64[D]`, or None if nothing is stored.
+        """
+        matrix = self._open(ticker)
+        if matrix is None or matrix.shape[1] == 0:
+            return None
+        return np.datetime64(int(matrix[0, -1]), 'D')
+
+    def write(self, ticker, bars):
+        """
+        Merge daily bars into a ticker's file. Bars for dates already stored replace the stored ones.
+
+        Params:
+        - ticker: ticker the bars belong to
+        - bars: list of {'date', 'open', 'high', 'low', 'close', 'adjClose'} dictionaries
+          as returned by `MarketDataProvider.getPriceHistory`, missing prices as None
+        """
+        if not bars:
+            return
+
+        incoming = toMatrix(bars)
+        stored = self._open(ticker)
+        if stored is not None:
+            # Stored dates not being replaced, in memory before the mapped file is swapped out
+            kept = np.asarray(stored[:, ~np.isin(stored[0], incoming[0])])
+            incoming = np.concatenate([kept, incoming], axis=1)
+
+        self._save(ticker, incoming)
+
+    def replace(self, ticker, bars):
+        """
+        Replace everything stored for a ticker with daily bars, eg. after a split restated its history.
+
+        Params:
+        - ticker: ticker the bars belong to
+        - bars: list of daily bars, see `write`
+        """
+        if bars:
+            self._save(ticker, toMatrix(bars))
+
+    def _save(self, ticker, matrix):
+        """
+        Sort a (column, date) matrix by date and atomically write it as a ticker's file.
+        """
+        # Later duplicates win, so the newest bar for a date is kept
+        _, lastIndices = np.unique(matrix[0][::-1], return_index=True)
+        merged = matrix[:, matrix.shape[1] - 1 - lastIndices]
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(ticker)
+        tmpPath = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(tmpPath, np.ascontiguousarray(merged))
+        os.replace(tmpPath, path)
+
+def toMatrix(bars):
+    """
+    Convert daily bars into a (column, date) float matrix with `PRICE_STORE_COLUMNS` rows
+    """
+    return np.array(
+        [[toDay(bar['date'])] + [np.nan if bar[column] is None else bar[column] for column in PRICE_COLUMNS] for bar in bars],
+        dtype='float64'
+    ).T
+
+def toDay(value):
+    """
+    Convert a `date` or ISO date string to days since the epoch
+    """
+    return float(np.datetime64(str(value), 'D').astype('int64'))
+
+priceStore = PriceStore()
@@ -0,0 +1,521 @@
+import os
+import threading
+import fear_and_greed
+import pandas as pd
+import requests
+import yfinance as yf
+from yfinance.exceptions import YFException, YFRateLimitError
+
+from db.crud import getSetting
+from fetchers.config import RECORDINGS_DIRECTORY, RECORDINGS_FILE_NAME, PRICE_HISTORY_PERIOD
+from fetchers.disk_cache import DiskCache
+from fetchers.network import isOffline
+from utils.constants.defaults import getDefaultSetting
+from utils.settings_utils import getChoiceSetting
+
+class ProviderError(Exception):
+    """
+    Raised when a market data provider cannot serve a request.
+    """
+
+class ProviderRateLimited(ProviderError):
+    """
+    Raised when the provider is throttling requests. The request can be retried after backing off.
+    """
+
+# Quote types holding other securities, whose holdings and sector weights can be looked through
+FUND_QUOTE_TYPES = ['ETF', 'MUTUALFUND']
+
+# Display names of the sector keys in yfinance fund data, matching the sector names of individual stocks
+FUND_SECTOR_NAMES = {
+    'realestate': 'Real Estate',
+    'consumer_cyclical': 'Consumer Cyclical',
+    'basic_materials': 'Basic Materials',
+    'consumer_defensive': 'Consumer Defensive',
+    'technology': 'Technology',
+    'communication_services': 'Communication Services',
+    'financial_services': 'Financial Services',
+    'utilities': 'Utilities',
+    'industrials': 'Industrials',
+    'energy': 'Energy',
+    'healthcare': 'Healthcare',
+}
+
+def toFloat(value):
+    """
+    Convert a pandas value to a float, with NaN and missing values as None
+    """
+    return None if value is None or pd.isna(value) else float(value)
+
+class MarketDataProvider:
+    """
+    Source of market data used by the fetchers.
+    Responses are plain dictionaries and lists so they can be cached and recorded as JSON.
+    """
+    name = None
+
+    def getTickerInfo(self, ticker):
+        """
+        Returns dictionary of ticker information in yfinance `info` format
+        """
+        raise NotImplementedError
+
+    def getLatestPrices(self, tickers):
+        """
+        Returns dictionary of ticker to {'ticker', 'price', 'regularMarketPreviousClose'} dictionaries.
+        Prices are `None` for tickers without recent closes.
+        """
+        raise NotImplementedError
+
+    def getPriceHistory(self, tickers, start, end):
+        """
+        Returns dictionary of ticker to list of daily {'date', 'open', 'high', 'low', 'close', 'adjClose'} dictionaries,
+        oldest first, for dates from `start` up to but excluding `end`. Dates are ISO 'YYYY-MM-DD' strings.
+        """
+        raise NotImplementedError
+
+    def getDividends(self, tickers, start):
+        """
+        Returns dictionary of ticker to list of {'date', 'amount'} dictionaries, oldest first,
+        with the per unit distribution for each ex-date on or after `start`. Dates are ISO 'YYYY-MM-DD' strings.
+        """
+        raise NotImplementedError
+
+    def getSplits(self, tickers, start):
+        """
+        Returns dictionary of ticker to list of {'date', 'ratio'} dictionaries, oldest first,
+        with the units received per unit held for each split on or after `start`, eg. 2.0 for a 2:1 split.
+        Dates are ISO 'YYYY-MM-DD' strings.
+        """
+        raise NotImplementedError
+
+    def getFundExposures(self, ticker):
+        """
+        Returns dictionary of exposure type ('sector', 'region', 'holding') to dictionary of name to weight,
+        as a fraction of the ticker's value. Weights of a type may sum to less than 1 when only part is known,
+        eg. a fund's top holdings. Individual stocks are fully exposed to themselves, their sector and their country.
+        """
+        raise NotImplementedError
+
+    def isValidTicker(self, ticker):
+        """
+        Returns True if the provider recognises the ticker
+        """
+        raise NotImplementedError
+
+    def getFearAndGreed(self):
+        """
+        Returns dictionary with the current CNN Fear and Greed Index `value` and `description`
+        """
+        raise NotImplementedError
+
+class YfinanceProvider(MarketDataProvider):
+    """
+    Live market data from Yahoo Finance via yfinance.
+    """
+    name = 'yfinance'
+
+    def getTickerInfo(self, ticker):
+        try:
+            return yf.Ticker(ticker).info
+        except YFRateLimitError as e:
+            raise ProviderRateLimited(str(e)) from e
+
+    def getLatestPrices(self, tickers):
+        try:
+            history = yf.download(
+                tickers,
+                period=PRICE_HISTORY_PERIOD,
+                interval='1d',
+                group_by='ticker',
+                auto_adjust=False,
+                progress=False,
+                threads=True
+            )
+        except YFRateLimitError as e:
+            raise ProviderRateLimited(str(e)) from e
+
+        prices = {}
+        for ticker in tickers:
+            try:
+                if isinstance(history.columns, pd.MultiIndex):
+                    closes = history[ticker]['Close'].dropna()
+                else:
+                    closes = history['Close'].dropna()
+            except KeyError:
+                closes = pd.Series(dtype=float)
+
+            prices[ticker] = {
+                'ticker': ticker,
+                'price': float(closes.iloc[-1]) if len(closes) > 0 else None,
+                'regularMarketPreviousClose': float(closes.iloc[-2]) if len(closes) > 1 else None
+            }
+
+        return prices
+
+    def getPriceHistory(self, tickers, start, end):
+        try:
+            history = yf.download(
+                tickers,
+                start=start,
+                end=end,
+                interval='1d',
+                group_by='ticker',
+                auto_adjust=False,
+                actions=False,
+                progress=False,
+                threads=True
+            )
+        except YFRateLimitError as e:
+            raise ProviderRateLimited(str(e)) from e
+
+        prices = {}
+        for ticker in tickers:
+            try:
+                bars = history[ticker] if isinstance(history.columns, pd.MultiIndex) else history
+            except KeyError:
+                prices[ticker] = []
+                continue
+
+            bars = bars.dropna(subset=['Close'])
+            prices[ticker] = [
+                {
+                    'date': date.strftime('%Y-%m-%d'),
+                    'open': toFloat(bar.get('Open')),
+                    'high': toFloat(bar.get('High')),
+                    'low': toFloat(bar.get('Low')),
+                    'close': toFloat(bar.get('Close')),
+                    'adjClose': toFloat(bar.get('Adj Close'))
+                }
+                for date, bar in bars.iterrows()
+            ]
+
+        return prices
+
+    def getDividends(self, tickers, start):
+        try:
+            history = yf.download(
+                tickers,
+                start=start,
+                interval='1d',
+                group_by='ticker',
+                auto_adjust=False,
+                actions=True,
+                progress=False,
+                threads=True
+            )
+        except YFRateLimitError as e:
+            raise ProviderRateLimited(str(e)) from e
+
+        dividends = {}
+        for ticker in tickers:
+            try:
+                amounts = history[ticker]['Dividends'] if isinstance(history.columns, pd.MultiIndex) else history['Dividends']
+            except KeyError:
+                dividends[ticker] = []
+                continue
+
+            amounts = amounts[amounts.fillna(0) > 0]
+            dividends[ticker] = [{'date': date.strftime('%Y-%m-%d'), 'amount': float(amount)} for date, amount in amounts.items()]
+
+        return dividends
+
+    def getSplits(self, tickers, start):
+        try:
+            history = yf.download(
+                tickers,
+                start=start,
+                interval='1d',
+                group_by='ticker',
+                auto_adjust=False,
+                actions=True,
+                progress=False,
+                threads=True
+            )
+        except YFRateLimitError as e:
+            raise ProviderRateLimited(str(e)) from e
+
+        splits = {}
+        for ticker in tickers:
+            try:
+                ratios = history[ticker]['Stock Splits'] if isinstance(history.columns, pd.MultiIndex) else history['Stock Splits']
+            except KeyError:
+                splits[ticker] = []
+                continue
+
+            ratios = ratios[ratios.fillna(0) > 0]
+            splits[ticker] = [{'date': date.strftime('%Y-%m-%d'), 'ratio': float(ratio)} for date, ratio in ratios.items()]
+
+        return splits
+
+    def getFundExposures(self, ticker):
+        try:
+            yfTicker = yf.Ticker(ticker)
+            info = yfTicker.info
+            if info.get('quoteType') not in FUND_QUOTE_TYPES:
+                return {
+                    'sector': {info['sector']: 1.0} if info.get('sector') else {},
+                    'region': {info['country']: 1.0} if info.get('country') else {},
+                    'holding': {ticker: 1.0}
+                }
+
+            try:
+                sectors = yfTicker.funds_data.sector_weightings
+                holdings = yfTicker.funds_data.top_holdings
+            except (YFException, KeyError):
+                # No look-through data published, so the fund only counts as itself
+                return {'sector': {}, 'region': {}, 'holding': {ticker: 1.0}}
+
+            # Yahoo publishes no regional breakdown for funds
+            return {
+                'sector': {
+                    FUND_SECTOR_NAMES.get(sector, sector.replace('_', ' ').title()): float(weight)
+                    for sector, weight in sectors.items() if toFloat(weight)
+                },
+                'region': {},
+                'holding': {
+                    symbol or row['Name']: float(row['Holding Percent'])
+                    for symbol, row in holdings.iterrows() if toFloat(row['Holding Percent'])
+                }
+            }
+        except YFRateLimitError as e:
+            raise ProviderRateLimited(str(e)) from e
+        except Exception as e:
+            # Network failures and responses not in the expected shape, so one ticker failing doesn't end the command
+            raise ProviderError(f"Could not fetch exposures for {ticker}: {e}") from e
+
+    def isValidTicker(self, ticker):
+        try:
+            yf.Ticker(ticker)
+            print("checking ticker: ", ticker)
+            return True
+        except:
+            return False
+
+    def getFearAndGreed(self):
+        try:
+            data = fear_and_greed.get()
+        except (requests.RequestException, KeyError, ValueError) as e:
+            # Network failures, error responses and responses not in the expected shape
+            raise ProviderError(f"Could not fetch the Fear and Greed Index: {e}") from e
+        if not data:
+            return None
+        return {'value': float(data.value), 'description': data.description}
+
+class RecordingProvider(MarketDataProvider):
+    """
+    Wraps another provider and records every response to disk for later replay.
+    Batched responses are recorded per ticker so they can be replayed for any subset of tickers.
+    """
+    name = 'record'
+
+    def __init__(self, provider, directory):
+        self.provider = provider
+        self.recordings = DiskCache(os.path.join(directory, RECORDINGS_FILE_NAME))
+
+    def getTickerInfo(self, ticker):
+        info = self.provider.getTickerInfo(ticker)
+        self.recordings.putMany({f"getTickerInfo:{ticker}": info})
+        return info
+
+    def getLatestPrices(self, tickers):
+        prices = self.provider.getLatestPrices(tickers)
+        self.recordings.putMany({f"getLatestPrices:{ticker}": price for ticker, price in prices.items()})
+        return prices
+
+    def getPriceHistory(self, tickers, start, end):
+        prices = self.provider.getPriceHistory(tickers, start, end)
+        recorded = self.recordings.getMany([f"getPriceHistory:{ticker}" for ticker in tickers])
+        updates = {}
+        for ticker, bars in prices.items():
+            # Merge with bars recorded for other date ranges so any range can be replayed
+            merged = {bar['date']: bar for bar in recorded.get(f"getPriceHistory:{ticker}", ([], None))[0]}
+            merged.update({bar['date']: bar for bar in bars})
+            updates[f"getPriceHistory:{ticker}"] = [merged[date] for date in sorted(merged)]
+        self.recordings.putMany(updates)
+        return prices
+
+    def getDividends(self, tickers, start):
+        dividends = self.provider.getDividends(tickers, start)
+        recorded = self.recordings.getMany([f"getDividends:{ticker}" for ticker in tickers])
+        updates = {}
+        for ticker, payments in dividends.items():
+            merged = {payment['date']: payment for payment in recorded.get(f"getDividends:{ticker}", ([], None))[0]}
+            merged.update({payment['date']: payment for payment in payments})
+            updates[f"getDividends:{ticker}"] = [merged[date] for date in sorted(merged)]
+        self.recordings.putMany(updates)
+        return dividends
+
+    def getSplits(self, tickers, start):
+        splits = self.provider.getSplits(tickers, start)
+        recorded = self.recordings.getMany([f"getSplits:{ticker}" for ticker in tickers])
+        updates = {}
+        for ticker, tickerSplits in splits.items():
+            merged = {split['date']: split for split in recorded.get(f"getSplits:{ticker}", ([], None))[0]}
+            merged.update({split['date']: split for split in tickerSplits})
+            updates[f"getSplits:{ticker}"] = [merged[date] for date in sorted(merged)]
+        self.recordings.putMany(updates)
+        return splits
+
+    def getFundExposures(self, ticker):
+        exposures = self.provider.getFundExposures(ticker)
+        self.recordings.putMany({f"getFundExposures:{ticker}": exposures})
+        return exposures
+
+    def isValidTicker(self, ticker):
+        isValid = self.provider.isValidTicker(ticker)
+        self.recordings.putMany({f"isValidTicker:{ticker}": isValid})
+        return isValid
+
+    def getFearAndGreed(self):
+        data = self.provider.getFearAndGreed()
+        self.recordings.putMany({"getFearAndGreed": data})
+        return data
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Serves responses previously captured by `RecordingProvider` without any network access.
+    """
+    name = 'replay'
+
+    def __init__(self, directory):
+        self.recordings = DiskCache(os.path.join(directory, RECORDINGS_FILE_NAME))
+
+    def _replay(self, key):
+        recorded = self.recordings.getMany([key])
+        if key not in recorded:
+            raise ProviderError(f"No recorded response for {key}")
+        return recorded[key][0]
+
+    def getTickerInfo(self, ticker):
+        return self._replay(f"getTickerInfo:{ticker}")
+
+    def getLatestPrices(self, tickers):
+        recorded = self.recordings.getMany([f"getLatestPrices:{ticker}" for ticker in tickers])
+        return {
+            ticker: recorded[f"getLatestPrices:{ticker}"][0]
+            if f"getLatestPrices:{ticker}" in recorded
+            else {'ticker': ticker, 'price': None, 'regularMarketPreviousClose': None}
+            for ticker in tickers
+        }
+
+    def getPriceHistory(self, tickers, start, end):
+        recorded = self.recordings.getMany([f"getPriceHistory:{ticker}" for ticker in tickers])
+        return {
+            ticker: [
+                bar for bar in recorded.get(f"getPriceHistory:{ticker}", ([], None))[0]
+                if str(start) <= bar['date'] < str(end)
+            ]
+            for ticker in tickers
+        }
+
+    def getDividends(self, tickers, start):
+        recorded = self.recordings.getMany([f"getDividends:{ticker}" for ticker in tickers])
+        return {
+            ticker: [payment for payment in recorded.get(f"getDividends:{ticker}", ([], None))[0] if payment['date'] >= str(start)]
+            for ticker in tickers
+        }
+
+    def getSplits(self, tickers, start):
+        recorded = self.recordings.getMany([f"getSplits:{ticker}" for ticker in tickers])
+        return {
+            ticker: [split for split in recorded.get(f"getSplits:{ticker}", ([], None))[0] if split['date'] >= str(start)]
+            for ticker in tickers
+        }
+
+    def getFundExposures(self, ticker):
+        return self._replay(f"getFundExposures:{ticker}")
+
+    def isValidTicker(self, ticker):
+        try:
+            return self._replay(f"isValidTicker:{ticker}")
+        except ProviderError:
+            return False
+
+    def getFearAndGreed(self):
+        return self._replay("getFearAndGreed")
+
+class OfflineProvider(MarketDataProvider):
+    """
+    Used in offline mode. Fails every request straight away instead of waiting on network timeouts.
+    """
+    name = 'offline'
+
+    def getTickerInfo(self, ticker):
+        raise ProviderError("Offline")
+
+    def getLatestPrices(self, tickers):
+        raise ProviderError("Offline")
+
+    def getPriceHistory(self, tickers, start, end):
+        raise ProviderError("Offline")
+
+    def getDividends(self, tickers, start):
+        raise ProviderError("Offline")
+
+    def getSplits(self, tickers, start):
+        raise ProviderError("Offline")
+
+    def getFundExposures(self, ticker):
+        raise ProviderError("Offline")
+
+    def isValidTicker(self, ticker):
+        # Can't be checked offline, so tickers are accepted as entered
+        return True
+
+    def getFearAndGreed(self):
+        raise ProviderError("Offline")
+
+offlineProvider = OfflineProvider()
+
+# Live providers selectable through the `market_data_provider` setting
+PROVIDERS = {
+    YfinanceProvider.name: YfinanceProvider,
+}
+
+providerInstances = {}
+providerInstancesLock = threading.Lock()
+
+def getProvider(conn):
+    """
+    Get the market data provider configured in settings.
+    - 'yfinance': live data
+    - 'record': live data, with every response recorded to the recordings directory
+    - 'replay': recorded responses only, no network access
+
+    In offline mode, see `isOffline`, live providers are replaced by `OfflineProvider`.
+
+    Params:
+    - conn: connection to database
+    """
+    mode = getSetting(conn, 'market_data_provider', getDefaultSetting('market_data_provider')).lower()
+    directory = getSetting(conn, 'provider_recordings_directory', getDefaultSetting('provider_recordings_directory')) or RECORDINGS_DIRECTORY
+
+    if mode not in PROVIDERS and mode not in [RecordingProvider.name, ReplayProvider.name]:
+        print(f"\nUnknown market data provider '{mode}'. Using yfinance.")
+        mode = YfinanceProvider.name
+
+    if isOffline(conn):
+        return offlineProvider
+
+    key = (mode, directory)
+    with providerInstancesLock:
+        if key not in providerInstances:
+            if mode == RecordingProvider.name:
+                providerInstances[key] = RecordingProvider(YfinanceProvider(), directory)
+            elif mode == ReplayProvider.name:
+                providerInstances[key] = ReplayProvider(directory)
+            else:
+                providerInstances[key] = PROVIDERS[mode]()
+        return providerInstances[key]
+
+def isLiveProvider(conn):
+    """
+    Check if the live yfinance provider is configured rather than the record or replay provider.
+    Only live responses belong in the quote and metadata caches: replayed data must never be served as live later,
+    and recording needs every request to reach the provider.
+
+    Params:
+    - conn: connection to database
+    """
+    return getChoiceSetting(conn, 'market_data_provider') == YfinanceProvider.name
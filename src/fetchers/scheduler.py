@@ -0,0 +1,202 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from fetchers.config import (
+    FETCH_MAX_RETRIES,
+    FETCH_BACKOFF_BASE_SECONDS,
+    FETCH_BACKOFF_MAX_SECONDS
+)
+from fetchers.providers import ProviderRateLimited
+from utils.settings_utils import getIntegerSetting
+
+# Priority lanes, lower runs first. Queued interactive requests always run before queued background ones.
+INTERACTIVE = 0
+BACKGROUND = 1
+
+class TokenBucket:
+    """
+    Token bucket rate limiter shared by every request sent to the provider.
+    Tokens refill at `rate` per second up to `capacity`, allowing short bursts.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updatedAt = time.monotonic()
+        self._resumeAt = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a token is available and take it.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updatedAt) * self.rate)
+                self._updatedAt = now
+
+                if now < self._resumeAt:
+                    wait = self._resumeAt - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def configure(self, rate, capacity):
+        """
+        Change the refill rate and burst capacity, keeping tokens already earned up to the new capacity.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(capacity, self._tokens + (now - self._updatedAt) * self.rate)
+            self._updatedAt = now
+            self.rate = rate
+            self.capacity = capacity
+
+    def pause(self, seconds):
+        """
+        Stop handing out tokens for `seconds`, eg. after the provider throttles a request.
+        """
+        with self._lock:
+            self._resumeAt = max(self._resumeAt, time.monotonic() + seconds)
+            self._tokens = 0
+
+class RequestScheduler:
+    """
+    Central queue for provider requests. Requests are run by a pool of daemon workers,
+    highest priority lane first, each taking a token from a shared `TokenBucket` before it is sent.
+    The pool size and rate can be changed in place with `configure`.
+
+    Throttled requests, those raising `ProviderRateLimited` or returning an empty response,
+    are retried with jittered exponential backoff, pausing the whole bucket so other
+    requests don't keep hitting the provider while it is throttling.
+    """
+    def __init__(self, workers, requestsPerSecond):
+        self.workers = 0
+        self.bucket = TokenBucket(requestsPerSecond, max(1, requestsPerSecond))
+        self._queue = []
+        self._sequence = itertools.count()
+        self._workerNames = itertools.count()
+        self._running = 0
+        self._available = threading.Condition()
+        self.configure(workers, requestsPerSecond)
+
+    def configure(self, workers, requestsPerSecond):
+        """
+        Resize the worker pool and change the rate limit. Queued requests are kept,
+        and workers beyond the new pool size exit once they finish their current request.
+
+        Params:
+        - workers: number of requests sent at once
+        - requestsPerSecond: maximum requests sent per second
+        """
+        self.bucket.configure(requestsPerSecond, max(1, requestsPerSecond))
+        with self._available:
+            self.workers = workers
+            while self._running < workers:
+                self._running += 1
+                threading.Thread(target=self._work, name=f'fetch-worker-{next(self._workerNames)}', daemon=True).start()
+            self._available.notify_all()
+
+    def submit(self, fn, *args, priority=INTERACTIVE, isEmpty=None):
+        """
+        Queue a provider request.
+
+        Params:
+        - fn: function sending the request
+        - args: arguments for `fn`
+        - priority: `INTERACTIVE` or `BACKGROUND`. Default: `INTERACTIVE`
+        - isEmpty: function taking the response and returning True if it is empty and should be retried. Default: None
+
+        Returns:
+        - `Future` resolving to the response. An empty response is returned as is once retries run out.
+        """
+        future = Future()
+        with self._available:
+            heapq.heappush(self._queue, (priority, next(self._sequence), fn, args, isEmpty, future))
+            self._available.notify()
+        return future
+
+    def cancelQueued(self, priority):
+        """
+        Cancel requests in a priority lane that haven't been sent yet. Requests already being sent are left to finish.
+
+        Params:
+        - priority: `INTERACTIVE` or `BACKGROUND`
+        """
+        with self._available:
+            for queuedPriority, sequence, fn, args, isEmpty, future in self._queue:
+                if queuedPriority == priority:
+                    future.cancel()
+
+    def _work(self):
+        while True:
+            with self._available:
+                while not self._queue and self._running <= self.workers:
+                    self._available.wait()
+                if self._running > self.workers:
+                    self._running -= 1
+                    return
+                priority, sequence, fn, args, isEmpty, future = heapq.heappop(self._queue)
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                future.set_result(self._send(fn, args, isEmpty))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def _send(self, fn, args, isEmpty):
+        """
+        Send a request, retrying throttled attempts with backoff.
+        """
+        for attempt in range(FETCH_MAX_RETRIES + 1):
+            self.bucket.acquire()
+            try:
+                response = fn(*args)
+                if isEmpty is None or not isEmpty(response) or attempt == FETCH_MAX_RETRIES:
+                    return response
+            except ProviderRateLimited:
+                if attempt == FETCH_MAX_RETRIES:
+                    raise
+
+            self.bucket.pause(getBackoffDelay(attempt))
+
+def getBackoffDelay(attempt):
+    """
+    Seconds to back off before retrying a throttled request, doubling each attempt
+    with full jitter so sessions throttled together don't retry in lockstep.
+
+    Params:
+    - attempt: number of attempts already made, from 0
+    """
+    return random.uniform(0, min(FETCH_BACKOFF_MAX_SECONDS, FETCH_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+scheduler = None
+schedulerLock = threading.Lock()
+
+def getScheduler(conn):
+    """
+    Get the request scheduler shared by every provider request, reconfigured to the current
+    `fetch_concurrency` and `requests_per_second` settings.
+
+    Params:
+    - conn: connection to database
+    """
+    global scheduler
+    workers = max(1, getIntegerSetting(conn, 'fetch_concurrency'))
+    requestsPerSecond = max(1, getIntegerSetting(conn, 'requests_per_second'))
+    with schedulerLock:
+        if scheduler is None:
+            scheduler = RequestScheduler(workers, requestsPerSecond)
+        elif (scheduler.workers, scheduler.bucket.rate) != (workers, requestsPerSecond):
+            scheduler.configure(workers, requestsPerSecond)
+        return scheduler
@@ -0,0 +1,128 @@
+import threading
+from concurrent.futures import Future
+
+class SessionQuoteStore:
+    """
+    Quotes of one kind fetched during this session, shared by every command.
+    Price-only and full quotes are held in separate stores, so a price-only quote never replaces a full one.
+
+    Requests for tickers that are already being fetched wait on the in-flight fetch
+    instead of starting another one, so concurrent or back-to-back commands with
+    overlapping tickers only send the missing tickers to the network.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._quotes = {}
+        self._inflight = {}
+
+    def fetch(self, tickers, fetchMissing, isUsable):
+        """
+        Get quotes for tickers, fetching only those not already held or in flight.
+
+        Params:
+        - tickers: list of tickers
+        - fetchMissing: function taking a list of tickers and returning a dictionary of
+          ticker to (quote, fetchedAt) tuples
+        - isUsable: function taking (quote, fetchedAt) and returning True if the quote can be served
+
+        Returns:
+        - dictionary of ticker to (quote, fetchedAt) tuples. Tickers `fetchMissing` could not resolve are omitted.
+        """
+        results = {}
+        waiting = {}
+        claimed = []
+
+        with self._lock:
+            for ticker in tickers:
+                entry = self._quotes.get(ticker)
+                if entry is not None and isUsable(*entry):
+                    results[ticker] = entry
+                elif ticker in self._inflight:
+                    waiting[ticker] = self._inflight[ticker]
+                elif ticker not in claimed:
+                    self._inflight[ticker] = Future()
+                    claimed.append(ticker)
+
+        if claimed:
+            results.update(self._fetchClaimed(claimed, fetchMissing))
+
+        # Tickers another request was already fetching. If that fetch failed or
+        # did not include the fields this request needs, fetch them directly.
+        retryTickers = []
+        for ticker, future in waiting.items():
+            try:
+                entry = future.result()
+            except Exception:
+                entry = None
+
+            if entry is not None and isUsable(*entry):
+                results[ticker] = entry
+            else:
+                retryTickers.append(ticker)
+
+        if retryTickers:
+            fetched = fetchMissing(retryTickers)
+            self.putMany(fetched)
+            results.update(fetched)
+
+        return results
+
+    def _fetchClaimed(self, tickers, fetchMissing):
+        """
+        Fetch tickers this request claimed and publish the results to any waiting requests.
+        """
+        try:
+            fetched = fetchMissing(tickers)
+        except BaseException as e:
+            with self._lock:
+                for ticker in tickers:
+                    self._inflight.pop(ticker).set_exception(e)
+            raise
+
+        with self._lock:
+            for ticker in tickers:
+                entry = fetched.get(ticker)
+                if entry is not None:
+                    self._keepNewest(ticker, entry)
+                self._inflight.pop(ticker).set_result(entry)
+
+        return fetched
+
+    def getMany(self, tickers):
+        """
+        Get quotes held for tickers without fetching, regardless of whether they are still usable.
+
+        Params:
+        - tickers: list of tickers
+
+        Returns:
+        - dictionary of ticker to (quote, fetchedAt) tuples for tickers held this session
+        """
+        with self._lock:
+            return {ticker: self._quotes[ticker] for ticker in tickers if ticker in self._quotes}
+
+    def putMany(self, entries):
+        """
+        Store quotes fetched outside of `fetch`.
+
+        Params:
+        - entries: dictionary of ticker to (quote, fetchedAt) tuples
+        """
+        with self._lock:
+            for ticker, entry in entries.items():
+                self._keepNewest(ticker, entry)
+
+    def _keepNewest(self, ticker, entry):
+        """
+        Hold a quote unless a more recently fetched one is already held. Must be called with the lock held.
+        """
+        current = self._quotes.get(ticker)
+        if current is None or current[1] <= entry[1]:
+            self._quotes[ticker] = entry
+
+    def clear(self):
+        """
+        Forget all quotes held for this session.
+        """
+        with self._lock:
+            self._quotes = {}
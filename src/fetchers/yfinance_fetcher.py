@@ -1,23 +1,48 @@
 import json
-import yfinance as yf
+import time
+import threading
+import pandas as pd
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError, as_completed
 
+from db.crud import getQuotesCache, upsertQuotesCache
+from db.db_handler import get_connection
+from fetchers.async_fetcher import isFetchCancelled
 from utils.yfinance_utils import makeTickerString
-from db.crud import getSetting
-from utils.constants.defaults import getDefaultSetting
+from utils.settings_utils import getBooleanSetting, getIntegerSetting
+from fetchers.config import (
+    QUOTE_CACHE_FILE,
+    PRICE_CACHE_FILE,
+    PRICE_QUOTE_KEY_PREFIX,
+    QUOTE_CACHE_TTLS,
+    DEFAULT_QUOTE_CACHE_TTL,
+    MAX_STALE_QUOTE_AGE,
+    METADATA_CACHE_FILE,
+    QUOTE_STATUS_STALE,
+    QUOTE_STATUS_LAST_KNOWN,
+    QUOTE_STATUS_UNAVAILABLE,
+    QUOTE_STATUS_OFFLINE
+)
+from fetchers.disk_cache import DiskCache
+from fetchers.network import isOffline
+from fetchers.providers import ProviderError, getProvider, isLiveProvider
+from fetchers.scheduler import INTERACTIVE, BACKGROUND, getScheduler
+from fetchers.session_cache import SessionQuoteStore
 
-def isValidYfinanceTicker(ticker:str):
+quoteCache = DiskCache(QUOTE_CACHE_FILE)
+priceCache = DiskCache(PRICE_CACHE_FILE)
+metadataCache = DiskCache(METADATA_CACHE_FILE)
+sessionQuotes = SessionQuoteStore()
+sessionPrices = SessionQuoteStore()
+
+def isValidYfinanceTicker(conn, ticker:str):
     """
-    Check if ticker is valid in yfinance
+    Check if ticker is valid with the configured market data provider
 
     Params:
+    - conn: connection to database
     - ticker: ticker to check
     """
-    try:
-        yf.Ticker(ticker)
-        print("checking ticker: ", ticker)
-        return True
-    except:
-        return False
+    return getProvider(conn).isValidTicker(ticker)
 
 def getTickerPrice(tickerInfo):
     """
@@ -53,56 +78,864 @@ def getBeta(tickerInfo):
     else:
         return None
 
-def getYfinanceTickerData(conn, tickers):
+# Ticker information field to the yfinance info key it is read from, or a function of the info dictionary
+QUOTE_FIELD_SOURCES = {
+    'price': getTickerPrice,
+    'fullName': 'longName',
+    'shortName': 'shortName',
+    'currency': 'currency',
+    'fullExchangeName': 'fullExchangeName',
+    'quoteType': 'quoteType',
+    'marketState': 'marketState',
+    'yield': 'yield',
+    'peRatio': 'trailingPE',
+    'priceToBook': 'priceToBook',
+    'eps': 'epsTrailingTwelveMonths',
+    'volume': 'volume',
+    'beta': getBeta,
+    'ytdReturn': 'ytdReturn',
+    'threeYrReturn': 'threeYearAverageReturn',
+    'fiveYrReturn': 'fiveYearAverageReturn',
+    'fiftyTwoWkLow': 'fiftyTwoWeekLow',
+    'fiftyTwoWkHigh': 'fiftyTwoWeekHigh',
+    'fiftyDayAvg': 'fiftyDayAverage',
+    'regularMarketPrice': 'regularMarketPrice',
+    'regularMarketPreviousClose': 'regularMarketPreviousClose',
+    'twoHundredDayAvg': 'twoHundredDayAverage',
+    'fiftyTwoWeekChangePercent': 'fiftyTwoWeekChangePercent',
+    'fiftyTwoWeekLowChangePercent': 'fiftyTwoWeekLowChangePercent',
+    'fiftyTwoWeekHighChangePercent': 'fiftyTwoWeekHighChangePercent',
+    'twoHundredDayAverageChangePercent': 'twoHundredDayAverageChangePercent'
+}
+QUOTE_FIELD_DEFAULTS = {'yield': 0}
+QUOTE_FIELDS = ['ticker'] + list(QUOTE_FIELD_SOURCES.keys())
+TEXT_QUOTE_FIELDS = ['ticker', 'fullName', 'shortName', 'currency', 'fullExchangeName', 'quoteType', 'marketState']
+# Fields describing the quote itself rather than the ticker:
+# - fetchedAt: epoch seconds the quote was fetched at
+# - quoteStatus: `None` for live quotes, otherwise one of the `QUOTE_STATUS_*` values in `fetchers.config`
+QUOTE_METADATA_FIELDS = ['fetchedAt', 'quoteStatus']
+NUMERIC_QUOTE_FIELDS = [field for field in QUOTE_FIELDS if field not in TEXT_QUOTE_FIELDS] + ['fetchedAt']
+PRICE_FIELDS = ['ticker', 'price', 'regularMarketPreviousClose']
+# Fields that almost never change, served from the metadata cache rather than with each quote
+METADATA_FIELDS = ['fullName', 'shortName', 'currency', 'fullExchangeName', 'quoteType']
+
+def buildTickerData(ticker, info):
+    """
+    Build the ticker information dictionary returned by `getYfinanceTickerData`
+
+    Params:
+    - ticker: ticker the info belongs to
+    - info: object with ticker information from yfinance
+    """
+    data = {'ticker': ticker}
+    for field, source in QUOTE_FIELD_SOURCES.items():
+        if callable(source):
+            data[field] = source(info)
+        else:
+            data[field] = info.get(source, QUOTE_FIELD_DEFAULTS.get(field))
+    return data
+
+def projectQuote(quote, fields):
+    """
+    Reduce a ticker information dictionary to the requested fields
+
+    Params:
+    - quote: ticker information dictionary
+    - fields: list of fields to keep
+    """
+    return {field: quote.get(field) for field in fields}
+
+def makeQuoteFrame(data, fields):
+    """
+    Convert ticker information dictionaries into a columnar frame indexed by ticker.
+    Numeric fields are stored as float columns with missing values as NaN, so derived columns can be computed vectorised.
+    Text fields keep `None` for missing values.
+
+    Params:
+    - data: dictionary with ticker to information_dictionary key value mappings
+    - fields: list of fields to include as columns
+    """
+    columns = [field for field in fields if field != 'ticker']
+    frame = pd.DataFrame.from_dict(data, orient='index').reindex(columns=columns)
+    frame.index.name = 'ticker'
+    for field in columns:
+        if field in NUMERIC_QUOTE_FIELDS:
+            frame[field] = pd.to_numeric(frame[field], errors='coerce').astype(float)
+        else:
+            frame[field] = frame[field].astype(object).where(frame[field].notna(), None)
+    return frame
+
+def getQuoteCacheTtl(marketState):
+    """
+    Get number of seconds a cached quote stays fresh for given the market state it was fetched in.
+    Quotes fetched during regular trading expire quickly, closed market quotes last hours.
+
+    Params:
+    - marketState: yfinance `marketState` value eg. 'REGULAR', 'CLOSED'
+    """
+    return QUOTE_CACHE_TTLS.get(marketState, DEFAULT_QUOTE_CACHE_TTL)
+
+def isQuoteFresh(quote, fetchedAt, now=None):
+    """
+    Check if a cached quote is still within its TTL
+
+    Params:
+    - quote: ticker information dictionary from `buildTickerData`
+    - fetchedAt: epoch seconds the quote was fetched at
+    - now: epoch seconds to compare against. Default: current time
+    """
+    now = now if now is not None else time.time()
+    return now - fetchedAt < getQuoteCacheTtl(quote.get('marketState'))
+
+def isQuoteUsable(quote, fetchedAt, requiredFields, now=None):
+    """
+    Check if a cached quote can be served: it must be fresh, priced and contain every required field
+
+    Params:
+    - quote: ticker information dictionary
+    - fetchedAt: epoch seconds the quote was fetched at
+    - requiredFields: fields the quote must contain
+    - now: epoch seconds to compare against. Default: current time
+    """
+    return (
+        quote.get('price') is not None
+        and all(field in quote for field in requiredFields)
+        and isQuoteFresh(quote, fetchedAt, now)
+    )
+
+def getQuoteCaches(priceOnly):
     """
-    Get data for tickers from Yahoo Finance API
+    Get the on-disk caches a quote lookup reads, the first being the one its fetched quotes are written to.
+    Price-only quotes are cached apart from full quotes, so neither kind of fetch overwrites the fields the other needs.
+    Full quotes carry prices too, so price lookups are also served from them.
+
+    Params:
+    - priceOnly: True for `getYfinancePriceData` lookups
+    """
+    return [priceCache, quoteCache] if priceOnly else [quoteCache]
+
+def getSharedQuoteKey(ticker, priceOnly):
+    """
+    Get the `quotes_cache` key a ticker's quote is stored under, price-only quotes being kept apart as in `getQuoteCaches`
+    """
+    return f"{PRICE_QUOTE_KEY_PREFIX}{ticker}" if priceOnly else ticker
+
+def getSessionStores(priceOnly):
+    """
+    Get the session stores a quote lookup reads, the first being the one its fetched quotes are held in, as in `getQuoteCaches`
+
+    Params:
+    - priceOnly: True for `getYfinancePriceData` lookups
+    """
+    return [sessionPrices, sessionQuotes] if priceOnly else [sessionQuotes]
+
+def getSessionQuotes(tickers, isUsable, priceOnly=False):
+    """
+    Get usable quotes held this session, the most recent of each ticker's stores, see `getSessionStores`
+
+    Params:
+    - tickers: list of tickers
+    - isUsable: function taking (quote, fetchedAt) and returning True if the quote can be served
+    - priceOnly: also serve price-only quotes. Default: False
+
+    Returns:
+    - dictionary of ticker to (quote, fetchedAt) tuples
+    """
+    return newestEntries([
+        {ticker: entry for ticker, entry in store.getMany(tickers).items() if isUsable(*entry)}
+        for store in getSessionStores(priceOnly)
+    ])
+
+def newestEntries(sources):
+    """
+    Merge dictionaries of ticker to (quote, fetchedAt) tuples, keeping the most recently fetched entry of each ticker
+    """
+    entries = {}
+    for source in sources:
+        for ticker, entry in source.items():
+            if ticker not in entries or entries[ticker][1] <= entry[1]:
+                entries[ticker] = entry
+    return entries
+
+def getCachedQuotes(tickers, requiredFields=QUOTE_FIELDS, priceOnly=False):
+    """
+    Get usable quotes from the on-disk quote caches
+
+    Params:
+    - tickers: list of tickers
+    - requiredFields: fields a cached quote must contain to be used. Default: all `QUOTE_FIELDS`
+    - priceOnly: also serve price-only quotes, see `getQuoteCaches`. Default: False
+
+    Returns:
+    - dictionary of ticker to (quote, fetchedAt) tuples for tickers with usable cached quotes
+    """
+    now = time.time()
+    return newestEntries([
+        {ticker: entry for ticker, entry in cache.getMany(tickers).items() if isQuoteUsable(*entry, requiredFields, now)}
+        for cache in getQuoteCaches(priceOnly)
+    ])
+
+def getSharedEntries(conn, tickers, priceOnly=False):
+    """
+    Get the quotes stored for tickers in the `quotes_cache` table shared by every session using the database, however old.
+    Price lookups read both the price-only and full quote of each ticker in the same query, keeping the most recent.
+
+    Params:
+    - conn: connection to database
+    - tickers: list of tickers
+    - priceOnly: also read price-only quotes, see `getQuoteCaches`. Default: False
+
+    Returns:
+    - dictionary of ticker to (quote, fetchedAt) tuples for tickers with a stored quote
+    """
+    keyTickers = {ticker: ticker for ticker in tickers}
+    if priceOnly:
+        keyTickers.update({getSharedQuoteKey(ticker, True): ticker for ticker in tickers})
+
+    stored = getQuotesCache(conn, list(keyTickers.keys()))
+    return newestEntries([{keyTickers[key]: entry} for key, entry in stored.items()])
+
+def getSharedQuotes(sharedEntries, tickers, requiredFields):
+    """
+    Get usable quotes for tickers from entries read from the shared `quotes_cache` table
+
+    Params:
+    - sharedEntries: dictionary of ticker to (quote, fetchedAt) tuples from `getSharedEntries`
+    - tickers: list of tickers
+    - requiredFields: fields a shared quote must contain to be used
+
+    Returns:
+    - dictionary of ticker to (quote, fetchedAt) tuples for tickers with usable shared quotes
+    """
+    now = time.time()
+    return {
+        ticker: sharedEntries[ticker]
+        for ticker in tickers
+        if ticker in sharedEntries and isQuoteUsable(*sharedEntries[ticker], requiredFields, now)
+    }
+
+def storeSharedQuotes(quotes, fetchedAt, debug=False):
+    """
+    Write fetched quotes to the shared `quotes_cache` table.
+    Fetches can finish on a background thread, so this uses its own database connection.
+
+    Params:
+    - quotes: dictionary of `getSharedQuoteKey` key to quote
+    - fetchedAt: epoch seconds the quotes were fetched at
+    - debug: print write failures. Default: False
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        upsertQuotesCache(conn, quotes, fetchedAt)
+    except (Exception, SystemExit) as e:
+        if debug:
+            print(f"\nCould not write the shared quote cache: {e}")
+    finally:
+        if conn is not None:
+            conn.close()
+
+def getLastKnownQuotes(tickers, requiredFields, sharedEntries=None, priceOnly=False):
+    """
+    Get the most recent priced quotes held this session, in the on-disk quote caches
+    or in `sharedEntries` read from the shared `quotes_cache` table, however old.
+
+    Params:
+    - tickers: list of tickers
+    - requiredFields: fields a quote must contain to be used
+    - sharedEntries: dictionary of ticker to (quote, fetchedAt) tuples from `getSharedEntries`. Default: None (skip the shared cache)
+    - priceOnly: also serve price-only quotes, see `getQuoteCaches`. Default: False
+
+    Returns:
+    - dictionary of ticker to (quote, fetchedAt) tuples for tickers with a previous quote
+    """
+    sources = [cache.getMany(tickers) for cache in getQuoteCaches(priceOnly)]
+    sources += [store.getMany(tickers) for store in getSessionStores(priceOnly)]
+    if sharedEntries is not None:
+        sources.append({ticker: sharedEntries[ticker] for ticker in tickers if ticker in sharedEntries})
+
+    hasFields = lambda quote: quote.get('price') is not None and all(field in quote for field in requiredFields)
+    return newestEntries([{ticker: entry for ticker, entry in source.items() if hasFields(entry[0])} for source in sources])
+
+def getStaleQuotes(tickers, requiredFields, sharedEntries=None, priceOnly=False):
+    """
+    Get quotes past their TTL that are otherwise usable, from the same sources as `getLastKnownQuotes`.
+    Quotes older than `MAX_STALE_QUOTE_AGE` are left out, to be fetched before they are shown.
+
+    Params:
+    - tickers: list of tickers
+    - requiredFields: fields a stale quote must contain to be used
+    - sharedEntries: dictionary of ticker to (quote, fetchedAt) tuples from `getSharedEntries`. Default: None (skip the shared cache)
+    - priceOnly: also serve price-only quotes, see `getQuoteCaches`. Default: False
+
+    Returns:
+    - dictionary of ticker to (quote, fetchedAt) tuples for tickers with stale quotes
+    """
+    now = time.time()
+    return {
+        ticker: (quote, fetchedAt)
+        for ticker, (quote, fetchedAt) in getLastKnownQuotes(tickers, requiredFields, sharedEntries, priceOnly).items()
+        if not isQuoteFresh(quote, fetchedAt, now) and now - fetchedAt < MAX_STALE_QUOTE_AGE
+    }
+
+def withQuoteStatus(entries, status):
+    """
+    Copy (quote, fetchedAt) entries with `quoteStatus` set on each quote
+    """
+    return {ticker: ({**quote, 'quoteStatus': status}, fetchedAt) for ticker, (quote, fetchedAt) in entries.items()}
+
+def markUnpriced(quote):
+    """
+    Mark a fetched quote without a price, eg. for a delisted ticker, as `QUOTE_STATUS_UNAVAILABLE`
+    """
+    return {**quote, 'quoteStatus': QUOTE_STATUS_UNAVAILABLE} if quote.get('price') is None else quote
+
+def getFetchDeadline(conn):
+    """
+    Get the deadline for a command's quote fetches from the `fetch_timeout_seconds` setting.
+
+    Params:
+    - conn: connection to database
+
+    Returns:
+    - `time.monotonic()` value to stop waiting for quotes at, or None if the budget is disabled (0)
+    """
+    timeout = getIntegerSetting(conn, 'fetch_timeout_seconds')
+    return time.monotonic() + timeout if timeout > 0 else None
+
+def fetchBeforeDeadline(tickers, fetch, deadline, onResolved=None):
+    """
+    Run a quote fetch, giving up waiting for it at the deadline. The fetch keeps running on
+    a daemon thread after the deadline, so quotes arriving late still reach the caches.
+
+    Params:
+    - tickers: list of tickers
+    - fetch: function taking (tickers, onResolved) and returning a dictionary of ticker to (quote, fetchedAt) tuples.
+      It calls `onResolved(ticker, entry)` as each ticker resolves.
+    - deadline: `time.monotonic()` value to stop waiting at, or None to wait for every ticker
+    - onResolved: function also called with (ticker, entry) as each ticker resolves, including after the deadline. Default: None
+
+    Returns:
+    - dictionary of ticker to (quote, fetchedAt) tuples for tickers resolved in time.
+      If the provider fails, the tickers resolved before it failed.
+    """
+    resolved = {}
+    resolvedLock = threading.Lock()
+
+    def record(ticker, entry):
+        with resolvedLock:
+            resolved[ticker] = entry
+        if onResolved is not None:
+            onResolved(ticker, entry)
+
+    if deadline is None:
+        try:
+            return fetch(tickers, record)
+        except ProviderError as e:
+            print(f"\nCould not fetch quotes: {e}")
+            with resolvedLock:
+                return dict(resolved)
+
+    result = Future()
+
+    def run():
+        try:
+            result.set_result(fetch(tickers, record))
+        except BaseException as e:
+            result.set_exception(e)
+
+    threading.Thread(target=run, name='quote-fetch', daemon=True).start()
+    try:
+        return result.result(timeout=max(0, deadline - time.monotonic()))
+    except ProviderError as e:
+        print(f"\nCould not fetch quotes: {e}")
+    except FuturesTimeoutError:
+        pass
+
+    with resolvedLock:
+        return dict(resolved)
+
+def getOfflineQuotes(tickers, requiredFields, sharedEntries=None, priceOnly=False):
+    """
+    Serve quotes without any network access. Quotes still within their TTL are served as live,
+    older ones are marked `QUOTE_STATUS_OFFLINE` and tickers never quoted `QUOTE_STATUS_UNAVAILABLE`.
+
+    Params:
+    - tickers: list of tickers
+    - requiredFields: fields a quote must contain to be used
+    - sharedEntries: dictionary of ticker to (quote, fetchedAt) tuples from `getSharedEntries`. Default: None (skip the shared cache)
+    - priceOnly: also serve price-only quotes, see `getQuoteCaches`. Default: False
+
+    Returns:
+    - dictionary of ticker to (quote, fetchedAt) tuples
+    """
+    now = time.time()
+    lastKnown = getLastKnownQuotes(tickers, requiredFields, sharedEntries, priceOnly)
+    entries = {ticker: entry for ticker, entry in lastKnown.items() if isQuoteFresh(*entry, now)}
+    entries.update(withQuoteStatus({ticker: entry for ticker, entry in lastKnown.items() if ticker not in entries}, QUOTE_STATUS_OFFLINE))
+    entries.update({
+        ticker: ({'ticker': ticker, 'price': None, 'quoteStatus': QUOTE_STATUS_UNAVAILABLE}, None)
+        for ticker in tickers if ticker not in lastKnown
+    })
+    return entries
+
+def withFetchedAt(quote, fetchedAt):
+    """
+    Copy of a quote with the epoch seconds it was fetched at added as `fetchedAt`
+    """
+    return {**quote, 'fetchedAt': fetchedAt}
+
+def makeResolvedNotifier(onResolved):
+    """
+    Wrap an `onResolved` callback so it is called at most once per ticker and not at all once closed,
+    so quotes arriving after a command has moved on are ignored. Calls are serialised, so the
+    callback can print without interleaving.
+
+    Params:
+    - onResolved: function taking (ticker, (quote, fetchedAt)), or None
+
+    Returns:
+    - (notify, close) functions. `notify` takes the same arguments as `onResolved`
+    """
+    notified = set()
+    closed = threading.Event()
+    lock = threading.Lock()
+
+    def notify(ticker, entry):
+        if onResolved is None:
+            return
+        with lock:
+            if closed.is_set() or ticker in notified:
+                return
+            notified.add(ticker)
+            onResolved(ticker, entry)
+
+    def close():
+        with lock:
+            closed.set()
+
+    return notify, close
+
+def refreshQuotesInBackground(tickers, staleEntries, refresh, onRefresh, debug=False):
+    """
+    Refresh stale quotes on a daemon thread and pass the fresh quotes to `onRefresh`.
+
+    Params:
+    - tickers: list of tickers to refresh
+    - staleEntries: dictionary of ticker to the stale (quote, fetchedAt) tuples already served
+    - refresh: function taking a list of tickers and returning a dictionary of ticker to (quote, fetchedAt) tuples
+    - onRefresh: function taking (stale, refreshed) dictionaries of ticker to quote, each quote including `fetchedAt`
+    - debug: print refresh failures. Default: False
+    """
+    def run():
+        try:
+            entries = refresh(tickers)
+        except (Exception, SystemExit) as e:
+            if debug:
+                print(f"\nBackground quote refresh failed: {e}")
+            return
+
+        refreshed = {
+            ticker: withFetchedAt(quote, fetchedAt)
+            for ticker, (quote, fetchedAt) in entries.items()
+            if quote.get('price') is not None
+        }
+        if refreshed:
+            stale = {ticker: withFetchedAt(*staleEntries[ticker]) for ticker in refreshed if ticker in staleEntries}
+            onRefresh(stale, refreshed)
+
+    thread = threading.Thread(target=run, name='quote-refresh', daemon=True)
+    thread.start()
+    return thread
+
+def resolveQuotes(conn, tickers, requiredFields, fetchFromProvider, onRefresh=None, deadline=None, priority=INTERACTIVE, onResolved=None, priceOnly=False):
+    """
+    Resolve quotes for tickers through each cache layer in turn, only sending tickers none of them can serve to the provider:
+    1. quotes already fetched this session, or currently being fetched by another request
+    2. the on-disk quote caches
+    3. the `quotes_cache` table shared with other sessions, if the `shared_quote_cache` setting is enabled
+    4. `fetchFromProvider`, writing fetched quotes back to the on-disk and shared caches
+
+    Price-only quotes are cached apart from full quotes, see `getQuoteCaches`.
+
+    If `onRefresh` is given and the `stale_while_revalidate` setting is enabled, expired cached quotes
+    are returned straight away and refreshed in the background, with `onRefresh` called once fresh quotes arrive.
+
+    Tickers not resolved by `deadline` are returned with their last known quote marked `QUOTE_STATUS_LAST_KNOWN`,
+    or an unpriced quote marked `QUOTE_STATUS_UNAVAILABLE` if there is none.
+    In offline mode nothing is fetched, see `getOfflineQuotes`.
+    With the cache disabled, or the record or replay provider configured, every ticker is fetched and no cache is read or written.
+
+    Params:
+    - conn: connection to database
+    - tickers: list of tickers
+    - requiredFields: fields a cached quote must contain to be used
+    - fetchFromProvider: function taking (tickers, onQuote, priority) and returning a dictionary of ticker to quote.
+      It calls `onQuote(ticker, quote)` as each ticker's quote arrives.
+    - onRefresh: function taking (stale, refreshed) dictionaries of ticker to quote. Default: None (never serve stale quotes)
+    - deadline: `time.monotonic()` value to stop waiting for the provider at. Default: None (wait for every ticker)
+    - priority: scheduler lane for provider requests, background refreshes always use `BACKGROUND`. Default: `INTERACTIVE`
+    - onResolved: function called with (ticker, (quote, fetchedAt)) as soon as each ticker resolves, once per ticker
+      and always before this returns, so results can be shown before the slowest ticker arrives. Default: None
+    - priceOnly: `fetchFromProvider` returns price-only quotes, see `getQuoteCaches`. Default: False
+
+    Returns:
+    - dictionary of ticker to (quote, fetchedAt) tuples
+    """
+    notify, close = makeResolvedNotifier(onResolved)
+    debug = getBooleanSetting(conn, 'debug_mode')
+    shared = getBooleanSetting(conn, 'shared_quote_cache')
+
+    def finish(entries):
+        for ticker in tickers:
+            notify(ticker, entries[ticker])
+        close()
+        return entries
+
+    if isOffline(conn):
+        return finish(getOfflineQuotes(tickers, requiredFields, getSharedEntries(conn, tickers, priceOnly) if shared else None, priceOnly))
+
+    if not getBooleanSetting(conn, 'quote_cache_enabled') or not isLiveProvider(conn):
+        def fetchUncached(fetchTickers, onResolved):
+            fetchedAt = time.time()
+            fetched = fetchFromProvider(fetchTickers, lambda ticker, quote: onResolved(ticker, (quote, fetchedAt)), priority)
+            return {ticker: (quote, fetchedAt) for ticker, quote in fetched.items()}
+
+        entries = fetchBeforeDeadline(tickers, fetchUncached, deadline, notify)
+        unresolvedTickers = [ticker for ticker in tickers if ticker not in entries]
+        entries.update({ticker: ({'ticker': ticker, 'price': None, 'quoteStatus': QUOTE_STATUS_UNAVAILABLE}, None) for ticker in unresolvedTickers})
+        return finish(entries)
+
+    isUsable = lambda quote, fetchedAt: isQuoteUsable(quote, fetchedAt, requiredFields)
+    # Read once on this thread, as fetches can run on background threads that mustn't share the connection
+    sharedEntries = getSharedEntries(conn, tickers, priceOnly) if shared else None
+
+    def fetch(fetchTickers, onResolved, fetchPriority=priority):
+        def fetchMissing(missingTickers):
+            entries = getCachedQuotes(missingTickers, requiredFields, priceOnly)
+            if sharedEntries is not None:
+                entries.update(getSharedQuotes(sharedEntries, [ticker for ticker in missingTickers if ticker not in entries], requiredFields))
+            for ticker, entry in entries.items():
+                onResolved(ticker, entry)
+
+            uncachedTickers = [ticker for ticker in missingTickers if ticker not in entries]
+            if uncachedTickers:
+                fetchedAt = time.time()
+                fetched = fetchFromProvider(uncachedTickers, lambda ticker, quote: onResolved(ticker, (markUnpriced(quote), fetchedAt)), fetchPriority)
+
+                pricedQuotes = {ticker: quote for ticker, quote in fetched.items() if quote.get('price') is not None}
+                getQuoteCaches(priceOnly)[0].putMany(pricedQuotes, fetchedAt)
+                if sharedEntries is not None and pricedQuotes and not isFetchCancelled(conn):
+                    storeSharedQuotes({getSharedQuoteKey(ticker, priceOnly): quote for ticker, quote in pricedQuotes.items()}, fetchedAt, debug)
+
+                entries.update({ticker: (markUnpriced(quote), fetchedAt) for ticker, quote in fetched.items()})
+            return entries
+
+        # Price lookups can also be served by full quotes held this session, which the price store doesn't hold
+        held = getSessionQuotes(fetchTickers, isUsable, priceOnly)
+        fetched = getSessionStores(priceOnly)[0].fetch([ticker for ticker in fetchTickers if ticker not in held], fetchMissing, isUsable)
+        return {**held, **fetched}
+
+    staleEntries = {}
+    if onRefresh is not None and getBooleanSetting(conn, 'stale_while_revalidate'):
+        staleEntries = getStaleQuotes(tickers, requiredFields, sharedEntries, priceOnly)
+        if staleEntries:
+            refresh = lambda refreshTickers: fetch(refreshTickers, lambda ticker, entry: None, BACKGROUND)
+            refreshQuotesInBackground(list(staleEntries.keys()), staleEntries, refresh, onRefresh, debug)
+
+    for ticker, entry in withQuoteStatus(staleEntries, QUOTE_STATUS_STALE).items():
+        notify(ticker, entry)
+    for ticker, entry in getSessionQuotes(tickers, isUsable, priceOnly).items():
+        if ticker not in staleEntries:
+            notify(ticker, entry)
+
+    entries = fetchBeforeDeadline([ticker for ticker in tickers if ticker not in staleEntries], fetch, deadline, notify)
+    entries.update(withQuoteStatus(staleEntries, QUOTE_STATUS_STALE))
+
+    unresolvedTickers = [ticker for ticker in tickers if ticker not in entries]
+    if unresolvedTickers:
+        # Quotes held this session, eg. resolved by another request's fetch this one was waiting on
+        entries.update(getSessionQuotes(unresolvedTickers, isUsable, priceOnly))
+        unresolvedTickers = [ticker for ticker in unresolvedTickers if ticker not in entries]
+
+        lastKnown = getLastKnownQuotes(unresolvedTickers, requiredFields, sharedEntries, priceOnly)
+        entries.update(withQuoteStatus(lastKnown, QUOTE_STATUS_LAST_KNOWN))
+        entries.update({
+            ticker: ({'ticker': ticker, 'price': None, 'quoteStatus': QUOTE_STATUS_UNAVAILABLE}, None)
+            for ticker in unresolvedTickers if ticker not in lastKnown
+        })
+
+    return finish(entries)
+
+def storeTickerMetadata(quotes):
+    """
+    Store the metadata fields of freshly fetched quotes in the metadata cache.
+    Quotes without any metadata, eg. for unknown tickers, are skipped.
+
+    Params:
+    - quotes: dictionary of ticker to ticker information dictionary from `buildTickerData`
+    """
+    metadata = {ticker: projectQuote(quote, METADATA_FIELDS) for ticker, quote in quotes.items()}
+    metadataCache.putMany({ticker: fields for ticker, fields in metadata.items() if any(fields.values())})
+
+def fetchTickerMetadata(conn, tickers, deadline=None, priority=INTERACTIVE):
+    """
+    Fetch metadata for tickers from the provider and store it in the metadata cache, regardless of what is cached.
+    Metadata from the record or replay provider is not stored, see `isLiveProvider`.
+
+    Params:
+    - conn: connection to database
+    - tickers: list of tickers
+    - deadline: `time.monotonic()` value to stop waiting at. Late responses are still stored. Default: None
+    - priority: request scheduler lane. Default: `INTERACTIVE`
+
+    Returns:
+    - dictionary of ticker to metadata dictionary with the `METADATA_FIELDS`, for tickers fetched in time
+    """
+    scheduler = getScheduler(conn)
+    provider = getProvider(conn)
+    live = isLiveProvider(conn)
+
+    def fetch(fetchTickers, onResolved):
+        fetchedAt = time.time()
+        quotes = {}
+
+        def onInfo(ticker, info):
+            quotes[ticker] = buildTickerData(ticker, info)
+            onResolved(ticker, (projectQuote(quotes[ticker], METADATA_FIELDS), fetchedAt))
+
+        fetchTickerInfos(scheduler, provider, fetchTickers, priority, onInfo)
+        if live:
+            storeTickerMetadata(quotes)
+        return {ticker: (projectQuote(quote, METADATA_FIELDS), fetchedAt) for ticker, quote in quotes.items()}
+
+    entries = fetchBeforeDeadline(tickers, fetch, deadline)
+    return {ticker: metadata for ticker, (metadata, fetchedAt) in entries.items()}
+
+def getCachedTickerMetadata(tickers):
+    """
+    Get metadata for tickers from the metadata cache however old, without fetching anything
+
+    Params:
+    - tickers: list of tickers
+
+    Returns:
+    - dictionary of ticker to metadata dictionary with the `METADATA_FIELDS`, for tickers with cached metadata
+    """
+    return {ticker: fields for ticker, (fields, fetchedAt) in metadataCache.getMany(tickers).items()}
+
+def getTickerMetadata(conn, tickers, deadline=None, priority=INTERACTIVE):
+    """
+    Get metadata for tickers from the metadata cache, fetching tickers without
+    metadata newer than the `metadata_ttl_days` setting. In offline mode cached metadata is served however old.
+    With the record or replay provider configured every ticker is fetched, see `isLiveProvider`.
+
+    Params:
+    - conn: connection to database
+    - tickers: list of tickers
+    - deadline: `time.monotonic()` value to stop waiting for uncached metadata at. Default: None
+    - priority: request scheduler lane. Default: `INTERACTIVE`
+
+    Returns:
+    - dictionary of ticker to metadata dictionary with the `METADATA_FIELDS`.
+      Tickers without metadata in time are omitted.
+    """
+    offline = isOffline(conn)
+    if not offline and not isLiveProvider(conn):
+        return fetchTickerMetadata(conn, tickers, deadline, priority)
+
+    maxAge = getIntegerSetting(conn, 'metadata_ttl_days') * 24 * 60 * 60
+    now = time.time()
+    metadata = {
+        ticker: fields
+        for ticker, (fields, fetchedAt) in metadataCache.getMany(tickers).items()
+        if offline or now - fetchedAt < maxAge
+    }
+    if offline:
+        return metadata
+
+    missingTickers = [ticker for ticker in tickers if ticker not in metadata]
+    if missingTickers:
+        metadata.update(fetchTickerMetadata(conn, missingTickers, deadline, priority))
+
+    return metadata
+
+def fetchTickerInfos(scheduler, provider, tickers, priority=INTERACTIVE, onInfo=None):
+    """
+    Fetch ticker info from the provider. Each ticker's info is a separate HTTP round trip,
+    so they are queued on the request scheduler and resolved concurrently within its rate limit.
+
+    Params:
+    - scheduler: `RequestScheduler` to send requests through
+    - provider: `MarketDataProvider` to fetch from
+    - tickers: list of tickers
+    - priority: scheduler lane for the requests. Default: `INTERACTIVE`
+    - onInfo: function called with (ticker, info) as each ticker's info arrives. Default: None
+
+    Returns:
+    - dictionary of ticker to yfinance info dictionary, in the order of `tickers`.
+      Tickers whose request was cancelled, see `RequestScheduler.cancelQueued`, are omitted.
+    """
+    futures = {
+        scheduler.submit(provider.getTickerInfo, ticker, priority=priority, isEmpty=lambda info: not info): ticker
+        for ticker in tickers
+    }
+
+    infos = {}
+    for future in as_completed(futures):
+        if future.cancelled():
+            continue
+
+        ticker = futures[future]
+        infos[ticker] = future.result()
+        if onInfo is not None:
+            onInfo(ticker, infos[ticker])
+
+    return {ticker: infos[ticker] for ticker in tickers if ticker in infos}
+
+def getYfinanceTickerData(conn, tickers, fields=None, asFrame=False, onRefresh=None, deadline=None, priority=INTERACTIVE):
+    """
+    Get data for tickers from Yahoo Finance API.
+    Quotes already fetched this session or still fresh in the on-disk quote cache are served without a network call.
+    If only price fields and `METADATA_FIELDS` are requested the lightweight `getYfinancePriceData` path is used,
+    with the metadata served from the long lived metadata cache, see `getTickerMetadata`.
     
     Params:
     - conn: connection to database
     - tickers: list of tickers
+    - fields: list of fields from `QUOTE_FIELDS` or `QUOTE_METADATA_FIELDS` the caller needs. Default: `None` (all `QUOTE_FIELDS`)
+    - asFrame: return a columnar frame indexed by ticker instead of a dictionary. Default: False
+    - onRefresh: serve expired cached quotes and call this with (stale, refreshed) quotes once fresh ones arrive.
+      See `resolveQuotes`. Default: None
+    - deadline: `time.monotonic()` value to stop waiting for quotes at, see `getFetchDeadline`.
+      Tickers not resolved in time have `quoteStatus` set. Default: None (wait for every ticker)
+    - priority: request scheduler lane, `BACKGROUND` for work nobody is waiting on. Default: `INTERACTIVE`
 
     Returns:
     - data: dictionary with ticker to information_dictionary key value mappings
     eg. {'IVV.AX': {'price': 100, 'volume': 10000, ...}, ...}
+    or a pandas DataFrame with a row per ticker and a column per field if `asFrame` is set
+    """
+    fields = list(fields) if fields else QUOTE_FIELDS
+    unknownFields = [field for field in fields if field not in QUOTE_FIELDS + QUOTE_METADATA_FIELDS]
+    if unknownFields:
+        raise ValueError(f"Unknown ticker data fields: {', '.join(unknownFields)}")
+
+    metadataFields = [field for field in fields if field in METADATA_FIELDS]
+    quoteFields = [field for field in fields if field not in METADATA_FIELDS]
+
+    if all(field in PRICE_FIELDS + QUOTE_METADATA_FIELDS for field in quoteFields):
+        data = getYfinancePriceData(conn, tickers, onRefresh=onRefresh, deadline=deadline, priority=priority)
+    else:
+        data = getYfinanceQuoteData(conn, tickers, quoteFields, onRefresh, deadline, priority)
+
+    # Full quotes already carry metadata, so this is only needed for price quotes and quotes not fetched in time
+    tickersWithoutMetadata = [ticker for ticker, quote in data.items() if any(field not in quote for field in metadataFields)]
+    if tickersWithoutMetadata:
+        metadata = getTickerMetadata(conn, tickersWithoutMetadata, deadline, priority)
+        for ticker in tickersWithoutMetadata:
+            data[ticker].update(projectQuote(metadata.get(ticker, {}), metadataFields))
+
+    data = {ticker: projectQuote(quote, fields) for ticker, quote in data.items()}
+    return makeQuoteFrame(data, fields) if asFrame else data
+
+def getYfinanceQuoteData(conn, tickers, fields, onRefresh=None, deadline=None, priority=INTERACTIVE):
+    """
+    Get the volatile fields of full quotes, each needing a separate ticker info request for uncached tickers.
+    Fetched quotes also refresh the metadata cache. Use `getYfinanceTickerData` rather than calling this directly.
+
+    Params:
+    - conn: connection to database
+    - tickers: list of tickers
+    - fields: list of fields from `QUOTE_FIELDS` or `QUOTE_METADATA_FIELDS` cached quotes must have
+    - onRefresh, deadline, priority: see `getYfinanceTickerData`
+
+    Returns:
+    - dictionary of ticker to ticker information dictionary, including `QUOTE_METADATA_FIELDS`
     """
-    debug = getSetting(conn, 'debug_mode', getDefaultSetting('debug_mode')).lower() == 'true'
+    debug = getBooleanSetting(conn, 'debug_mode')
+    scheduler = getScheduler(conn)
+    provider = getProvider(conn)
+    live = isLiveProvider(conn)
+
+    def fetchFromProvider(missingTickers, onQuote=None, fetchPriority=INTERACTIVE):
+        fetched = {}
+
+        def onInfo(ticker, info):
+            if debug:
+                print(json.dumps(info, indent=2, sort_keys=True))
+
+            fetched[ticker] = buildTickerData(ticker, info)
+            if onQuote is not None:
+                onQuote(ticker, fetched[ticker])
+
+        fetchTickerInfos(scheduler, provider, missingTickers, fetchPriority, onInfo)
+
+        if live:
+            storeTickerMetadata(fetched)
+        return {ticker: fetched[ticker] for ticker in missingTickers if ticker in fetched}
     
-    tickers = makeTickerString(conn, tickers)
-    tickerData = yf.Tickers(tickers)
-    data = {}
-    for ticker in tickers.split():
+    tickers = makeTickerString(conn, tickers).split()
+    requiredFields = [field for field in fields if field not in QUOTE_METADATA_FIELDS]
+    entries = resolveQuotes(conn, tickers, requiredFields, fetchFromProvider, onRefresh, deadline, priority)
+
+    return {
+        ticker: withFetchedAt(*entries[ticker]) if ticker in entries else {'ticker': ticker}
+        for ticker in tickers
+    }
+
+def getYfinancePriceData(conn, tickers, includeNames=False, onRefresh=None, deadline=None, priority=INTERACTIVE, onQuote=None):
+    """
+    Lightweight alternative to `getYfinanceTickerData` returning only prices.
+    Prices for all uncached tickers are fetched in one batched request.
+    Names are served from the metadata cache, only tickers without cached metadata fall back to a full info lookup.
+
+    Params:
+    - conn: connection to database
+    - tickers: list of tickers
+    - includeNames: include `fullName` for each ticker. Default: False
+    - onRefresh: serve expired cached prices and call this with (stale, refreshed) quotes once fresh ones arrive.
+      See `resolveQuotes`. Default: None
+    - deadline: `time.monotonic()` value to stop waiting for prices at, see `getFetchDeadline`.
+      Tickers not resolved in time have `quoteStatus` set. Default: None (wait for every ticker)
+    - priority: request scheduler lane, `BACKGROUND` for work nobody is waiting on. Default: `INTERACTIVE`
+    - onQuote: function called with (ticker, price information dictionary) as soon as each ticker resolves,
+      for rendering results progressively. Calls are serialised. Default: None
+
+    Returns:
+    - data: dictionary with ticker to price information dictionary key value mappings
+    eg. {'IVV.AX': {'ticker': 'IVV.AX', 'price': 100, 'regularMarketPreviousClose': 99, 'fetchedAt': 1700000000.0, 'fullName': ...}, ...}
+    """
+    debug = getBooleanSetting(conn, 'debug_mode')
+    scheduler = getScheduler(conn)
+    provider = getProvider(conn)
+
+    def fetchFromProvider(missingTickers, onQuote=None, fetchPriority=INTERACTIVE):
+        fetched = scheduler.submit(
+            provider.getLatestPrices,
+            missingTickers,
+            priority=fetchPriority,
+            isEmpty=lambda prices: all(price['price'] is None for price in prices.values())
+        ).result()
         if debug:
-            print(json.dumps(tickerData.tickers[ticker].info, indent=2, sort_keys=True))
-
-        data[ticker] = {
-            'ticker': ticker,
-            'price': getTickerPrice(tickerData.tickers[ticker].info),
-            'fullName': tickerData.tickers[ticker].info.get('longName', None),
-            'shortName': tickerData.tickers[ticker].info.get('shortName', None),
-            'currency': tickerData.tickers[ticker].info.get('currency', None),
-            'fullExchangeName': tickerData.tickers[ticker].info.get('fullExchangeName', None),
-            'quoteType': tickerData.tickers[ticker].info.get('quoteType', None),
-            'marketState': tickerData.tickers[ticker].info.get('marketState', None),
-            'yield': tickerData.tickers[ticker].info.get('yield', 0),
-            'quoteType': tickerData.tickers[ticker].info.get('quoteType', None),
-            'peRatio': tickerData.tickers[ticker].info.get('trailingPE', None),
-            'priceToBook': tickerData.tickers[ticker].info.get('priceToBook', None),
-            'eps': tickerData.tickers[ticker].info.get('epsTrailingTwelveMonths', None),
-            'volume': tickerData.tickers[ticker].info.get('volume', None),
-            'beta': getBeta(tickerData.tickers[ticker].info),
-            'ytdReturn': tickerData.tickers[ticker].info.get('ytdReturn', None),
-            'threeYrReturn': tickerData.tickers[ticker].info.get('threeYearAverageReturn', None),
-            'fiveYrReturn': tickerData.tickers[ticker].info.get('fiveYearAverageReturn', None),
-            'fiftyTwoWkLow': tickerData.tickers[ticker].info.get('fiftyTwoWeekLow', None),
-            'fiftyTwoWkHigh': tickerData.tickers[ticker].info.get('fiftyTwoWeekHigh', None),
-            'fiftyDayAvg': tickerData.tickers[ticker].info.get('fiftyDayAverage', None),
-            'regularMarketPrice': tickerData.tickers[ticker].info.get('regularMarketPrice', None),
-            'regularMarketPreviousClose': tickerData.tickers[ticker].info.get('regularMarketPreviousClose', None),
-            'twoHundredDayAvg': tickerData.tickers[ticker].info.get('twoHundredDayAverage', None),
-            'fiftyTwoWeekChangePercent': tickerData.tickers[ticker].info.get('fiftyTwoWeekChangePercent', None),
-            'fiftyTwoWeekLowChangePercent': tickerData.tickers[ticker].info.get('fiftyTwoWeekLowChangePercent', None),
-            'fiftyTwoWeekHighChangePercent': tickerData.tickers[ticker].info.get('fiftyTwoWeekHighChangePercent', None),
-            'twoHundredDayAverageChangePercent': tickerData.tickers[ticker].info.get('twoHundredDayAverageChangePercent', None)
-        }
+            print(json.dumps(fetched, indent=2, sort_keys=True))
+        if onQuote is not None:
+            for ticker, quote in fetched.items():
+                onQuote(ticker, quote)
+        return fetched
 
-    return data
+    tickers = makeTickerString(conn, tickers).split()
+
+    # Names are usually cached, so are looked up first to be ready as each price arrives
+    metadata = getTickerMetadata(conn, tickers, deadline, priority) if includeNames else {}
+
+    def toPriceData(ticker, entry):
+        data = projectQuote(withFetchedAt(*entry), PRICE_FIELDS + QUOTE_METADATA_FIELDS)
+        if includeNames:
+            data['fullName'] = metadata.get(ticker, {}).get('fullName')
+        return data
+
+    onResolved = (lambda ticker, entry: onQuote(ticker, toPriceData(ticker, entry))) if onQuote is not None else None
+    entries = resolveQuotes(conn, tickers, PRICE_FIELDS, fetchFromProvider, onRefresh, deadline, priority, onResolved, priceOnly=True)
+
+    return {ticker: toPriceData(ticker, entries[ticker]) for ticker in tickers}
@@ -1,19 +1,25 @@
 from prompt_toolkit import prompt
 from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.patch_stdout import patch_stdout
 
 from commands.buy import buyInvestment
-from commands.dividend import dividend
-from commands.fear_and_greed import fearAndGreedIndex
+from commands.dividend import dividend, syncDividends
+from commands.fear_and_greed import fearAndGreedIndex, startFearAndGreedBanner
 from commands.help import outputHelp
 from commands.index_performance import indexPerformance
 from commands.investment_performance import investmentPerformance
 from commands.investment_history import investmentHistory
 from commands.portfolio_value import portfolioValue
+from commands.portfolio_balance import portfolioBalance
 from commands.rebalance_suggestions import rebalanceSuggestions
+from commands.refresh_metadata import refreshMetadata
 from commands.sell import sellInvestment
 from commands.settings import settingsCommand
+from commands.sync_market_data import syncMarketData
 from db.backup_handler import backup_database, restore_database
 from db.db_handler import database_setup
+from fetchers.async_fetcher import FetchCancelled
+from fetchers.prefetch import startQuotePrefetch
 from utils.constants.command_completer import COMMANDS, COMMAND_DESCRIPTIONS
 
 # Define a key binding for the ESC key
@@ -28,13 +34,17 @@ def main():
     if not conn:
         return
 
+    startQuotePrefetch(conn)
+
     # TODO: Prompt for if user wants to restore from backup
     print("\nWelcome to stock-gains: Command-line portfolio information tool")
-    fearAndGreedIndex()
+    startFearAndGreedBanner(conn)
     
     while True:
         try:
-            user_input = prompt("Enter command: ", complete_while_typing=True, complete_in_thread=True, completer=COMMANDS)
+            # Background refreshes may print while waiting for input
+            with patch_stdout():
+                user_input = prompt("Enter command: ", complete_while_typing=True, complete_in_thread=True, completer=COMMANDS)
 
             # TODO: Add keybindings to all commands if works
             if user_input == "quit":
@@ -49,6 +59,8 @@ def main():
                 sellInvestment(conn, kb)
             elif user_input == "dividend":
                 dividend(conn, kb)
+            elif user_input == "dividend --sync":
+                syncDividends(conn)
             elif user_input == "investment-history":
                 investmentHistory(conn, kb)
             elif user_input.startswith("investment-history --ticker"):
@@ -67,13 +79,17 @@ def main():
             elif user_input == "rebalance-suggestions":
                 rebalanceSuggestions(conn, kb)
             elif user_input == "portfolio-balance":
-                print("Portfolio balance feature is not implemented yet.")
+                portfolioBalance(conn)
             elif user_input == "portfolio-growth":
                 print("Portfolio growth feature is not implemented yet.")
             elif user_input == "ammend":
                 print("Ammend feature is not implemented yet.")
             elif user_input == "fear-and-greed":
-                fearAndGreedIndex()
+                fearAndGreedIndex(conn)
+            elif user_input == "refresh-metadata":
+                refreshMetadata(conn)
+            elif user_input == "sync-market-data":
+                syncMarketData(conn)
             elif user_input == "help":
                 outputHelp(COMMANDS, COMMAND_DESCRIPTIONS)
             elif user_input == "settings":
@@ -81,6 +97,9 @@ def main():
             else:
                 print("Invalid command. Please try again.")
 
+        except FetchCancelled:
+            # Quotes fetched before cancelling are kept in the caches for the next command
+            print("\nCancelled.")
         except KeyboardInterrupt:
             print("Exiting...")
             break
@@ -1,10 +1,21 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+import pandas as pd
 from unittest.mock import patch, MagicMock
 from prompt_toolkit.key_binding import KeyBindings
 
+import commands.fear_and_greed as fearAndGreed
+import commands.portfolio_value as portfolioValue
+from commands.portfolio_balance import aggregateExposures, portfolioBalance
 from commands.buy import buyInvestment
 from commands.dividend import dividend
 from commands.sell import sellInvestment
+from fetchers.disk_cache import DiskCache
+from fetchers.exposure_fetcher import EXPOSURE_COLUMNS
 
 class TestCommands(unittest.TestCase):
 
@@ -52,5 +63,187 @@ class TestCommands(unittest.TestCase):
 
         mock_record.assert_called_once_with(mock_conn, 'AAPL', 100.0, '2023-10-10')
 
+def makePortfolioRow(ticker, cost, volume, dividends=0.0, realizedProfit=0.0):
+    return {
+        'ticker': ticker,
+        'cost': cost,
+        'volume': volume,
+        'buy_brokerage': 0.0,
+        'sell_brokerage': 0.0,
+        'dividends': dividends,
+        'realized_profit': realizedProfit
+    }
+
+class TestPortfolioValue(unittest.TestCase):
+
+    def setUp(self):
+        self.portfolioData = {
+            'IVV': makePortfolioRow('IVV', 1000.0, 10.0),
+            'VAS.AX': makePortfolioRow('VAS.AX', 900.0, 10.0),
+            'CSL.AX': makePortfolioRow('CSL.AX', 0.0, 0.0, dividends=5.0, realizedProfit=50.0)
+        }
+        self.rates = pd.Series({'IVV': 1.5, 'VAS.AX': 1.0, 'CSL.AX': 1.0})
+        self.prices = {
+            'IVV': {'ticker': 'IVV', 'price': 110.0, 'quoteStatus': None, 'fetchedAt': None},
+            'VAS.AX': {'ticker': 'VAS.AX', 'price': 95.0, 'quoteStatus': None, 'fetchedAt': None}
+        }
+
+    def patchCommand(self, progressive):
+        settings = {'progressive_render': progressive, 'stale_while_revalidate': False}
+        return [
+            patch('commands.portfolio_value.getDistinctTickers', return_value=['IVV', 'VAS.AX', 'CSL.AX']),
+            patch('commands.portfolio_value.getCurrentPortfolioData', return_value=self.portfolioData),
+            patch('commands.portfolio_value.getBooleanSetting', side_effect=lambda conn, name: settings[name]),
+            patch('commands.portfolio_value.getFetchDeadline', return_value=None),
+            patch('commands.portfolio_value.getBaseCurrency', return_value='AUD'),
+            patch('commands.portfolio_value.getSetting', return_value='false')
+        ]
+
+    def runCommand(self, progressive, runFetches):
+        patchers = self.patchCommand(progressive)
+        for patcher in patchers:
+            patcher.start()
+        try:
+            with patch('commands.portfolio_value.runFetches', side_effect=runFetches), patch('builtins.print') as mock_print:
+                portfolioValue.portfolioValue(MagicMock())
+        finally:
+            for patcher in patchers:
+                patcher.stop()
+        return [str(call.args[0]) if call.args else '' for call in mock_print.call_args_list]
+
+    def testFxRatesOnlyFetchedForHeldTickers(self):
+        fetches = []
+
+        def runFetches(conn, *requested):
+            fetches.extend(requested)
+            return [self.rates, self.prices]
+
+        output = self.runCommand(False, runFetches)
+
+        (ratesFetch, ratesArgs, ratesKwargs), (pricesFetch, pricesArgs, pricesKwargs) = fetches
+        self.assertEqual(ratesArgs, (['IVV', 'VAS.AX'],))
+        self.assertEqual(ratesKwargs['cachedTickers'], ['CSL.AX'])
+        self.assertEqual(pricesArgs, (['IVV', 'VAS.AX'],))
+        self.assertTrue(any("not the rates when they were paid" in line for line in output))
+
+    def testProgressiveRowsWaitForFxRates(self):
+        def runFetches(conn, *requested):
+            (ratesFetch, ratesArgs, ratesKwargs), (pricesFetch, pricesArgs, pricesKwargs) = requested
+            # A quote arriving before the exchange rates is held back until they arrive
+            pricesKwargs['onQuote']('IVV', self.prices['IVV'])
+            ratesKwargs['onRates'](self.rates)
+            pricesKwargs['onQuote']('VAS.AX', self.prices['VAS.AX'])
+            return [self.rates, self.prices]
+
+        output = self.runCommand(True, runFetches)
+
+        rows = [line for line in output if line.startswith('│')]
+        self.assertIn('Ticker', rows[0])
+        self.assertIn('*', rows[1])
+        self.assertIn('IVV', rows[2])
+        # 10 units at 110 USD, converted at 1.5
+        self.assertIn('$1,650.00', rows[2])
+        self.assertIn('VAS.AX', rows[3])
+        self.assertIn('Total', rows[4])
+
+    def testUnpricedLiveQuoteLeftOutOfTotals(self):
+        # A fetched quote without a price, eg. for a delisted ticker
+        self.prices['VAS.AX'] = {'ticker': 'VAS.AX', 'price': None, 'quoteStatus': None, 'fetchedAt': None}
+
+        output = self.runCommand(False, lambda conn, *requested: [self.rates, self.prices])
+
+        rows = [line for line in '\n'.join(output).splitlines() if line.startswith('│')]
+        totalRow = next(row for row in rows if 'Total' in row)
+        self.assertIn('$1,650.00', totalRow)
+
+class TestPortfolioBalance(unittest.TestCase):
+
+    def testExposuresAggregatedAcrossFunds(self):
+        values = pd.Series({'IVV.AX': 600.0, 'NDQ.AX': 400.0})
+        exposures = pd.DataFrame([
+            ('IVV.AX', 'sector', 'Technology', 0.3),
+            ('IVV.AX', 'holding', 'AAPL', 0.07),
+            ('NDQ.AX', 'sector', 'Technology', 0.5),
+            ('NDQ.AX', 'holding', 'AAPL', 0.1),
+            ('NDQ.AX', 'holding', 'MSFT', 0.09)
+        ], columns=EXPOSURE_COLUMNS)
+
+        balance = aggregateExposures(values, exposures).set_index(['exposureType', 'name'])
+
+        self.assertAlmostEqual(balance.at[('sector', 'Technology'), 'value'], 380.0)
+        self.assertAlmostEqual(balance.at[('sector', 'Unclassified'), 'weight'], 0.62)
+        self.assertAlmostEqual(balance.at[('holding', 'AAPL'), 'value'], 82.0)
+        self.assertAlmostEqual(balance.at[('region', 'Unclassified'), 'weight'], 1.0)
+        self.assertEqual(list(balance.loc['holding'].index), ['AAPL', 'MSFT', 'Unclassified'])
+
+    @patch('commands.portfolio_balance.getBaseCurrency', return_value='AUD')
+    @patch('commands.portfolio_balance.getCurrentPortfolioData')
+    @patch('commands.portfolio_balance.getFetchDeadline', return_value=None)
+    @patch('commands.portfolio_balance.getDistinctTickersWithPositions', return_value=['IVV', 'NDQ.AX'])
+    @patch('commands.portfolio_balance.runFetches')
+    def testPricesRatesAndExposuresFetchedTogether(self, mock_fetches, mock_tickers, mock_deadline, mock_portfolio, mock_currency):
+        mock_portfolio.return_value = {'IVV': makePortfolioRow('IVV', 400.0, 4.0), 'NDQ.AX': makePortfolioRow('NDQ.AX', 400.0, 10.0)}
+        exposures = pd.DataFrame([('IVV', 'sector', 'Technology', 0.3), ('NDQ.AX', 'sector', 'Technology', 0.5)], columns=EXPOSURE_COLUMNS)
+        mock_fetches.return_value = [
+            pd.Series({'IVV': 1.5, 'NDQ.AX': 1.0}),
+            {'IVV': {'ticker': 'IVV', 'price': 100.0}, 'NDQ.AX': {'ticker': 'NDQ.AX', 'price': 40.0}},
+            exposures
+        ]
+
+        with patch('builtins.print') as mock_print:
+            portfolioBalance(MagicMock())
+
+        # One round of fetches, rather than waiting on each in turn
+        mock_fetches.assert_called_once()
+        fetches = mock_fetches.call_args.args[1:]
+        self.assertEqual([fetch.__name__ for fetch, args, kwargs in fetches], ['getTickerFxRates', 'getYfinancePriceData', 'getLookThroughExposures'])
+        output = '\n'.join(str(call.args[0]) for call in mock_print.call_args_list)
+        # 4 units at 100 USD converted at 1.5, and 10 at 40: 30% and 50% of each
+        self.assertIn('$380.00', output)
+
+class TestFearAndGreedBanner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.cache = DiskCache(os.path.join(self.tmpDir, 'fear_and_greed.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    @patch('commands.fear_and_greed.getProvider')
+    def testFreshIndexShownWithoutFetching(self, mock_provider):
+        with patch.object(fearAndGreed, 'fearAndGreedCache', self.cache), patch('builtins.print'):
+            self.cache.putMany({fearAndGreed.FEAR_AND_GREED_CACHE_KEY: {'value': 40.0, 'description': 'fear'}})
+            thread = fearAndGreed.startFearAndGreedBanner(MagicMock())
+
+        self.assertIsNone(thread)
+        mock_provider.assert_not_called()
+
+    @patch('commands.fear_and_greed.get_connection')
+    @patch('commands.fear_and_greed.getProvider')
+    def testExpiredIndexFetchedInBackground(self, mock_provider, mock_connection):
+        fetched = threading.Event()
+
+        def slowFearAndGreed():
+            fetched.wait(5)
+            return {'value': 42.0, 'description': 'fear'}
+
+        mock_provider.return_value.getFearAndGreed.side_effect = slowFearAndGreed
+
+        with patch.object(fearAndGreed, 'fearAndGreedCache', self.cache), patch('builtins.print') as mock_print:
+            self.cache.putMany({fearAndGreed.FEAR_AND_GREED_CACHE_KEY: {'value': 20.0, 'description': 'extreme fear'}}, time.time() - 2 * 60 * 60)
+            thread = fearAndGreed.startFearAndGreedBanner(MagicMock())
+
+            # Startup carries on while the index is still being fetched
+            self.assertTrue(thread.is_alive())
+            mock_print.assert_not_called()
+
+            fetched.set()
+            thread.join(5)
+            cached, fetchedAt = self.cache.getMany([fearAndGreed.FEAR_AND_GREED_CACHE_KEY])[fearAndGreed.FEAR_AND_GREED_CACHE_KEY]
+
+        self.assertEqual(cached['value'], 42.0)
+        self.assertIn('42.0/100 (fear)', mock_print.call_args[0][0])
+
 if __name__ == '__main__':
     unittest.main()
@@ -5,66 +5,62 @@ from db.crud import (
     getDistinctTickers, 
     checkIfTickerExists,
     getCurrentPortfolioTickerData,
+    getCurrentPortfolioData,
+    getDistinctTickersWithPositions,
     insertNewInvestmentHistory,
-    addToPortfolio,
-    reduceFromPortfolio,
-    recordDividend
+    recordDividend,
+    insertDividendEntitlements,
+    upsertCorporateActions
 )
+from db.config import DIVIDEND_PAYMENT_WINDOW_DAYS
 import db.queries as q
 
-# TODO: Fix these. Queries were modified to not take params
+def executedQueries(mock_cursor):
+    return [call.args[0] for call in mock_cursor.execute.call_args_list]
 
 class TestCrudFunctions(unittest.TestCase):
 
-    @patch('db.crud.psycopg2.connect')
-    def testGetDistinctTickers(self, mock_connect):
+    def testGetDistinctTickers(self):
         mock_conn = MagicMock()
-        mock_cursor = MagicMock()
-        mock_connect.return_value = mock_conn
-        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
-        mock_cursor.fetchall.return_value = [('AAPL'), ('GOOGL'), ('MSFT')]
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchall.return_value = [('AAPL', 1500), ('GOOGL', 1200), ('MSFT', 900)]
 
         tickers = getDistinctTickers(mock_conn)
 
-        mock_cursor.execute.assert_called_once_with(q.distinctTickersQuery())
-
+        self.assertEqual(executedQueries(mock_cursor), [q.refreshDirtyPortfolio(), q.distinctTickersQuery()])
         self.assertEqual(tickers, ['AAPL', 'GOOGL', 'MSFT'])
 
-    @patch('db.crud.psycopg2.connect')
-    def testCheckIfTickerExists(self, mock_connect):
-        mock_conn = MagicMock()
+    def testCheckIfTickerExists(self):
         mock_cursor = MagicMock()
-        mock_connect.return_value = mock_conn
-        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
-        mock_cursor.fetchone.return_value = ('AAPL')
+        mock_cursor.fetchone.return_value = (True,)
 
-        exists = checkIfTickerExists(mock_conn, 'AAPL')
+        exists = checkIfTickerExists(mock_cursor, 'AAPL')
 
         self.assertTrue(exists)
+        mock_cursor.execute.assert_called_with(q.tickerExistsQuery(), ('AAPL',))
 
         # Test when ticker does not exist
         mock_cursor.fetchone.return_value = None
-        exists = checkIfTickerExists(mock_conn, 'TSLA')
+        exists = checkIfTickerExists(mock_cursor, 'TSLA')
         self.assertFalse(exists)
 
-    @patch('db.crud.psycopg2.connect')
-    def testGetCurrentPortfolioTickerData(self, mock_connect):
+    def testGetCurrentPortfolioTickerData(self):
         mock_conn = MagicMock()
-        mock_cursor = MagicMock()
-        mock_connect.return_value = mock_conn
-        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
-        mock_cursor.fetchone.return_value = ('AAPL', 500, 10, 50, 5)
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchone.return_value = ('AAPL', 500, 10, 50, 5, 20, 0)
 
         ticker_data = getCurrentPortfolioTickerData(mock_conn, 'AAPL')
 
-        mock_cursor.execute.assert_called_once_with(q.currentPortfolioTickerQuery('AAPL'))
+        mock_cursor.execute.assert_called_with(q.currentPortfolioTickerQuery(), ('AAPL',))
 
         expected_data = {
             'ticker': 'AAPL',
-            'cost': 500,
-            'volume': 10,
-            'total_brokerage': 50,
-            'dividends': 5
+            'cost': 500.0,
+            'volume': 10.0,
+            'buy_brokerage': 50.0,
+            'sell_brokerage': 5.0,
+            'dividends': 20.0,
+            'realized_profit': 0.0
         }
         self.assertEqual(ticker_data, expected_data)
 
@@ -133,16 +129,112 @@ class TestCrudFunctions(unittest.TestCase):
 
     #     mock_cursor.close.assert_called()
 
-    @patch('db.crud.psycopg2.connect')
-    def testRecordDividend(self, mock_connect):
+    def testRecordDividend(self):
+        mock_cursor = MagicMock()
+
+        recordDividend(mock_cursor, 'AAPL', 100.0, '2023-10-10')
+
+        mock_cursor.execute.assert_called_once_with(q.dividendsInsert(), ('AAPL', '2023-10-10', 100.0,))
+
+class TestCurrentPortfolioData(unittest.TestCase):
+
+    def testPositionsReadInOneQuery(self):
         mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchall.return_value = [
+            ('IVV.AX', 1000, 20, 10, 0, 12.5, 0),
+            ('VAS.AX', None, 0, 10, 10, 3.0, 55.5)
+        ]
+
+        portfolioData = getCurrentPortfolioData(mock_conn, ['IVV.AX', 'VAS.AX', 'NDQ.AX'])
+
+        # One dirty flush, then a single query for every position
+        self.assertEqual(mock_cursor.execute.call_count, 2)
+        self.assertEqual(portfolioData['IVV.AX']['cost'], 1000.0)
+        self.assertEqual(portfolioData['IVV.AX']['dividends'], 12.5)
+        self.assertIsNone(portfolioData['VAS.AX']['cost'])
+        self.assertEqual(portfolioData['VAS.AX']['realized_profit'], 55.5)
+        self.assertEqual(portfolioData['NDQ.AX']['volume'], 0)
+
+    def testDirtyTickersRecomputedBeforeRead(self):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchall.return_value = [('IVV.AX',)]
+
+        self.assertEqual(getDistinctTickersWithPositions(mock_conn), ['IVV.AX'])
+        self.assertEqual(executedQueries(mock_cursor), [q.refreshDirtyPortfolio(), q.distinctTickersWithPositions()])
+
+    def testPositionReadsRecomputeDirtyTickersFirst(self):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchall.return_value = []
+        mock_cursor.fetchone.return_value = None
+
+        getCurrentPortfolioData(mock_conn)
+        getCurrentPortfolioTickerData(mock_conn, 'IVV.AX')
+
+        queries = executedQueries(mock_cursor)
+        self.assertEqual(queries, [
+            q.refreshDirtyPortfolio(), q.currentPortfolioQuery(),
+            q.refreshDirtyPortfolio(), q.currentPortfolioTickerQuery()
+        ])
+
+    def testTradesLeaveRecomputeToNextRead(self):
         mock_cursor = MagicMock()
-        mock_connect.return_value = mock_conn
-        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
 
-        recordDividend(mock_conn, 'AAPL', 100.0, '2023-10-10')
+        insertNewInvestmentHistory(mock_cursor, 'IVV.AX', 50.0, 10, 5.0, '2026-10-01', 'BUY')
+        insertNewInvestmentHistory(mock_cursor, 'IVV.AX', 55.0, 5, 5.0, '2026-10-02', 'SELL')
+
+        # The insert trigger marks the ticker dirty, nothing is recomputed by the write itself
+        self.assertEqual(executedQueries(mock_cursor), [q.investmentHistoryInsert(), q.investmentHistoryInsert()])
+
+    @patch('db.crud.execute_values')
+    def testChangedSplitsMarkTickersDirty(self, mock_execute_values):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_execute_values.return_value = [('VAS.AX',), ('IVV.AX',), ('IVV.AX',)]
+
+        tickers = upsertCorporateActions(mock_conn, [('IVV.AX', '2026-10-02', 3.0), ('VAS.AX', '2026-09-01', 2.0), ('NDQ.AX', '2025-01-01', 4.0)])
 
-        mock_cursor.execute.assert_called_once_with(q.dividendsInsert('AAPL', '2023-10-10', 100.0))
+        self.assertEqual(tickers, ['IVV.AX', 'VAS.AX'])
+        mock_cursor.execute.assert_any_call(q.recomputeAdjustmentFactors(), (['IVV.AX', 'VAS.AX'],))
+        self.assertEqual(executedQueries(mock_cursor), [q.recomputeAdjustmentFactors(), q.markPortfolioTickersDirty()])
+        mock_cursor.execute.assert_called_with(q.markPortfolioTickersDirty(), (['IVV.AX', 'VAS.AX'],))
+
+    @patch('db.crud.execute_values')
+    def testUnchangedSplitsMarkNothing(self, mock_execute_values):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_execute_values.return_value = []
+
+        self.assertEqual(upsertCorporateActions(mock_conn, [('IVV.AX', '2026-10-02', 3.0)]), [])
+        mock_cursor.execute.assert_not_called()
+
+class TestDividendEntitlements(unittest.TestCase):
+
+    @patch('db.crud.execute_values')
+    def testDistributionsInsertedInOnePage(self, mock_execute_values):
+        mock_conn = MagicMock()
+        mock_execute_values.return_value = [('IVV.AX', '2026-07-01', 12.5)]
+        distributions = [('IVV.AX', '2026-04-01', 0.5), ('IVV.AX', '2026-07-01', 0.5)]
+
+        recorded = insertDividendEntitlements(mock_conn, distributions)
+
+        self.assertEqual(recorded, [('IVV.AX', '2026-07-01', 12.5)])
+        args, kwargs = mock_execute_values.call_args
+        self.assertEqual(args[1], q.dividendEntitlementsInsert())
+        self.assertEqual(args[2], [
+            ('IVV.AX', '2026-04-01', 0.5, DIVIDEND_PAYMENT_WINDOW_DAYS),
+            ('IVV.AX', '2026-07-01', 0.5, DIVIDEND_PAYMENT_WINDOW_DAYS)
+        ])
+        # Split into pages, a distribution's window couldn't see the next ex-date
+        self.assertEqual(kwargs['page_size'], len(distributions))
+        self.assertTrue(kwargs['fetch'])
+
+    @patch('db.crud.execute_values')
+    def testNoDistributionsSkipsDatabase(self, mock_execute_values):
+        self.assertEqual(insertDividendEntitlements(MagicMock(), []), [])
+        mock_execute_values.assert_not_called()
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,1184 @@
+import os
+import asyncio
+import time
+from datetime import date
+import threading
+import shutil
+import socket
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import requests
+from unittest.mock import patch, MagicMock
+
+from db.crud import toJsonSafe
+from fetchers.async_fetcher import fetchAsync, isFetchCancelled, runFetch
+from fetchers.config import QUOTE_STATUS_LAST_KNOWN, QUOTE_STATUS_UNAVAILABLE, QUOTE_STATUS_OFFLINE
+from fetchers.disk_cache import DiskCache
+from fetchers.price_store import PriceStore
+from fetchers.providers import MarketDataProvider, YfinanceProvider, RecordingProvider, ReplayProvider, OfflineProvider, ProviderError, ProviderRateLimited, getProvider
+from fetchers.scheduler import INTERACTIVE, BACKGROUND, RequestScheduler, TokenBucket
+from fetchers.session_cache import SessionQuoteStore
+import fetchers.yfinance_fetcher as f
+import fetchers.fx as fx
+import fetchers.exposure_fetcher as exposure
+import fetchers.history_fetcher as history
+import fetchers.network as network
+import fetchers.prefetch as prefetch
+import fetchers.scheduler as scheduler
+from utils.table_utils import formatAge, formatQuoteStatusNotes
+
+# No database or network in these tests. Tests of the shared quote cache patch these with an in-memory table,
+# tests of offline mode patch the reachability probe
+sharedCachePatchers = [
+    patch('fetchers.yfinance_fetcher.getQuotesCache', return_value={}),
+    patch('fetchers.yfinance_fetcher.upsertQuotesCache'),
+    patch('fetchers.yfinance_fetcher.get_connection'),
+    patch('fetchers.async_fetcher.get_connection'),
+    patch('fetchers.network.isNetworkReachable', return_value=True)
+]
+
+def setUpModule():
+    for patcher in sharedCachePatchers:
+        patcher.start()
+
+def tearDownModule():
+    for patcher in sharedCachePatchers:
+        patcher.stop()
+
+def defaultSetting(conn, attribute, default=None):
+    return default
+
+def offlineSetting(conn, attribute, default=None):
+    return 'on' if attribute == 'offline_mode' else default
+
+class FakeProvider(MarketDataProvider):
+    """
+    In-memory provider recording which tickers were requested.
+    """
+    name = 'fake'
+
+    def __init__(self, infos=None, prices=None, history=None, dividends=None, splits=None, exposures=None):
+        self.infos = infos or {}
+        self.exposures = exposures or {}
+        self.exposureRequests = []
+        self.prices = prices or {}
+        self.history = history or {}
+        self.dividends = dividends or {}
+        self.splits = splits or {}
+        self.dividendRequests = []
+        self.splitRequests = []
+        self.infoRequests = []
+        self.priceRequests = []
+        self.historyRequests = []
+
+    def getTickerInfo(self, ticker):
+        self.infoRequests.append(ticker)
+        return self.infos.get(ticker, {})
+
+    def getLatestPrices(self, tickers):
+        self.priceRequests.append(list(tickers))
+        return {
+            ticker: self.prices.get(ticker, {'ticker': ticker, 'price': None, 'regularMarketPreviousClose': None})
+            for ticker in tickers
+        }
+
+    def getPriceHistory(self, tickers, start, end):
+        self.historyRequests.append((list(tickers), start, end))
+        return {
+            ticker: [bar for bar in self.history.get(ticker, []) if start <= bar['date'] < end]
+            for ticker in tickers
+        }
+
+    def getDividends(self, tickers, start):
+        self.dividendRequests.append((list(tickers), start))
+        return {ticker: [payment for payment in self.dividends.get(ticker, []) if payment['date'] >= start] for ticker in tickers}
+
+    def getSplits(self, tickers, start):
+        self.splitRequests.append((list(tickers), start))
+        return {ticker: [split for split in self.splits.get(ticker, []) if split['date'] >= start] for ticker in tickers}
+
+    def getFundExposures(self, ticker):
+        self.exposureRequests.append(ticker)
+        return self.exposures.get(ticker, {})
+
+    def isValidTicker(self, ticker):
+        return ticker in self.infos
+
+    def getFearAndGreed(self):
+        return {'value': 42.0, 'description': 'fear'}
+
+class TestQuoteCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.cache = DiskCache(os.path.join(self.tmpDir, 'quotes.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def testDiskCacheRoundTrip(self):
+        self.cache.putMany({'IVV.AX': {'price': 50.0}}, fetchedAt=100)
+
+        # A new instance must read the persisted file
+        reloaded = DiskCache(self.cache.path)
+
+        self.assertEqual(reloaded.getMany(['IVV.AX', 'VAS.AX']), {'IVV.AX': ({'price': 50.0}, 100)})
+
+    def testQuoteFreshnessFollowsMarketState(self):
+        now = time.time()
+        regular = {'marketState': 'REGULAR'}
+        closed = {'marketState': 'CLOSED'}
+
+        self.assertFalse(f.isQuoteFresh(regular, now - 10 * 60, now))
+        self.assertTrue(f.isQuoteFresh(closed, now - 10 * 60, now))
+
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('utils.settings_utils.getSetting')
+    def testFreshCachedQuotesSkipNetwork(self, mock_setting, mock_provider):
+        mock_setting.side_effect = defaultSetting
+        provider = FakeProvider(infos={'VAS.AX': {'ask': 90.0, 'marketState': 'CLOSED'}})
+        mock_provider.return_value = provider
+
+        metadataCache = DiskCache(os.path.join(self.tmpDir, 'metadata.json'))
+        with patch.object(f, 'quoteCache', self.cache), patch.object(f, 'metadataCache', metadataCache), patch.object(f, 'sessionQuotes', SessionQuoteStore()):
+            self.cache.putMany({'IVV.AX': f.buildTickerData('IVV.AX', {'ask': 50.0, 'marketState': 'CLOSED'})})
+            metadataCache.putMany({'IVV.AX': {'fullName': 'iShares S&P 500 ETF'}})
+            data = f.getYfinanceTickerData(MagicMock(), ['IVV.AX', 'VAS.AX'])
+
+        self.assertEqual(provider.infoRequests, ['VAS.AX'])
+        self.assertEqual(list(data.keys()), ['IVV.AX', 'VAS.AX'])
+        self.assertEqual(data['IVV.AX']['price'], 50.0)
+        self.assertEqual(data['VAS.AX']['price'], 90.0)
+        self.assertIn('VAS.AX', self.cache.getMany(['VAS.AX']))
+
+class TestSharedQuoteCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.cache = DiskCache(os.path.join(self.tmpDir, 'prices.json'))
+        self.quoteCache = DiskCache(os.path.join(self.tmpDir, 'quotes.json'))
+        self.table = {}
+        self.writeConns = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def getQuotesCache(self, conn, tickers):
+        return {ticker: self.table[ticker] for ticker in tickers if ticker in self.table}
+
+    def upsertQuotesCache(self, conn, quotes, fetchedAt):
+        self.writeConns.append(conn)
+        self.table.update({ticker: (quote, fetchedAt) for ticker, quote in quotes.items()})
+
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('utils.settings_utils.getSetting')
+    def testOtherSessionsServedFromSharedCache(self, mock_setting, mock_provider):
+        mock_setting.side_effect = defaultSetting
+        provider = FakeProvider(prices={'IVV.AX': {'ticker': 'IVV.AX', 'price': 51.0, 'regularMarketPreviousClose': 50.0}})
+        mock_provider.return_value = provider
+
+        with patch.object(f, 'getQuotesCache', self.getQuotesCache), patch.object(f, 'upsertQuotesCache', self.upsertQuotesCache), patch.object(f, 'priceCache', self.cache), patch.object(f, 'quoteCache', self.quoteCache):
+            with patch.object(f, 'sessionPrices', SessionQuoteStore()):
+                f.getYfinancePriceData(MagicMock(), ['IVV.AX'])
+
+            # A second session with its own session store and an empty disk cache
+            self.cache.clear()
+            with patch.object(f, 'sessionPrices', SessionQuoteStore()):
+                data = f.getYfinancePriceData(MagicMock(), ['IVV.AX'])
+
+        self.assertEqual(provider.priceRequests, [['IVV.AX']])
+        self.assertEqual(data['IVV.AX']['price'], 51.0)
+
+    @patch('fetchers.yfinance_fetcher.get_connection')
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('utils.settings_utils.getSetting')
+    def testFetchThreadsDontShareCallersConnection(self, mock_setting, mock_provider, mock_connection):
+        mock_setting.side_effect = defaultSetting
+        mock_provider.return_value = FakeProvider(prices={'IVV.AX': {'ticker': 'IVV.AX', 'price': 51.0, 'regularMarketPreviousClose': 50.0}})
+        conn = MagicMock()
+        workerConn = MagicMock()
+        mock_connection.return_value = workerConn
+
+        with patch.object(f, 'getQuotesCache', self.getQuotesCache), patch.object(f, 'upsertQuotesCache', self.upsertQuotesCache), patch.object(f, 'priceCache', self.cache), patch.object(f, 'quoteCache', self.quoteCache), patch.object(f, 'sessionPrices', SessionQuoteStore()):
+            f.getYfinancePriceData(conn, ['IVV.AX'], deadline=time.monotonic() + 5)
+
+        self.assertEqual(self.writeConns, [workerConn])
+        workerConn.close.assert_called_once()
+
+    def testJsonSafeQuote(self):
+        self.assertEqual(toJsonSafe({'price': float('nan'), 'eps': [1.0, float('inf')], 'currency': 'AUD'}), {'price': None, 'eps': [1.0, None], 'currency': 'AUD'})
+
+class TestConcurrentFetch(unittest.TestCase):
+
+    def testFetchTickerInfosKeepsTickerOrder(self):
+        tickers = ['IVV.AX', 'VAS.AX', 'NDQ.AX', 'VGS.AX']
+        provider = FakeProvider(infos={ticker: {'ask': i} for i, ticker in enumerate(tickers)})
+
+        infos = f.fetchTickerInfos(RequestScheduler(workers=4, requestsPerSecond=100), provider, tickers)
+
+        self.assertEqual(list(infos.keys()), tickers)
+        self.assertEqual([info['ask'] for info in infos.values()], [0, 1, 2, 3])
+
+class TestRequestScheduler(unittest.TestCase):
+
+    def testInteractiveRequestsRunBeforeBackground(self):
+        scheduler = RequestScheduler(workers=1, requestsPerSecond=100)
+        release = threading.Event()
+        order = []
+
+        # Occupy the only worker so the next requests queue up
+        blocker = scheduler.submit(release.wait, 5)
+        time.sleep(0.05)
+        background = [scheduler.submit(order.append, f"background-{i}", priority=BACKGROUND) for i in range(2)]
+        interactive = scheduler.submit(order.append, "interactive", priority=INTERACTIVE)
+        release.set()
+
+        for future in [blocker, interactive] + background:
+            future.result(5)
+
+        self.assertEqual(order, ["interactive", "background-0", "background-1"])
+
+    @patch('fetchers.scheduler.getBackoffDelay')
+    def testThrottledRequestsRetried(self, mock_backoff):
+        mock_backoff.return_value = 0.01
+        scheduler = RequestScheduler(workers=1, requestsPerSecond=100)
+        responses = [ProviderRateLimited("Too Many Requests"), {}, {'ask': 50.0}]
+
+        def request():
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        info = scheduler.submit(request, isEmpty=lambda info: not info).result(5)
+
+        self.assertEqual(info, {'ask': 50.0})
+        self.assertEqual(mock_backoff.call_count, 2)
+
+    def testQueuedInteractiveRequestsCancelled(self):
+        scheduler = RequestScheduler(workers=1, requestsPerSecond=100)
+        provider = FakeProvider(infos={'IVV.AX': {'ask': 50.0}, 'VAS.AX': {'ask': 90.0}})
+        release = threading.Event()
+
+        blocker = scheduler.submit(release.wait, 5)
+        time.sleep(0.05)
+        background = scheduler.submit(provider.getTickerInfo, 'VAS.AX', priority=BACKGROUND)
+        interactive = scheduler.submit(provider.getTickerInfo, 'IVV.AX')
+        scheduler.cancelQueued(INTERACTIVE)
+        release.set()
+
+        self.assertTrue(blocker.result(5))
+        self.assertEqual(background.result(5), {'ask': 90.0})
+        self.assertTrue(interactive.cancelled())
+        self.assertEqual(provider.infoRequests, ['VAS.AX'])
+
+    @patch('utils.settings_utils.getSetting')
+    def testSchedulerReconfiguredInPlace(self, mock_setting):
+        settings = {'fetch_concurrency': '3', 'requests_per_second': '10'}
+        mock_setting.side_effect = lambda conn, name, default=None: settings.get(name, default)
+
+        with patch.object(scheduler, 'scheduler', None):
+            first = scheduler.getScheduler(MagicMock())
+            settings.update({'fetch_concurrency': '1', 'requests_per_second': '50'})
+            second = scheduler.getScheduler(MagicMock())
+
+            self.assertIs(first, second)
+            self.assertEqual(second.workers, 1)
+            self.assertEqual(second.bucket.rate, 50)
+
+            # Surplus workers exit, the remaining one still serves requests
+            self.assertEqual(second.submit(lambda: 'done').result(5), 'done')
+            time.sleep(0.05)
+            self.assertEqual(second._running, 1)
+
+    def testTokenBucketLimitsRate(self):
+        bucket = TokenBucket(rate=20, capacity=1)
+        started = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+
+        # One token available immediately, the other four refill at 20 per second
+        self.assertGreaterEqual(time.monotonic() - started, 0.18)
+
+class TestPriceOnlyFetch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.quoteCache = DiskCache(os.path.join(self.tmpDir, 'quotes.json'))
+        self.priceCache = DiskCache(os.path.join(self.tmpDir, 'prices.json'))
+        self.metadataCache = DiskCache(os.path.join(self.tmpDir, 'metadata.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    @patch('fetchers.providers.yf.download')
+    def testLatestPricesFromBulkDownload(self, mock_download):
+        columns = pd.MultiIndex.from_product([['IVV.AX', 'VAS.AX'], ['Close']])
+        mock_download.return_value = pd.DataFrame([[50.0, 90.0], [51.0, None]], columns=columns)
+
+        prices = YfinanceProvider().getLatestPrices(['IVV.AX', 'VAS.AX', 'NDQ.AX'])
+
+        mock_download.assert_called_once()
+        self.assertEqual(prices['IVV.AX'], {'ticker': 'IVV.AX', 'price': 51.0, 'regularMarketPreviousClose': 50.0})
+        self.assertEqual(prices['VAS.AX']['price'], 90.0)
+        self.assertIsNone(prices['VAS.AX']['regularMarketPreviousClose'])
+        self.assertIsNone(prices['NDQ.AX']['price'])
+
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('utils.settings_utils.getSetting')
+    def testPriceDataUsesMetadataCache(self, mock_setting, mock_provider):
+        mock_setting.side_effect = defaultSetting
+        provider = FakeProvider(prices={'IVV.AX': {'ticker': 'IVV.AX', 'price': 51.0, 'regularMarketPreviousClose': 50.0}})
+        mock_provider.return_value = provider
+
+        with patch.object(f, 'quoteCache', self.quoteCache), patch.object(f, 'priceCache', self.priceCache), patch.object(f, 'metadataCache', self.metadataCache), patch.object(f, 'sessionQuotes', SessionQuoteStore()), patch.object(f, 'sessionPrices', SessionQuoteStore()):
+            self.metadataCache.putMany({'IVV.AX': {'fullName': 'iShares S&P 500 ETF'}})
+            data = f.getYfinancePriceData(MagicMock(), ['IVV.AX'], includeNames=True)
+
+        self.assertEqual(provider.infoRequests, [])
+        self.assertEqual(provider.priceRequests, [['IVV.AX']])
+        self.assertEqual(data['IVV.AX']['price'], 51.0)
+        self.assertEqual(data['IVV.AX']['fullName'], 'iShares S&P 500 ETF')
+
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('utils.settings_utils.getSetting')
+    def testUnpricedLiveQuoteMarkedUnavailable(self, mock_setting, mock_provider):
+        mock_setting.side_effect = defaultSetting
+        # No close for a delisted ticker
+        provider = FakeProvider(prices={'IVV.AX': {'ticker': 'IVV.AX', 'price': 51.0, 'regularMarketPreviousClose': 50.0}})
+        mock_provider.return_value = provider
+        resolved = {}
+
+        with patch.object(f, 'quoteCache', self.quoteCache), patch.object(f, 'priceCache', self.priceCache), patch.object(f, 'metadataCache', self.metadataCache), patch.object(f, 'sessionQuotes', SessionQuoteStore()), patch.object(f, 'sessionPrices', SessionQuoteStore()):
+            data = f.getYfinancePriceData(MagicMock(), ['IVV.AX', 'DLST.AX'], onQuote=lambda ticker, quote: resolved.update({ticker: quote}))
+
+        self.assertIsNone(data['IVV.AX']['quoteStatus'])
+        self.assertIsNone(data['DLST.AX']['price'])
+        self.assertEqual(data['DLST.AX']['quoteStatus'], QUOTE_STATUS_UNAVAILABLE)
+        self.assertEqual(resolved['DLST.AX']['quoteStatus'], QUOTE_STATUS_UNAVAILABLE)
+        self.assertNotIn('DLST.AX', self.priceCache.getMany(['DLST.AX']))
+
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('utils.settings_utils.getSetting')
+    def testQuotesReportedAsTheyResolve(self, mock_setting, mock_provider):
+        mock_setting.side_effect = defaultSetting
+        provider = FakeProvider(prices={'VAS.AX': {'ticker': 'VAS.AX', 'price': 90.0, 'regularMarketPreviousClose': 89.0}})
+        mock_provider.return_value = provider
+        resolved = []
+
+        def onQuote(ticker, quote):
+            # Cached quotes are reported before the provider is asked for the rest
+            resolved.append((ticker, quote['price'], len(provider.priceRequests)))
+
+        with patch.object(f, 'quoteCache', self.quoteCache), patch.object(f, 'priceCache', self.priceCache), patch.object(f, 'sessionQuotes', SessionQuoteStore()), patch.object(f, 'sessionPrices', SessionQuoteStore()):
+            self.priceCache.putMany({'IVV.AX': {'ticker': 'IVV.AX', 'price': 51.0, 'regularMarketPreviousClose': 50.0, 'marketState': 'CLOSED'}})
+            data = f.getYfinancePriceData(MagicMock(), ['IVV.AX', 'VAS.AX', 'NDQ.AX'], onQuote=onQuote)
+
+        self.assertEqual(resolved, [('IVV.AX', 51.0, 0), ('VAS.AX', 90.0, 1), ('NDQ.AX', None, 1)])
+        self.assertEqual(data['VAS.AX']['price'], 90.0)
+
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('utils.settings_utils.getSetting')
+    def testPricesCachedApartFromFullQuotes(self, mock_setting, mock_provider):
+        mock_setting.side_effect = defaultSetting
+        provider = FakeProvider(prices={'VAS.AX': {'ticker': 'VAS.AX', 'price': 91.0, 'regularMarketPreviousClose': 90.0}})
+        mock_provider.return_value = provider
+
+        with patch.object(f, 'quoteCache', self.quoteCache), patch.object(f, 'priceCache', self.priceCache), patch.object(f, 'sessionQuotes', SessionQuoteStore()), patch.object(f, 'sessionPrices', SessionQuoteStore()):
+            self.quoteCache.putMany({'IVV.AX': f.buildTickerData('IVV.AX', {'ask': 51.0, 'trailingPE': 20.0, 'marketState': 'CLOSED'})})
+            self.quoteCache.putMany({'VAS.AX': f.buildTickerData('VAS.AX', {'ask': 89.0, 'trailingPE': 15.0, 'marketState': 'CLOSED'})}, time.time() - 24 * 60 * 60)
+            data = f.getYfinancePriceData(MagicMock(), ['IVV.AX', 'VAS.AX'])
+
+        # Fresh full quotes serve prices, and fetched prices leave the full quotes' other fields in place
+        self.assertEqual(provider.priceRequests, [['VAS.AX']])
+        self.assertEqual(data['IVV.AX']['price'], 51.0)
+        self.assertEqual(data['VAS.AX']['price'], 91.0)
+        self.assertEqual(self.quoteCache.getMany(['VAS.AX'])['VAS.AX'][0]['peRatio'], 15.0)
+        self.assertEqual(self.priceCache.getMany(['VAS.AX'])['VAS.AX'][0]['price'], 91.0)
+
+class TestFxRates(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.quoteCache = DiskCache(os.path.join(self.tmpDir, 'quotes.json'))
+        self.priceCache = DiskCache(os.path.join(self.tmpDir, 'prices.json'))
+        self.metadataCache = DiskCache(os.path.join(self.tmpDir, 'metadata.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('fetchers.fx.getSetting')
+    @patch('utils.settings_utils.getSetting')
+    def testPairsFetchedTogetherAndCached(self, mock_setting, mock_fx_setting, mock_provider):
+        mock_setting.side_effect = defaultSetting
+        mock_fx_setting.side_effect = defaultSetting
+        provider = FakeProvider(prices={
+            'USDAUD=X': {'ticker': 'USDAUD=X', 'price': 1.5, 'regularMarketPreviousClose': 1.49},
+            'GBPAUD=X': {'ticker': 'GBPAUD=X', 'price': 2.0, 'regularMarketPreviousClose': 1.98}
+        })
+        mock_provider.return_value = provider
+
+        with patch.object(f, 'quoteCache', self.quoteCache), patch.object(f, 'priceCache', self.priceCache), patch.object(f, 'metadataCache', self.metadataCache), patch.object(f, 'sessionQuotes', SessionQuoteStore()), patch.object(f, 'sessionPrices', SessionQuoteStore()):
+            self.metadataCache.putMany({
+                'IVV': {'currency': 'USD'},
+                'VOD.L': {'currency': 'GBp'},
+                'VAS.AX': {'currency': 'AUD'},
+                'SPY': {'currency': 'USD'}
+            })
+            rates = fx.getTickerFxRates(MagicMock(), ['IVV', 'VOD.L', 'VAS.AX', 'SPY'])
+            fx.getFxRates(MagicMock(), ['USD', 'GBP'])
+
+        self.assertEqual(provider.priceRequests, [['GBPAUD=X', 'USDAUD=X']])
+        self.assertEqual(rates.to_dict(), {'IVV': 1.5, 'VOD.L': 0.02, 'VAS.AX': 1.0, 'SPY': 1.5})
+
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('fetchers.fx.getSetting')
+    @patch('utils.settings_utils.getSetting')
+    def testCachedTickersNeverFetchMetadata(self, mock_setting, mock_fx_setting, mock_provider):
+        mock_setting.side_effect = defaultSetting
+        mock_fx_setting.side_effect = defaultSetting
+        provider = FakeProvider(prices={'USDAUD=X': {'ticker': 'USDAUD=X', 'price': 1.5, 'regularMarketPreviousClose': 1.49}})
+        mock_provider.return_value = provider
+
+        with patch.object(f, 'quoteCache', self.quoteCache), patch.object(f, 'priceCache', self.priceCache), patch.object(f, 'metadataCache', self.metadataCache), patch.object(f, 'sessionQuotes', SessionQuoteStore()), patch.object(f, 'sessionPrices', SessionQuoteStore()):
+            self.metadataCache.putMany({'IVV': {'currency': 'USD'}, 'SPY': {'currency': 'USD'}}, time.time() - 365 * 24 * 60 * 60)
+            self.metadataCache.putMany({'VAS.AX': {'currency': 'AUD'}})
+            rates = fx.getTickerFxRates(MagicMock(), ['VAS.AX'], cachedTickers=['IVV', 'SPY', 'XYZ'])
+
+        self.assertEqual(provider.infoRequests, [])
+        self.assertEqual(rates.to_dict(), {'VAS.AX': 1.0, 'IVV': 1.5, 'SPY': 1.5, 'XYZ': 1.0})
+
+    def testConversionAlignedByTicker(self):
+        rates = pd.Series({'IVV': 1.5, 'VAS.AX': 1.0, 'XYZ': float('nan')})
+        amounts = pd.DataFrame({'cost': [100.0, 200.0, 300.0], 'dividends': [10.0, None, 5.0]}, index=['VAS.AX', 'IVV', 'XYZ'])
+
+        converted = fx.toBaseCurrency(amounts, rates)
+
+        self.assertEqual(list(converted['cost']), [100.0, 300.0, 300.0])
+        self.assertEqual(list(converted['dividends'].fillna(-1)), [10.0, -1, 5.0])
+
+class TestMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.metadataCache = DiskCache(os.path.join(self.tmpDir, 'metadata.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('utils.settings_utils.getSetting')
+    def testExpiredMetadataRefetched(self, mock_setting, mock_provider):
+        mock_setting.side_effect = defaultSetting
+        provider = FakeProvider(infos={'VAS.AX': {'longName': 'Vanguard Australian Shares', 'currency': 'AUD'}})
+        mock_provider.return_value = provider
+
+        with patch.object(f, 'metadataCache', self.metadataCache):
+            self.metadataCache.putMany({'IVV.AX': {'fullName': 'iShares S&P 500 ETF', 'currency': 'AUD'}})
+            self.metadataCache.putMany({'VAS.AX': {'fullName': 'Old name', 'currency': 'AUD'}}, time.time() - 30 * 24 * 60 * 60)
+            metadata = f.getTickerMetadata(MagicMock(), ['IVV.AX', 'VAS.AX'])
+
+        self.assertEqual(provider.infoRequests, ['VAS.AX'])
+        self.assertEqual(metadata['IVV.AX']['fullName'], 'iShares S&P 500 ETF')
+        self.assertEqual(metadata['VAS.AX']['fullName'], 'Vanguard Australian Shares')
+        self.assertEqual(self.metadataCache.getMany(['VAS.AX'])['VAS.AX'][0]['fullName'], 'Vanguard Australian Shares')
+
+class TestFieldProjection(unittest.TestCase):
+
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('utils.settings_utils.getSetting')
+    def testQuoteFrameProjection(self, mock_setting, mock_provider):
+        mock_setting.side_effect = lambda conn, attribute, default=None: 'false' if attribute == 'quote_cache_enabled' else default
+        mock_provider.return_value = FakeProvider(infos={
+            'IVV.AX': {'longName': 'iShares S&P 500 ETF', 'trailingPE': 25.5},
+            'VAS.AX': {'longName': None, 'trailingPE': None}
+        })
+
+        with patch.object(f, 'metadataCache', MagicMock()):
+            frame = f.getYfinanceTickerData(MagicMock(), ['IVV.AX', 'VAS.AX'], fields=['fullName', 'peRatio'], asFrame=True)
+
+        self.assertEqual(list(frame.columns), ['fullName', 'peRatio'])
+        self.assertEqual(frame['peRatio'].dtype, float)
+        self.assertEqual(frame.at['IVV.AX', 'peRatio'], 25.5)
+        self.assertTrue(pd.isna(frame.at['VAS.AX', 'peRatio']))
+        self.assertIsNone(frame.at['VAS.AX', 'fullName'])
+
+    def testUnknownFieldRejected(self):
+        with self.assertRaises(ValueError):
+            f.getYfinanceTickerData(MagicMock(), ['IVV.AX'], fields=['notAField'])
+
+class TestSessionCoalescing(unittest.TestCase):
+
+    def testConcurrentRequestsShareOneFetch(self):
+        store = SessionQuoteStore()
+        started = threading.Event()
+        release = threading.Event()
+        requested = []
+
+        def fetchMissing(tickers):
+            requested.append(list(tickers))
+            started.set()
+            release.wait(5)
+            return {ticker: ({'ticker': ticker, 'price': 1.0}, time.time()) for ticker in tickers}
+
+        isUsable = lambda quote, fetchedAt: True
+        results = {}
+        first = threading.Thread(target=lambda: results.update(first=store.fetch(['IVV.AX'], fetchMissing, isUsable)))
+        first.start()
+        started.wait(5)
+        second = threading.Thread(target=lambda: results.update(second=store.fetch(['IVV.AX', 'VAS.AX'], fetchMissing, isUsable)))
+        second.start()
+        time.sleep(0.05)
+        release.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(requested, [['IVV.AX'], ['VAS.AX']])
+        self.assertEqual(set(results['second'].keys()), {'IVV.AX', 'VAS.AX'})
+
+        # Later requests are served from the session without fetching
+        store.fetch(['IVV.AX', 'VAS.AX'], fetchMissing, isUsable)
+        self.assertEqual(len(requested), 2)
+
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('utils.settings_utils.getSetting')
+    def testPricesHeldApartFromFullQuotes(self, mock_setting, mock_provider):
+        mock_setting.side_effect = lambda conn, attribute, default=None: 'false' if attribute == 'stale_while_revalidate' else default
+        provider = FakeProvider(prices={'IVV.AX': {'ticker': 'IVV.AX', 'price': 51.0, 'regularMarketPreviousClose': 50.0}})
+        mock_provider.return_value = provider
+        tmpDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpDir)
+        quotes, prices = SessionQuoteStore(), SessionQuoteStore()
+
+        with patch.object(f, 'quoteCache', DiskCache(os.path.join(tmpDir, 'quotes.json'))), patch.object(f, 'priceCache', DiskCache(os.path.join(tmpDir, 'prices.json'))):
+            with patch.object(f, 'sessionQuotes', quotes), patch.object(f, 'sessionPrices', prices):
+                quotes.putMany({'IVV.AX': (f.buildTickerData('IVV.AX', {'ask': 49.0, 'trailingPE': 20.0, 'marketState': 'CLOSED'}), time.time() - 24 * 60 * 60)})
+                f.getYfinancePriceData(MagicMock(), ['IVV.AX'])
+
+        # The expired full quote is refetched as a price, without losing its other fields
+        self.assertEqual(provider.priceRequests, [['IVV.AX']])
+        self.assertEqual(quotes.getMany(['IVV.AX'])['IVV.AX'][0]['peRatio'], 20.0)
+        self.assertEqual(prices.getMany(['IVV.AX'])['IVV.AX'][0]['price'], 51.0)
+
+class TestRecordReplayProviders(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def testReplayServesRecordedResponses(self):
+        live = FakeProvider(
+            infos={'IVV.AX': {'ask': 50.0}},
+            prices={'IVV.AX': {'ticker': 'IVV.AX', 'price': 51.0, 'regularMarketPreviousClose': 50.0}}
+        )
+        recorder = RecordingProvider(live, self.tmpDir)
+        recorder.getTickerInfo('IVV.AX')
+        recorder.getLatestPrices(['IVV.AX'])
+        recorder.getFearAndGreed()
+
+        replay = ReplayProvider(self.tmpDir)
+
+        self.assertEqual(replay.getTickerInfo('IVV.AX'), {'ask': 50.0})
+        self.assertEqual(replay.getLatestPrices(['IVV.AX', 'VAS.AX'])['IVV.AX']['price'], 51.0)
+        self.assertIsNone(replay.getLatestPrices(['VAS.AX'])['VAS.AX']['price'])
+        self.assertEqual(replay.getFearAndGreed()['value'], 42.0)
+        with self.assertRaises(ProviderError):
+            replay.getTickerInfo('VAS.AX')
+
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('utils.settings_utils.getSetting')
+    def testRecordingBypassesQuoteCaches(self, mock_setting, mock_provider):
+        mock_setting.side_effect = lambda conn, attribute, default=None: 'record' if attribute == 'market_data_provider' else default
+        live = FakeProvider(prices={'IVV.AX': {'ticker': 'IVV.AX', 'price': 51.0, 'regularMarketPreviousClose': 50.0}})
+        mock_provider.return_value = RecordingProvider(live, self.tmpDir)
+        quoteCache = DiskCache(os.path.join(self.tmpDir, 'quotes.json'))
+        priceCache = DiskCache(os.path.join(self.tmpDir, 'prices.json'))
+
+        with patch.object(f, 'quoteCache', quoteCache), patch.object(f, 'priceCache', priceCache), patch.object(f, 'sessionQuotes', SessionQuoteStore()), patch.object(f, 'sessionPrices', SessionQuoteStore()):
+            f.getYfinancePriceData(MagicMock(), ['IVV.AX'])
+            f.getYfinancePriceData(MagicMock(), ['IVV.AX'])
+
+        # Every request is recorded, and nothing recorded is cached to be served as live later
+        self.assertEqual(live.priceRequests, [['IVV.AX'], ['IVV.AX']])
+        self.assertEqual(priceCache.getMany(['IVV.AX']), {})
+
+class TestStaleWhileRevalidate(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.cache = DiskCache(os.path.join(self.tmpDir, 'prices.json'))
+        self.quoteCache = DiskCache(os.path.join(self.tmpDir, 'quotes.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('utils.settings_utils.getSetting')
+    def testStaleQuotesServedThenRefreshed(self, mock_setting, mock_provider):
+        mock_setting.side_effect = defaultSetting
+        provider = FakeProvider(prices={
+            'IVV.AX': {'ticker': 'IVV.AX', 'price': 51.0, 'regularMarketPreviousClose': 50.0},
+            'VAS.AX': {'ticker': 'VAS.AX', 'price': 90.0, 'regularMarketPreviousClose': 89.0}
+        })
+        mock_provider.return_value = provider
+        refreshed = threading.Event()
+        notices = []
+
+        def onRefresh(stale, fresh):
+            notices.append((stale, fresh))
+            refreshed.set()
+
+        staleFetchedAt = time.time() - 24 * 60 * 60
+        with patch.object(f, 'priceCache', self.cache), patch.object(f, 'quoteCache', self.quoteCache), patch.object(f, 'sessionQuotes', SessionQuoteStore()), patch.object(f, 'sessionPrices', SessionQuoteStore()):
+            self.cache.putMany({'IVV.AX': {'ticker': 'IVV.AX', 'price': 49.0, 'regularMarketPreviousClose': 48.0}}, staleFetchedAt)
+            data = f.getYfinancePriceData(MagicMock(), ['IVV.AX', 'VAS.AX'], onRefresh=onRefresh)
+            self.assertTrue(refreshed.wait(5))
+
+        # The stale quote is served as is, only the uncached ticker is fetched before returning
+        self.assertEqual(data['IVV.AX']['price'], 49.0)
+        self.assertEqual(data['IVV.AX']['fetchedAt'], staleFetchedAt)
+        self.assertEqual(data['VAS.AX']['price'], 90.0)
+        self.assertCountEqual(provider.priceRequests, [['VAS.AX'], ['IVV.AX']])
+
+        stale, fresh = notices[0]
+        self.assertEqual(stale['IVV.AX']['price'], 49.0)
+        self.assertEqual(fresh['IVV.AX']['price'], 51.0)
+
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('utils.settings_utils.getSetting')
+    def testVeryOldQuotesFetchedBeforeReturning(self, mock_setting, mock_provider):
+        mock_setting.side_effect = defaultSetting
+        provider = FakeProvider(prices={'IVV.AX': {'ticker': 'IVV.AX', 'price': 51.0, 'regularMarketPreviousClose': 50.0}})
+        mock_provider.return_value = provider
+        onRefresh = MagicMock()
+
+        with patch.object(f, 'priceCache', self.cache), patch.object(f, 'quoteCache', self.quoteCache), patch.object(f, 'sessionQuotes', SessionQuoteStore()), patch.object(f, 'sessionPrices', SessionQuoteStore()):
+            self.cache.putMany({'IVV.AX': {'ticker': 'IVV.AX', 'price': 40.0, 'regularMarketPreviousClose': 39.0}}, time.time() - 30 * 24 * 60 * 60)
+            data = f.getYfinancePriceData(MagicMock(), ['IVV.AX'], onRefresh=onRefresh)
+
+        self.assertEqual(data['IVV.AX']['price'], 51.0)
+        self.assertIsNone(data['IVV.AX']['quoteStatus'])
+        onRefresh.assert_not_called()
+
+    def testFormatAge(self):
+        self.assertEqual(formatAge(100, now=145), '45s')
+        self.assertEqual(formatAge(0, now=3 * 60 * 60), '3h')
+        self.assertEqual(formatAge(None), '-')
+
+class TestFetchDeadline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.cache = DiskCache(os.path.join(self.tmpDir, 'quotes.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    @patch('fetchers.yfinance_fetcher.getScheduler')
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('utils.settings_utils.getSetting')
+    def testSlowTickersMarkedAfterDeadline(self, mock_setting, mock_provider, mock_scheduler):
+        mock_setting.side_effect = lambda conn, attribute, default=None: 'false' if attribute == 'stale_while_revalidate' else default
+        # Its own scheduler, as earlier tests can leave the shared one's token bucket drained or backing off
+        mock_scheduler.return_value = RequestScheduler(workers=4, requestsPerSecond=100)
+        release = threading.Event()
+
+        class SlowProvider(FakeProvider):
+            def getTickerInfo(self, ticker):
+                if ticker != 'IVV.AX':
+                    release.wait(5)
+                return super().getTickerInfo(ticker)
+
+        mock_provider.return_value = SlowProvider(infos={
+            'IVV.AX': {'ask': 51.0, 'marketState': 'CLOSED'},
+            'VAS.AX': {'ask': 91.0, 'marketState': 'CLOSED'},
+            'NDQ.AX': {'ask': 41.0, 'marketState': 'CLOSED'}
+        })
+
+        store = SessionQuoteStore()
+        with patch.object(f, 'quoteCache', self.cache), patch.object(f, 'metadataCache', MagicMock()), patch.object(f, 'sessionQuotes', store):
+            self.cache.putMany({'VAS.AX': f.buildTickerData('VAS.AX', {'ask': 90.0, 'marketState': 'CLOSED'})}, time.time() - 24 * 60 * 60)
+            started = time.monotonic()
+            data = f.getYfinanceTickerData(
+                MagicMock(),
+                ['IVV.AX', 'VAS.AX', 'NDQ.AX'],
+                fields=['price', 'peRatio', 'quoteStatus'],
+                deadline=time.monotonic() + 0.3
+            )
+            elapsed = time.monotonic() - started
+
+            # The late fetch still completes in the background and reaches the session
+            release.set()
+            for _ in range(50):
+                if len(store.getMany(['VAS.AX', 'NDQ.AX'])) == 2:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(store.getMany(['NDQ.AX'])['NDQ.AX'][0]['price'], 41.0)
+
+        self.assertLess(elapsed, 2)
+        self.assertEqual(data['IVV.AX']['price'], 51.0)
+        self.assertIsNone(data['IVV.AX']['quoteStatus'])
+        self.assertEqual(data['VAS.AX']['price'], 90.0)
+        self.assertEqual(data['VAS.AX']['quoteStatus'], QUOTE_STATUS_LAST_KNOWN)
+        self.assertIsNone(data['NDQ.AX']['price'])
+        self.assertEqual(data['NDQ.AX']['quoteStatus'], QUOTE_STATUS_UNAVAILABLE)
+
+class TestOfflineMode(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.cache = DiskCache(os.path.join(self.tmpDir, 'prices.json'))
+        self.quoteCache = DiskCache(os.path.join(self.tmpDir, 'quotes.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    @patch('fetchers.yfinance_fetcher.getProvider')
+    @patch('utils.settings_utils.getSetting')
+    def testOfflineServesLastKnownQuotes(self, mock_setting, mock_provider):
+        mock_setting.side_effect = offlineSetting
+        provider = FakeProvider()
+        mock_provider.return_value = provider
+
+        staleFetchedAt = time.time() - 24 * 60 * 60
+        with patch.object(f, 'priceCache', self.cache), patch.object(f, 'quoteCache', self.quoteCache), patch.object(f, 'sessionQuotes', SessionQuoteStore()), patch.object(f, 'sessionPrices', SessionQuoteStore()):
+            self.cache.putMany({'IVV.AX': {'ticker': 'IVV.AX', 'price': 49.0, 'regularMarketPreviousClose': 48.0}}, staleFetchedAt)
+            self.cache.putMany({'VAS.AX': {'ticker': 'VAS.AX', 'price': 90.0, 'regularMarketPreviousClose': 89.0, 'marketState': 'CLOSED'}})
+            data = f.getYfinancePriceData(MagicMock(), ['IVV.AX', 'VAS.AX', 'VGS.AX'])
+
+        self.assertEqual(provider.priceRequests, [])
+        self.assertEqual(data['IVV.AX']['price'], 49.0)
+        self.assertEqual(data['IVV.AX']['quoteStatus'], QUOTE_STATUS_OFFLINE)
+        self.assertEqual(data['IVV.AX']['fetchedAt'], staleFetchedAt)
+        self.assertIsNone(data['VAS.AX']['quoteStatus'])
+        self.assertEqual(data['VGS.AX']['quoteStatus'], QUOTE_STATUS_UNAVAILABLE)
+
+    @patch('fetchers.providers.getSetting')
+    @patch('utils.settings_utils.getSetting')
+    def testUnreachableNetworkDetected(self, mock_setting, mock_provider_setting):
+        mock_setting.side_effect = defaultSetting
+        mock_provider_setting.side_effect = defaultSetting
+
+        with patch('fetchers.network.isNetworkReachable', return_value=False):
+            provider = getProvider(MagicMock())
+
+        self.assertIsInstance(provider, OfflineProvider)
+        with self.assertRaises(ProviderError):
+            provider.getLatestPrices(['IVV.AX'])
+
+    def testProbeFailsFastForClosedPort(self):
+        with socket.socket() as listener:
+            listener.bind(('127.0.0.1', 0))
+            port = listener.getsockname()[1]
+
+        started = time.monotonic()
+        self.assertFalse(network.probeNetwork('127.0.0.1', port, timeout=0.5))
+        self.assertLess(time.monotonic() - started, 1)
+
+    def testOfflineNoteIncludesAsOf(self):
+        fetchedAt = time.mktime((2026, 10, 17, 16, 10, 0, 0, 0, -1))
+        notes = formatQuoteStatusNotes([None, QUOTE_STATUS_OFFLINE, QUOTE_STATUS_OFFLINE], [time.time(), fetchedAt, fetchedAt + 60])
+
+        self.assertEqual(notes, "~ Offline, showing last known price as of 2026-10-17 16:10")
+
+class TestAsyncFetch(unittest.TestCase):
+
+    def testRunFetchReturnsResult(self):
+        fetch = lambda conn, tickers, fields=None: {ticker: fields for ticker in tickers}
+
+        self.assertEqual(runFetch(MagicMock(), fetch, ['IVV.AX'], fields=['price']), {'IVV.AX': ['price']})
+
+    @patch('fetchers.async_fetcher.getScheduler')
+    def testCancellingDropsQueuedRequests(self, mock_scheduler):
+        release = threading.Event()
+
+        async def cancelFetch():
+            task = asyncio.ensure_future(fetchAsync(MagicMock(), lambda conn: release.wait(5)))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancelFetch())
+        release.set()
+
+        mock_scheduler.return_value.cancelQueued.assert_called_once_with(INTERACTIVE)
+
+    @patch('fetchers.async_fetcher.get_connection')
+    @patch('fetchers.async_fetcher.getScheduler')
+    def testCancelledFetchRunsOnItsOwnConnection(self, mock_scheduler, mock_connection):
+        conn = MagicMock()
+        fetchConn = MagicMock()
+        mock_connection.return_value = fetchConn
+        release = threading.Event()
+        done = threading.Event()
+        seen = []
+
+        def fetch(fetchConn):
+            release.wait(5)
+            seen.append((fetchConn, isFetchCancelled(fetchConn)))
+            done.set()
+
+        async def cancelFetch():
+            task = asyncio.ensure_future(fetchAsync(conn, fetch))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancelFetch())
+        release.set()
+        done.wait(5)
+        time.sleep(0.05)
+
+        self.assertEqual(seen, [(fetchConn, True)])
+        fetchConn.close.assert_called_once()
+        self.assertFalse(isFetchCancelled(fetchConn))
+
+    def testCallerCallbacksRunOnCallingThread(self):
+        callbackThreads = []
+
+        def fetch(conn, tickers, onQuote=None):
+            for ticker in tickers:
+                onQuote(ticker)
+            return threading.current_thread()
+
+        fetchThread = runFetch(MagicMock(), fetch, ['IVV.AX', 'VAS.AX'], onQuote=lambda ticker: callbackThreads.append(threading.current_thread()), callerCallbacks=['onQuote'])
+
+        self.assertEqual(callbackThreads, [threading.current_thread()] * 2)
+        self.assertIsNot(fetchThread, threading.current_thread())
+
+def makeBar(day, close):
+    return {'date': day, 'open': close, 'high': close, 'low': close, 'close': close, 'adjClose': close}
+
+class TestPriceHistorySync(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.store = PriceStore(self.tmpDir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    @patch('fetchers.history_fetcher.getFirstInvestmentDates')
+    @patch('fetchers.history_fetcher.getPriceHistoryRanges')
+    def testOnlyMissingRangesRequested(self, mock_ranges, mock_first_dates):
+        mock_ranges.return_value = {
+            'IVV.AX': (date(2024, 1, 2), date(2026, 10, 16)),
+            'VAS.AX': (date(2024, 1, 2), date(2026, 10, 16))
+        }
+        mock_first_dates.return_value = {'IVV.AX': date(2024, 1, 2), 'VAS.AX': date(2023, 6, 1), 'NDQ.AX': date(2025, 3, 3)}
+
+        ranges = history.getMissingPriceHistoryRanges(MagicMock(), ['IVV.AX', 'VAS.AX', 'NDQ.AX', '^AXJO'], today=date(2026, 10, 17))
+
+        end = date(2026, 10, 18)
+        self.assertEqual(ranges['IVV.AX'], [(date(2026, 10, 16), end)])
+        self.assertEqual(ranges['VAS.AX'], [(date(2023, 6, 1), date(2024, 1, 2)), (date(2026, 10, 16), end)])
+        self.assertEqual(ranges['NDQ.AX'], [(date(2025, 3, 3), end)])
+        self.assertEqual(ranges['^AXJO'][0][0].year, 2026 - history.PRICE_HISTORY_DEFAULT_YEARS)
+
+    @patch('fetchers.history_fetcher.upsertPriceHistory')
+    @patch('fetchers.history_fetcher.getMissingPriceHistoryRanges')
+    @patch('fetchers.history_fetcher.getScheduler')
+    @patch('fetchers.history_fetcher.getProvider')
+    def testTickersWithSameRangeDownloadedTogether(self, mock_provider, mock_scheduler, mock_ranges, mock_upsert):
+        provider = FakeProvider(history={
+            'IVV.AX': [makeBar('2026-10-16', 50.0), makeBar('2026-10-17', 51.0)],
+            'VAS.AX': [makeBar('2026-10-17', 90.0)]
+        })
+        mock_provider.return_value = provider
+        mock_scheduler.return_value = RequestScheduler(workers=2, requestsPerSecond=100)
+        mock_ranges.return_value = {
+            'IVV.AX': [(date(2026, 10, 16), date(2026, 10, 18))],
+            'VAS.AX': [(date(2026, 10, 16), date(2026, 10, 18))]
+        }
+        mock_upsert.side_effect = lambda conn, rows, replaceTickers: len(rows)
+        self.store.write('IVV.AX', [makeBar('2026-10-15', 49.0)])
+        self.store.write('VAS.AX', [makeBar('2026-10-15', 89.0)])
+
+        with patch.object(history, 'priceStore', self.store):
+            counts = history.syncPriceHistory(MagicMock(), ['IVV.AX', 'VAS.AX'])
+
+        self.assertEqual(provider.historyRequests, [(['IVV.AX', 'VAS.AX'], '2026-10-16', '2026-10-18')])
+        self.assertEqual(counts, {'IVV.AX': 2, 'VAS.AX': 1})
+        # The whole download is stored in one COPY
+        self.assertEqual(mock_upsert.call_count, 1)
+        storedRows = mock_upsert.call_args.args[1]
+        self.assertIn(('VAS.AX', '2026-10-17', 90.0, 90.0, 90.0, 90.0, 90.0), storedRows)
+        self.assertEqual(list(self.store.read('IVV.AX')['close']), [49.0, 50.0, 51.0])
+
+    @patch('fetchers.scheduler.FETCH_MAX_RETRIES', 0)
+    @patch('fetchers.history_fetcher.upsertPriceHistory')
+    @patch('fetchers.history_fetcher.getMissingPriceHistoryRanges')
+    @patch('fetchers.history_fetcher.getScheduler')
+    @patch('fetchers.history_fetcher.getProvider')
+    def testRateLimitedDownloadSkipped(self, mock_provider, mock_scheduler, mock_ranges, mock_upsert):
+        provider = FakeProvider(history={'VAS.AX': [makeBar('2026-10-17', 90.0)]})
+
+        def getPriceHistory(tickers, start, end):
+            if 'IVV.AX' in tickers:
+                raise ProviderRateLimited("Too many requests")
+            return FakeProvider.getPriceHistory(provider, tickers, start, end)
+
+        provider.getPriceHistory = getPriceHistory
+        mock_provider.return_value = provider
+        mock_scheduler.return_value = RequestScheduler(workers=2, requestsPerSecond=100)
+        mock_ranges.return_value = {
+            'IVV.AX': [(date(2026, 10, 1), date(2026, 10, 18))],
+            'VAS.AX': [(date(2026, 10, 16), date(2026, 10, 18))]
+        }
+        mock_upsert.side_effect = lambda conn, rows, replaceTickers: len(rows)
+        self.store.write('IVV.AX', [makeBar('2026-09-30', 49.0)])
+        self.store.write('VAS.AX', [makeBar('2026-10-15', 89.0)])
+
+        with patch.object(history, 'priceStore', self.store), patch('builtins.print') as mock_print:
+            counts = history.syncPriceHistory(MagicMock(), ['IVV.AX', 'VAS.AX'])
+
+        # The other download is still stored, and the throttled ticker keeps what it had
+        self.assertEqual(counts, {'IVV.AX': 0, 'VAS.AX': 1})
+        self.assertEqual(list(self.store.read('IVV.AX')['close']), [49.0])
+        self.assertIn("Couldn't fetch price history for IVV.AX", mock_print.call_args[0][0])
+
+    @patch('fetchers.history_fetcher.getPriceHistory')
+    @patch('fetchers.history_fetcher.upsertPriceHistory')
+    @patch('fetchers.history_fetcher.getMissingPriceHistoryRanges')
+    @patch('fetchers.history_fetcher.getScheduler')
+    @patch('fetchers.history_fetcher.getProvider')
+    def testPriceStoreFilledFromDatabase(self, mock_provider, mock_scheduler, mock_ranges, mock_upsert, mock_history):
+        mock_provider.return_value = FakeProvider(history={'IVV.AX': [makeBar('2026-10-17', 51.0)]})
+        mock_scheduler.return_value = RequestScheduler(workers=1, requestsPerSecond=100)
+        mock_ranges.return_value = {'IVV.AX': [(date(2026, 10, 16), date(2026, 10, 18))]}
+        mock_upsert.side_effect = lambda conn, rows, replaceTickers: len(rows)
+        mock_history.return_value = [
+            (date(2026, 10, 16), 50.0, 50.0, 50.0, 50.0, 50.0),
+            (date(2026, 10, 17), 51.0, 51.0, 51.0, 51.0, 51.0)
+        ]
+
+        with patch.object(history, 'priceStore', self.store):
+            history.syncPriceHistory(MagicMock(), ['IVV.AX'])
+
+        self.assertEqual(list(self.store.read('IVV.AX')['close']), [50.0, 51.0])
+
+    @patch('fetchers.history_fetcher.upsertPriceHistory')
+    @patch('fetchers.history_fetcher.getFirstInvestmentDates')
+    @patch('fetchers.history_fetcher.getPriceHistoryRanges')
+    @patch('fetchers.history_fetcher.getScheduler')
+    @patch('fetchers.history_fetcher.getProvider')
+    def testSplitTickersRefetchedInFull(self, mock_provider, mock_scheduler, mock_ranges, mock_first_dates, mock_upsert):
+        provider = FakeProvider(history={
+            'IVV.AX': [makeBar('2024-01-02', 25.0), makeBar('2026-10-17', 51.0)],
+            'VAS.AX': [makeBar('2026-10-17', 90.0)]
+        })
+        mock_provider.return_value = provider
+        mock_scheduler.return_value = RequestScheduler(workers=1, requestsPerSecond=100)
+        mock_ranges.return_value = {
+            'IVV.AX': (date(2024, 1, 2), date(2026, 10, 16)),
+            'VAS.AX': (date(2024, 1, 2), date(2026, 10, 16))
+        }
+        mock_first_dates.return_value = {'IVV.AX': date(2024, 1, 2), 'VAS.AX': date(2024, 1, 2)}
+        mock_upsert.side_effect = lambda conn, rows, replaceTickers: len(rows)
+        self.store.write('IVV.AX', [makeBar('2024-01-02', 50.0), makeBar('2026-10-16', 100.0)])
+        self.store.write('VAS.AX', [makeBar('2026-10-16', 89.0)])
+
+        with patch.object(history, 'priceStore', self.store):
+            history.syncPriceHistory(MagicMock(), ['IVV.AX', 'VAS.AX'], today=date(2026, 10, 17), refetchTickers=['IVV.AX'])
+
+        self.assertIn((['IVV.AX'], '2024-01-02', '2026-10-18'), provider.historyRequests)
+        self.assertEqual([call.args[2] for call in mock_upsert.call_args_list if 'IVV.AX' in call.args[2]], [['IVV.AX']])
+        # The pre-split prices are replaced, not merged with the new scale
+        self.assertEqual(list(self.store.read('IVV.AX')['close']), [25.0, 51.0])
+        self.assertEqual(list(self.store.read('VAS.AX')['close']), [89.0, 90.0])
+
+    @patch('fetchers.providers.yf.download')
+    def testPriceHistoryFromBulkDownload(self, mock_download):
+        columns = pd.MultiIndex.from_product([['IVV.AX', 'VAS.AX'], ['Open', 'High', 'Low', 'Close', 'Adj Close']])
+        index = pd.to_datetime(['2026-10-16', '2026-10-17'])
+        mock_download.return_value = pd.DataFrame(
+            [[50.0, 52.0, 49.0, 51.0, 50.5, 90.0, 91.0, 89.0, None, None], [51.0, 53.0, 50.0, 52.0, 51.5, 90.0, 92.0, 89.5, 91.0, 91.0]],
+            index=index,
+            columns=columns
+        )
+
+        prices = YfinanceProvider().getPriceHistory(['IVV.AX', 'VAS.AX'], '2026-10-16', '2026-10-18')
+
+        self.assertEqual(prices['IVV.AX'][0], {'date': '2026-10-16', 'open': 50.0, 'high': 52.0, 'low': 49.0, 'close': 51.0, 'adjClose': 50.5})
+        self.assertEqual([bar['date'] for bar in prices['VAS.AX']], ['2026-10-17'])
+
+class TestDividendSync(unittest.TestCase):
+
+    @patch('fetchers.history_fetcher.getFirstInvestmentDates')
+    @patch('fetchers.history_fetcher.getScheduler')
+    @patch('fetchers.history_fetcher.getProvider')
+    def testDistributionsSinceFirstInvestmentFetchedTogether(self, mock_provider, mock_scheduler, mock_first_dates):
+        provider = FakeProvider(dividends={
+            'IVV.AX': [{'date': '2024-01-02', 'amount': 0.5}, {'date': '2025-07-01', 'amount': 0.6}],
+            'VAS.AX': [{'date': '2025-01-02', 'amount': 0.9}]
+        })
+        mock_provider.return_value = provider
+        mock_scheduler.return_value = RequestScheduler(workers=1, requestsPerSecond=100)
+        mock_first_dates.return_value = {'IVV.AX': date(2025, 1, 1), 'VAS.AX': date(2024, 6, 1)}
+
+        distributions = history.fetchDividendHistory(MagicMock(), ['IVV.AX', 'VAS.AX'])
+
+        self.assertEqual(provider.dividendRequests, [(['IVV.AX', 'VAS.AX'], '2024-06-01')])
+        self.assertEqual(distributions, [('IVV.AX', '2025-07-01', 0.6), ('VAS.AX', '2025-01-02', 0.9)])
+
+    @patch('fetchers.providers.yf.download')
+    def testDividendsFromBulkDownload(self, mock_download):
+        columns = pd.MultiIndex.from_product([['IVV.AX', 'VAS.AX'], ['Close', 'Dividends']])
+        index = pd.to_datetime(['2026-10-01', '2026-10-02'])
+        mock_download.return_value = pd.DataFrame([[50.0, 0.0, 90.0, 0.85], [51.0, 0.0, 91.0, 0.0]], index=index, columns=columns)
+
+        dividends = YfinanceProvider().getDividends(['IVV.AX', 'VAS.AX'], '2026-01-01')
+
+        self.assertEqual(dividends, {'IVV.AX': [], 'VAS.AX': [{'date': '2026-10-01', 'amount': 0.85}]})
+
+class TestSplitSync(unittest.TestCase):
+
+    @patch('fetchers.history_fetcher.getFirstInvestmentDates')
+    @patch('fetchers.history_fetcher.getScheduler')
+    @patch('fetchers.history_fetcher.getProvider')
+    def testSplitsSinceFirstInvestmentFetchedTogether(self, mock_provider, mock_scheduler, mock_first_dates):
+        provider = FakeProvider(splits={
+            'IVV.AX': [{'date': '2022-01-03', 'ratio': 4.0}, {'date': '2025-12-01', 'ratio': 2.0}],
+            'VAS.AX': [{'date': '2024-08-01', 'ratio': 0.1}]
+        })
+        mock_provider.return_value = provider
+        mock_scheduler.return_value = RequestScheduler(workers=1, requestsPerSecond=100)
+        mock_first_dates.return_value = {'IVV.AX': date(2023, 1, 1), 'VAS.AX': date(2022, 6, 1)}
+
+        splits = history.fetchSplitHistory(MagicMock(), ['IVV.AX', 'VAS.AX'])
+
+        self.assertEqual(provider.splitRequests, [(['IVV.AX', 'VAS.AX'], '2022-06-01')])
+        self.assertEqual(splits, [('IVV.AX', '2025-12-01', 2.0), ('VAS.AX', '2024-08-01', 0.1)])
+
+    @patch('fetchers.scheduler.FETCH_MAX_RETRIES', 0)
+    @patch('fetchers.history_fetcher.getFirstInvestmentDates')
+    @patch('fetchers.history_fetcher.getScheduler')
+    @patch('fetchers.history_fetcher.getProvider')
+    def testRateLimitedFetchReturnsNoSplits(self, mock_provider, mock_scheduler, mock_first_dates):
+        mock_provider.return_value.getSplits.side_effect = ProviderRateLimited("Too many requests")
+        mock_scheduler.return_value = RequestScheduler(workers=1, requestsPerSecond=100)
+        mock_first_dates.return_value = {'IVV.AX': date(2023, 1, 1)}
+
+        with patch('builtins.print') as mock_print:
+            splits = history.fetchSplitHistory(MagicMock(), ['IVV.AX'])
+
+        self.assertEqual(splits, [])
+        self.assertIn("Couldn't fetch stock splits", mock_print.call_args[0][0])
+
+    @patch('fetchers.providers.yf.download')
+    def testSplitsFromBulkDownload(self, mock_download):
+        columns = pd.MultiIndex.from_product([['IVV.AX', 'VAS.AX'], ['Close', 'Stock Splits']])
+        index = pd.to_datetime(['2026-10-01', '2026-10-02'])
+        mock_download.return_value = pd.DataFrame([[50.0, 0.0, 90.0, 0.0], [51.0, 3.0, 91.0, 0.0]], index=index, columns=columns)
+
+        splits = YfinanceProvider().getSplits(['IVV.AX', 'VAS.AX'], '2026-01-01')
+
+        self.assertEqual(splits, {'IVV.AX': [{'date': '2026-10-02', 'ratio': 3.0}], 'VAS.AX': []})
+
+class TestLookThroughExposure(unittest.TestCase):
+
+    @patch('fetchers.exposure_fetcher.replaceFundExposures')
+    @patch('fetchers.exposure_fetcher.getFundExposures')
+    @patch('fetchers.exposure_fetcher.getScheduler')
+    @patch('fetchers.exposure_fetcher.getProvider')
+    @patch('utils.settings_utils.getSetting')
+    def testOnlyExpiredTickersFetched(self, mock_setting, mock_provider, mock_scheduler, mock_stored, mock_replace):
+        mock_setting.side_effect = defaultSetting
+        provider = FakeProvider(exposures={'VAS.AX': {'sector': {'Financial Services': 0.3}, 'holding': {'CBA.AX': 0.1}}})
+        mock_provider.return_value = provider
+        mock_scheduler.return_value = RequestScheduler(workers=1, requestsPerSecond=100)
+        mock_stored.return_value = [
+            ('IVV.AX', 'holding', 'AAPL', 0.07, time.time() - 60),
+            ('VAS.AX', 'holding', 'BHP.AX', 0.09, time.time() - 90 * 24 * 60 * 60)
+        ]
+
+        exposures = exposure.getLookThroughExposures(MagicMock(), ['IVV.AX', 'VAS.AX', 'CSL.AX'])
+
+        self.assertEqual(sorted(provider.exposureRequests), ['CSL.AX', 'VAS.AX'])
+        self.assertEqual(sorted(mock_replace.call_args[0][1]), ['CSL.AX', 'VAS.AX'])
+        self.assertEqual(
+            sorted(map(tuple, exposures.values.tolist())),
+            [
+                ('CSL.AX', 'holding', 'CSL.AX', 1.0),
+                ('IVV.AX', 'holding', 'AAPL', 0.07),
+                ('VAS.AX', 'holding', 'CBA.AX', 0.1),
+                ('VAS.AX', 'sector', 'Financial Services', 0.3)
+            ]
+        )
+
+    @patch('fetchers.providers.yf.Ticker')
+    def testProviderFailuresRaisedAsProviderError(self, mock_ticker):
+        mock_ticker.side_effect = requests.ConnectionError("Connection reset")
+
+        with self.assertRaises(ProviderError):
+            YfinanceProvider().getFundExposures('VAS.AX')
+
+class TestFearAndGreedFetch(unittest.TestCase):
+
+    @patch('fetchers.providers.fear_and_greed.get')
+    def testNetworkFailuresRaisedAsProviderError(self, mock_get):
+        mock_get.side_effect = requests.ConnectionError("Connection refused")
+
+        with self.assertRaises(ProviderError):
+            YfinanceProvider().getFearAndGreed()
+
+class TestPriceStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.store = PriceStore(self.tmpDir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def testWritesMergedByDate(self):
+        self.store.write('IVV.AX', [makeBar('2026-10-14', 49.0), makeBar('2026-10-16', 50.0)])
+        self.store.write('IVV.AX', [makeBar('2026-10-16', 50.5), makeBar('2026-10-15', 49.5), makeBar('2026-10-17', 51.0)])
+
+        prices = self.store.read('IVV.AX')
+
+        self.assertEqual([str(day) for day in prices['date']], ['2026-10-14', '2026-10-15', '2026-10-16', '2026-10-17'])
+        self.assertEqual(list(prices['close']), [49.0, 49.5, 50.5, 51.0])
+        self.assertEqual(str(self.store.getLastDate('IVV.AX')), '2026-10-17')
+        self.assertIsNone(self.store.read('VAS.AX'))
+
+    def testWindowReadWithoutCopying(self):
+        self.store.write('IVV.AX', [makeBar(f'2026-10-{day:02d}', float(day)) for day in range(1, 31)])
+
+        window = self.store.read('IVV.AX', start=date(2026, 10, 10), end='2026-10-12')
+
+        self.assertEqual(list(window['close']), [10.0, 11.0, 12.0])
+        self.assertTrue(np.shares_memory(window['close'], self.store._open('IVV.AX')))
+
+class TestQuotePrefetch(unittest.TestCase):
+
+    @patch('fetchers.prefetch.prefetchQuotes')
+    @patch('fetchers.prefetch.getDistinctTickers')
+    @patch('utils.settings_utils.getSetting')
+    def testPrefetchIncludesPortfolioAndIndices(self, mock_setting, mock_tickers, mock_prefetch):
+        mock_setting.side_effect = lambda conn, attribute, default=None: "['^AXJO', 'IVV.AX']" if attribute == 'indices_of_interest' else default
+        mock_tickers.return_value = ['IVV.AX', 'VAS.AX']
+
+        thread = prefetch.startQuotePrefetch(MagicMock())
+        thread.join(5)
+
+        self.assertTrue(thread.daemon)
+        mock_prefetch.assert_called_once_with(['IVV.AX', 'VAS.AX', '^AXJO'])
+
+    @patch('fetchers.prefetch.getDistinctTickers')
+    @patch('utils.settings_utils.getSetting')
+    def testPrefetchDisabled(self, mock_setting, mock_tickers):
+        mock_setting.side_effect = lambda conn, attribute, default=None: 'false' if attribute == 'prefetch_quotes' else default
+
+        self.assertIsNone(prefetch.startQuotePrefetch(MagicMock()))
+        mock_tickers.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,305 @@
+import os
+import unittest
+import psycopg2
+
+from db.config import TABLE_SCHEMA_FILE
+from db.crud import (
+    getCurrentPortfolioData,
+    getCurrentPortfolioTickerData,
+    getDistinctTickers,
+    getDistinctTickersWithPositions,
+    insertNewInvestmentHistory,
+    upsertCorporateActions
+)
+
+MIGRATIONS_DIRECTORY = os.path.join(os.path.dirname(TABLE_SCHEMA_FILE), 'migrations')
+CURRENT_PORTFOLIO_MIGRATION = '006_current_portfolio_table.sql'
+
+# Connection string of a database the tests can build throwaway schemas in, eg. 'dbname=stock_gains_test'.
+# Tests needing a database are skipped without one.
+TEST_DATABASE = os.getenv('STOCK_GAINS_TEST_DB')
+requiresDatabase = unittest.skipUnless(TEST_DATABASE, "Set STOCK_GAINS_TEST_DB to a database the tests can create a schema in")
+
+POSITION_COLUMNS = "ticker, total_volume, average_price, realized_profit, buy_brokerage, sell_brokerage"
+
+def readMigration(name):
+    with open(os.path.join(MIGRATIONS_DIRECTORY, name), 'r') as f:
+        return f.read()
+
+def getMigrationNames(after=None, upTo=None):
+    """
+    Names of the migration files in the order they are applied, optionally only those after `after` up to and including `upTo`
+    """
+    return [
+        name for name in sorted(os.listdir(MIGRATIONS_DIRECTORY))
+        if name.endswith('.sql') and (after is None or name > after) and (upTo is None or name <= upTo)
+    ]
+
+def createTestSchema(conn, schema, upTo=None):
+    """
+    Create a schema from `schema.sql` and apply migrations to it, as `database_setup` does for a new database,
+    and point the connection at it.
+
+    Params:
+    - conn: connection to the test database
+    - schema: name of the schema to create
+    - upTo: last migration to apply. Default: None (every migration)
+    """
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(f'CREATE SCHEMA {schema};')
+            cur.execute(f'SET search_path TO {schema};')
+            with open(TABLE_SCHEMA_FILE, 'r') as f:
+                cur.execute(f.read())
+            for name in getMigrationNames(upTo=upTo):
+                cur.execute(readMigration(name))
+
+def dropTestSchema(conn, schema):
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(f'DROP SCHEMA {schema} CASCADE;')
+    conn.close()
+
+def recordTrades(conn, trades):
+    with conn:
+        with conn.cursor() as cur:
+            for trade in trades:
+                insertNewInvestmentHistory(cur, *trade)
+
+def executeSql(conn, query, params=None):
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+
+def getPositions(conn, relation):
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {POSITION_COLUMNS} FROM {relation} ORDER BY ticker;")
+            return cur.fetchall()
+
+@requiresDatabase
+class TestCurrentPortfolioMigration(unittest.TestCase):
+    """
+    Migration 006 applied to a database holding trades, as when upgrading an existing install
+    """
+
+    def setUp(self):
+        self.conn = psycopg2.connect(TEST_DATABASE)
+        self.schema = f'migration_tests_upgrade_{os.getpid()}'
+        createTestSchema(self.conn, self.schema, upTo=getMigrationNames(upTo=CURRENT_PORTFOLIO_MIGRATION)[-2])
+
+    def tearDown(self):
+        dropTestSchema(self.conn, self.schema)
+
+    def testPositionsMatchReplacedView(self):
+        recordTrades(self.conn, [
+            ('IVV.AX', 50.0, 10, 5.0, '2026-01-05', 'BUY'),
+            ('IVV.AX', 60.0, 7.5, 5.0, '2026-02-05', 'BUY'),
+            ('IVV.AX', 70.0, 12, 5.0, '2026-03-05', 'SELL'),
+            ('IVV.AX', 40.0, 3, 5.0, '2026-08-05', 'BUY'),
+            ('VAS.AX', 90.0, 4, 5.0, '2026-01-05', 'BUY'),
+            ('VAS.AX', 95.0, 4, 5.0, '2026-02-05', 'SELL'),
+            ('NDQ.AX', 45.0, 20, 5.0, '2026-01-05', 'BUY')
+        ])
+        executeSql(self.conn, """
+            INSERT INTO corporate_actions (ticker, date, ratio, applies_from, cumulative_factor)
+            VALUES
+                ('IVV.AX', '2026-04-01', 2, '-infinity', 6),
+                ('IVV.AX', '2026-07-01', 3, '2026-04-01', 3);
+        """)
+        executeSql(self.conn, "REFRESH MATERIALIZED VIEW current_portfolio;")
+        viewPositions = getPositions(self.conn, 'current_portfolio')
+
+        executeSql(self.conn, readMigration(CURRENT_PORTFOLIO_MIGRATION))
+
+        # Every existing position is built by the migration, with the same figures as the view it replaces
+        self.assertEqual([position[0] for position in viewPositions], ['IVV.AX', 'NDQ.AX', 'VAS.AX'])
+        self.assertEqual(getPositions(self.conn, 'current_portfolio'), viewPositions)
+
+@requiresDatabase
+class TestCurrentPortfolioTriggers(unittest.TestCase):
+    """
+    Every migration applied to a throwaway schema: trade writes mark their tickers dirty,
+    and crud reads recompute the dirty tickers before reading `current_portfolio`
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.conn = psycopg2.connect(TEST_DATABASE)
+        cls.schema = f'migration_tests_{os.getpid()}'
+        createTestSchema(cls.conn, cls.schema)
+
+    @classmethod
+    def tearDownClass(cls):
+        dropTestSchema(cls.conn, cls.schema)
+
+    def setUp(self):
+        executeSql(self.conn, 'TRUNCATE investment_history, corporate_actions, current_portfolio, portfolio_dirty_tickers, dividends RESTART IDENTITY;')
+
+    def execute(self, query, params=None):
+        executeSql(self.conn, query, params)
+
+    def recordTrades(self, trades):
+        recordTrades(self.conn, trades)
+
+    def getDirtyTickers(self):
+        with self.conn:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT ticker FROM portfolio_dirty_tickers ORDER BY ticker;")
+                return [row[0] for row in cur.fetchall()]
+
+    def getStoredPosition(self, ticker):
+        """
+        The ticker's `current_portfolio` row as stored, without recomputing dirty tickers first
+        """
+        with self.conn:
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    SELECT total_volume, average_price, realized_profit, buy_brokerage, sell_brokerage
+                    FROM current_portfolio
+                    WHERE ticker = %s;
+                """, (ticker,))
+                row = cur.fetchone()
+                return tuple(float(value) if value is not None else None for value in row) if row else None
+
+    def readPosition(self, ticker):
+        """
+        The ticker's `current_portfolio` row after a read through crud
+        """
+        getCurrentPortfolioData(self.conn, [ticker])
+        return self.getStoredPosition(ticker)
+
+    def testTradesOnlyMarkTheirTickersDirty(self):
+        self.recordTrades([('VAS.AX', 90.0, 10, 5.0, '2026-01-05', 'BUY')])
+        self.assertEqual(self.readPosition('VAS.AX'), (10.0, 90.0, 0.0, 5.0, 0.0))
+
+        self.recordTrades([
+            ('IVV.AX', 50.0, 10, 5.0, '2026-01-05', 'BUY'),
+            ('IVV.AX', 60.0, 10, 5.0, '2026-02-05', 'BUY')
+        ])
+
+        self.assertEqual(self.getDirtyTickers(), ['IVV.AX'])
+        self.assertIsNone(self.getStoredPosition('IVV.AX'))
+        self.assertEqual(self.getStoredPosition('VAS.AX'), (10.0, 90.0, 0.0, 5.0, 0.0))
+
+    def testReadRecomputesAndClearsDirtyTickers(self):
+        self.recordTrades([
+            ('IVV.AX', 50.0, 10, 5.0, '2026-01-05', 'BUY'),
+            ('IVV.AX', 60.0, 10, 5.0, '2026-02-05', 'BUY'),
+            ('IVV.AX', 70.0, 5, 5.0, '2026-03-05', 'SELL'),
+            ('VAS.AX', 90.0, 10, 5.0, '2026-01-05', 'BUY')
+        ])
+
+        portfolioData = getCurrentPortfolioData(self.conn, ['IVV.AX', 'VAS.AX'])
+
+        # The highest priced units are sold first: 5 of the 60 lot, leaving 10 at 50 and 5 at 60
+        self.assertEqual(self.getStoredPosition('IVV.AX'), (15.0, 53.33, 50.0, 10.0, 5.0))
+        self.assertEqual(portfolioData['IVV.AX']['volume'], 15.0)
+        self.assertEqual(portfolioData['IVV.AX']['realized_profit'], 50.0)
+        self.assertEqual(portfolioData['VAS.AX']['cost'], 900.0)
+        self.assertEqual(self.getDirtyTickers(), [])
+
+    def testEveryCrudReadRecomputesFirst(self):
+        for read in (getDistinctTickers, getDistinctTickersWithPositions, lambda conn: getCurrentPortfolioTickerData(conn, 'IVV.AX')):
+            self.recordTrades([('IVV.AX', 50.0, 10, 5.0, '2026-01-05', 'BUY')])
+            self.assertEqual(self.getDirtyTickers(), ['IVV.AX'])
+
+            read(self.conn)
+
+            self.assertEqual(self.getDirtyTickers(), [])
+        self.assertEqual(self.getStoredPosition('IVV.AX'), (30.0, 50.0, 0.0, 15.0, 0.0))
+
+    def testMultiRowInsertMarksEveryTicker(self):
+        self.execute("""
+            INSERT INTO investment_history (ticker, price, volume, brokerage, date, status)
+            VALUES
+                ('IVV.AX', 50.0, 10, 5.0, '2026-01-05', 'BUY'),
+                ('VAS.AX', 90.0, 4, 5.0, '2026-01-05', 'BUY'),
+                ('IVV.AX', 60.0, 10, 5.0, '2026-01-06', 'BUY');
+        """)
+
+        self.assertEqual(self.getDirtyTickers(), ['IVV.AX', 'VAS.AX'])
+        self.assertEqual(self.readPosition('IVV.AX'), (20.0, 55.0, 0.0, 10.0, 0.0))
+        self.assertEqual(self.getStoredPosition('VAS.AX'), (4.0, 90.0, 0.0, 5.0, 0.0))
+
+    def testUpdatedTradeMarksOldAndNewTicker(self):
+        self.recordTrades([
+            ('IVV.AX', 50.0, 10, 5.0, '2026-01-05', 'BUY'),
+            ('IVV.AX', 90.0, 4, 5.0, '2026-01-06', 'BUY')
+        ])
+        self.readPosition('IVV.AX')
+
+        self.execute("UPDATE investment_history SET ticker = 'VAS.AX' WHERE price = 90.0;")
+
+        self.assertEqual(self.getDirtyTickers(), ['IVV.AX', 'VAS.AX'])
+        self.assertEqual(self.readPosition('IVV.AX'), (10.0, 50.0, 0.0, 5.0, 0.0))
+        self.assertEqual(self.getStoredPosition('VAS.AX'), (4.0, 90.0, 0.0, 5.0, 0.0))
+
+    def testClosedAndDeletedPositions(self):
+        self.recordTrades([
+            ('IVV.AX', 50.0, 10, 5.0, '2026-01-05', 'BUY'),
+            ('IVV.AX', 55.0, 10, 5.0, '2026-02-05', 'SELL'),
+            ('VAS.AX', 90.0, 4, 5.0, '2026-01-05', 'BUY')
+        ])
+
+        # A sold out position keeps its realized profit
+        self.assertEqual(self.readPosition('IVV.AX'), (0.0, None, 50.0, 5.0, 5.0))
+        self.assertEqual(getDistinctTickersWithPositions(self.conn), ['VAS.AX'])
+
+        self.execute("DELETE FROM investment_history WHERE ticker = 'VAS.AX';")
+
+        self.assertEqual(self.getDirtyTickers(), ['VAS.AX'])
+        self.assertIsNone(self.readPosition('VAS.AX'))
+        self.assertEqual(self.getStoredPosition('IVV.AX'), (0.0, None, 50.0, 5.0, 5.0))
+
+    def testSplitsMarkTickersDirty(self):
+        self.recordTrades([
+            ('IVV.AX', 60.0, 10, 5.0, '2026-01-05', 'BUY'),
+            ('VAS.AX', 90.0, 4, 5.0, '2026-01-05', 'BUY')
+        ])
+        self.readPosition('IVV.AX')
+
+        self.assertEqual(upsertCorporateActions(self.conn, [('IVV.AX', '2026-06-01', 2.0)]), ['IVV.AX'])
+
+        # Recorded splits only mark their tickers, the position is restated on the next read
+        self.assertEqual(self.getDirtyTickers(), ['IVV.AX'])
+        self.assertEqual(self.getStoredPosition('IVV.AX'), (10.0, 60.0, 0.0, 5.0, 0.0))
+        self.assertEqual(self.readPosition('IVV.AX'), (20.0, 30.0, 0.0, 5.0, 0.0))
+        self.assertEqual(self.getDirtyTickers(), [])
+
+        # An unchanged split leaves the position alone
+        self.assertEqual(upsertCorporateActions(self.conn, [('IVV.AX', '2026-06-01', 2.0)]), [])
+        self.assertEqual(self.getDirtyTickers(), [])
+
+    def testTickersBeingRecomputedElsewhereSkipped(self):
+        self.recordTrades([('IVV.AX', 50.0, 10, 5.0, '2026-01-05', 'BUY')])
+        self.readPosition('IVV.AX')
+        self.recordTrades([
+            ('IVV.AX', 60.0, 10, 5.0, '2026-02-05', 'BUY'),
+            ('VAS.AX', 90.0, 4, 5.0, '2026-01-05', 'BUY')
+        ])
+
+        other = psycopg2.connect(TEST_DATABASE)
+        try:
+            # Another session part way through recomputing IVV.AX
+            with other.cursor() as cur:
+                cur.execute(f'SET search_path TO {self.schema};')
+                cur.execute("SELECT ticker FROM portfolio_dirty_tickers WHERE ticker = 'IVV.AX' FOR UPDATE;")
+
+            # A read waiting on the lock would fail rather than hang
+            self.execute("SET lock_timeout = '2s';")
+            portfolioData = getCurrentPortfolioData(self.conn, ['IVV.AX', 'VAS.AX'])
+
+            # The read sees the last committed position, and the skipped ticker stays dirty
+            self.assertEqual(portfolioData['IVV.AX']['volume'], 10.0)
+            self.assertEqual(portfolioData['VAS.AX']['volume'], 4.0)
+            self.assertEqual(self.getDirtyTickers(), ['IVV.AX'])
+        finally:
+            other.rollback()
+            other.close()
+            self.execute("RESET lock_timeout;")
+
+        self.assertEqual(self.readPosition('IVV.AX'), (20.0, 55.0, 0.0, 10.0, 0.0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,7 +6,9 @@ COMMANDS = NestedCompleter.from_nested_dict({
     },
     "buy": None,
     "sell": None,
-    "dividend": None,               # Add dividend estimate
+    "dividend": {                   # Add dividend estimate
+        "--sync": None,             # Record dividends from provider distribution history
+    },
     # "ammend": None,               # decide how to do dividend vs buy/sale ammend
     "fear-and-greed": None,         # Display fear and greed index information
     "investment-performance": {     # historical performance of all owned tickers
@@ -16,9 +18,11 @@ COMMANDS = NestedCompleter.from_nested_dict({
     "investment-history": {         # trade or dividend history, optionally filtered by ticker
         "--ticker": None,           # history for specific ticker
     },
-    "portfolio-balance": None,      # Add market percentage
+    "portfolio-balance": None,      # Look-through sector, region and holding exposure
     "portfolio-growth": None,       # Add growth over time of current portfolio
     "rebalance-suggestions": None,
+    "refresh-metadata": None,       # Re-fetch cached ticker names, currencies and exchanges
+    "sync-market-data": None,       # Download missing daily price history into the database
     "settings": None,               # Add backup location, restore backup
     "help": None,                   # Auto-generated?
     "quit": None
@@ -29,15 +33,17 @@ COMMAND_DESCRIPTIONS = {
     # "--full": "Show full details in value output",
     "buy": "Record a new investment purchase",
     "sell": "Record a sale of an investment",
-    "dividend": "Record a dividend payment",
+    "dividend": "Record a dividend payment, or import distributions of current holdings with --sync",
     "fear-and-greed": "Show current CNN Fear and Greed Index information",
     "index-performance": "Show historical performance of index tickers",
     "investment-history": "Show trade or dividend investment history",
     "investment-performance": "Show historical performance of current investments",
     # "--ticker": "Show historical performance of specific ticker",
     "rebalance-suggestions": "Suggest portfolio rebalancing",
-    "portfolio-balance": "Show exposure balances of current portfolio",
+    "portfolio-balance": "Show sector, region and holding exposure of current portfolio, looking through funds",
     "portfolio-growth": "Show growth of portfolio over time",
     "ammend": "Amend a trade or dividend entry",
+    "refresh-metadata": "Re-fetch cached ticker names, currencies and exchanges",
+    "sync-market-data": "Download missing daily price history for portfolio tickers and indices, and portfolio stock splits",
     "settings": "Configure application settings",
 }
@@ -23,6 +23,79 @@ SUPPORTED_SETTINGS = {
         'type': 'json',
         'default': str(DEFAULT_INDEX_TICKERS),
         'description': 'List of indices to track in index performance'
+    },
+    'quote_cache_enabled': {
+        'type': 'boolean',
+        'default': 'true',
+        'description': 'Reuse recently fetched quotes from the on-disk quote cache'
+    },
+    'fetch_concurrency': {
+        'type': 'integer',
+        'default': '8',
+        'description': 'Maximum number of requests sent to the market data provider at once'
+    },
+    'market_data_provider': {
+        'type': 'choice',
+        'choices': ['yfinance', 'record', 'replay'],
+        'default': 'yfinance',
+        'description': 'Market data source. record saves live responses to disk, replay serves them back offline'
+    },
+    'provider_recordings_directory': {
+        'type': 'text',
+        'default': '',
+        'description': 'Directory for recorded provider responses (empty for default)'
+    },
+    'prefetch_quotes': {
+        'type': 'boolean',
+        'default': 'true',
+        'description': 'Fetch portfolio and index quotes in the background at startup'
+    },
+    'stale_while_revalidate': {
+        'type': 'boolean',
+        'default': 'true',
+        'description': 'Show expired cached quotes immediately in value and index performance while fresh ones are fetched'
+    },
+    'fetch_timeout_seconds': {
+        'type': 'integer',
+        'default': '10',
+        'minimum': 0,
+        'description': 'Seconds a command waits for quotes before showing last known or unavailable prices (0 to wait indefinitely)'
+    },
+    'requests_per_second': {
+        'type': 'integer',
+        'default': '5',
+        'description': 'Maximum requests per second sent to the market data provider'
+    },
+    'shared_quote_cache': {
+        'type': 'boolean',
+        'default': 'true',
+        'description': 'Share fetched quotes with other sessions through the database'
+    },
+    'metadata_ttl_days': {
+        'type': 'integer',
+        'default': '14',
+        'description': 'Days ticker names, currencies and exchanges are reused before being fetched again'
+    },
+    'offline_mode': {
+        'type': 'choice',
+        'choices': ['auto', 'on', 'off'],
+        'default': 'auto',
+        'description': 'Skip network requests and show last known data. auto detects when the network is unreachable'
+    },
+    'progressive_render': {
+        'type': 'boolean',
+        'default': 'false',
+        'description': 'Print value table rows as quotes arrive, unsorted, instead of sorted once every quote is fetched'
+    },
+    'base_currency': {
+        'type': 'text',
+        'default': 'AUD',
+        'description': 'Currency portfolio values are converted to, eg. AUD or USD'
+    },
+    'fund_exposure_ttl_days': {
+        'type': 'integer',
+        'default': '30',
+        'description': 'Days fund holdings and sector weights are reused before being fetched again'
     }
 }
 
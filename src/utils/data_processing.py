@@ -1,19 +1,18 @@
-from db.crud import getCurrentPortfolioTickerData
-
-def tickerValueExtractor(conn, data:object):
+def calculateTickerValues(data:object, db_data:dict):
     """
-    Given data from yfinance lookup, produces a dictionary of all required information for listing ticker value.
+    Combines a ticker's quote with its current portfolio figures into the values listed for it.
+    Does no database access, so can run as each quote arrives.
 
     Params:
-    - data: List for a single ticker from `getTickerData()`
-        -> format: [ticker, fullName, price, cost, value, percGain, netPercGain, gain, netGain, dividend, totalBrokerage]
+    - data: dictionary with the ticker's `ticker`, `price` and optionally `fullName`
+    - db_data: the ticker's row from `getCurrentPortfolioData()`
+    Returns:
+    - list: [ticker, fullName, price, volume, cost, value, percGain, netPercGain, gain, netGain, dividend, buyBrokerage, sellBrokerage, realizedProfit]
     """
-    
     ticker = data['ticker']
     price = data['price']
-    fullName = data['fullName']
+    fullName = data.get('fullName')
 
-    db_data = getCurrentPortfolioTickerData(conn, ticker)
     volume = db_data['volume']
     cost = db_data['cost'] if db_data['cost'] is not None else 0
     buyBrokerage = db_data['buy_brokerage']
@@ -21,7 +20,10 @@ def tickerValueExtractor(conn, data:object):
     dividend = db_data['dividends']
     realizedProfit = db_data['realized_profit']
 
-    if volume > 0:
+    if volume > 0 and price is None:
+        # No quote available, so nothing that depends on price can be computed
+        return [ticker, fullName, None, volume, cost, None, "N/A", "N/A", None, None, dividend, buyBrokerage, sellBrokerage, realizedProfit]
+    elif volume > 0:
         value = price * volume
         gain = value - cost
         netGain = (value + dividend + realizedProfit) - (cost + buyBrokerage + sellBrokerage)
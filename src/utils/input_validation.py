@@ -18,7 +18,7 @@ def isValidExistingTicker(conn, ticker):
     return checkIfTickerExists(conn, ticker)
 
 def isValidTicker(conn, ticker):
-    return isValidExistingTicker(conn, ticker) or isValidYfinanceTicker(ticker)
+    return isValidExistingTicker(conn, ticker) or isValidYfinanceTicker(conn, ticker)
 
 class BooleanValidator(Validator):
     def validate(self, document):
@@ -80,6 +80,30 @@ class SettingBooleanValidator(Validator):
         if value and value not in ['true', 'false']:
             raise ValidationError(message='Boolean setting must be: true or false', cursor_position=len(document.text))
 
+class SettingIntegerValidator(Validator):
+    """
+    Validates integer setting values (whole numbers of at least the setting's minimum, 1 unless given)
+    """
+    def __init__(self, minimum=1):
+        self.minimum = minimum
+
+    def validate(self, document):
+        text = document.text.strip()
+        if text and (not text.isdigit() or int(text) < self.minimum):
+            raise ValidationError(message=f'Setting must be a whole number of at least {self.minimum}', cursor_position=len(document.text))
+
+class SettingChoiceValidator(Validator):
+    """
+    Validates choice setting values against the allowed choices (case-insensitive)
+    """
+    def __init__(self, choices):
+        self.choices = choices
+
+    def validate(self, document):
+        value = document.text.lower().strip()
+        if value and value not in self.choices:
+            raise ValidationError(message=f'Setting must be one of: {", ".join(self.choices)}', cursor_position=len(document.text))
+
 class SettingJsonValidator(Validator):
     """
     Validates that input is valid JSON (specifically a Python list representation)
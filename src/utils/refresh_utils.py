@@ -0,0 +1,24 @@
+from utils.table_utils import formatCurrency
+
+def makeQuoteRefreshNotifier(command):
+    """
+    Create an `onRefresh` callback for the fetchers that prints a notice when fresh quotes
+    replace the stale ones a command was rendered with.
+
+    Params:
+    - command: command to suggest re-running, eg. 'value'
+    """
+    def onRefresh(stale, refreshed):
+        changes = []
+        for ticker, quote in refreshed.items():
+            stalePrice = stale.get(ticker, {}).get('price')
+            price = quote['price']
+            if stalePrice is None or stalePrice == price:
+                changes.append(f"{ticker} {formatCurrency(price, includeDollarSign=False)}")
+            else:
+                changes.append(f"{ticker} {formatCurrency(stalePrice, includeDollarSign=False)} -> {formatCurrency(price, includeDollarSign=False)}")
+
+        print(f"\nFresh quotes arrived: {', '.join(changes)}")
+        print(f"Run `{command}` again to see updated values.")
+
+    return onRefresh
@@ -0,0 +1,60 @@
+import ast
+
+from db.crud import getSetting
+from utils.constants.defaults import SUPPORTED_SETTINGS, getDefaultSetting
+
+def getBooleanSetting(conn, settingName):
+    """
+    Get a boolean setting, falling back to its default if unset.
+
+    Params:
+    - conn: connection to database
+    - settingName: name of the setting in `SUPPORTED_SETTINGS`
+    """
+    return getSetting(conn, settingName, getDefaultSetting(settingName)).lower() == 'true'
+
+def getIntegerSetting(conn, settingName):
+    """
+    Get an integer setting, falling back to its default if unset or invalid.
+
+    Params:
+    - conn: connection to database
+    - settingName: name of the setting in `SUPPORTED_SETTINGS`
+    """
+    default = getDefaultSetting(settingName)
+    try:
+        return int(getSetting(conn, settingName, default))
+    except (TypeError, ValueError):
+        print(f"\nInvalid value for setting '{settingName}'. Using default of {default}.")
+        return int(default)
+
+def getListSetting(conn, settingName):
+    """
+    Get a list setting, falling back to its default if unset or invalid.
+
+    Params:
+    - conn: connection to database
+    - settingName: name of the setting in `SUPPORTED_SETTINGS`
+    """
+    default = getDefaultSetting(settingName)
+    try:
+        return ast.literal_eval(getSetting(conn, settingName, default))
+    except (ValueError, SyntaxError):
+        print(f"\nError parsing '{settingName}' from settings. Using default.")
+        return ast.literal_eval(default)
+
+
+def getChoiceSetting(conn, settingName):
+    """
+    Get a choice setting in lower case, falling back to its default if unset or not one of its choices.
+
+    Params:
+    - conn: connection to database
+    - settingName: name of the setting in `SUPPORTED_SETTINGS`
+    """
+    default = getDefaultSetting(settingName)
+    value = getSetting(conn, settingName, default).lower()
+    if value not in SUPPORTED_SETTINGS[settingName]['choices']:
+        print(f"\nInvalid value for setting '{settingName}'. Using default of {default}.")
+        return default
+    return value
@@ -1,6 +1,27 @@
 import re
+import math
+import time
+import textwrap
+import threading
+
+from fetchers.config import QUOTE_STATUS_LAST_KNOWN, QUOTE_STATUS_UNAVAILABLE, QUOTE_STATUS_OFFLINE
+
+# Markers appended to a row's label when its quote is not live, with the note explaining each
+QUOTE_STATUS_MARKERS = {
+    QUOTE_STATUS_LAST_KNOWN: '!',
+    QUOTE_STATUS_UNAVAILABLE: '?',
+    QUOTE_STATUS_OFFLINE: '~',
+}
+QUOTE_STATUS_NOTES = {
+    QUOTE_STATUS_LAST_KNOWN: "! Quote not received in time, showing last known price",
+    QUOTE_STATUS_UNAVAILABLE: "? Quote not received in time and no previous price available",
+    QUOTE_STATUS_OFFLINE: "~ Offline, showing last known price",
+}
 
 def formatCurrency(value, includeDollarSign=True, decimal_places=2):
+    if isMissing(value):
+        return "-"
+
     # Convert scientific notation to float if needed
     if isinstance(value, str) and re.search(r'e[-+]?\d+', value, re.IGNORECASE):
         try:
@@ -22,19 +43,128 @@ def formatCurrency(value, includeDollarSign=True, decimal_places=2):
         else:
             return f"{num:{fmt}}"
 
+def isMissing(value):
+    return value is None or value == "N/A" or (isinstance(value, float) and math.isnan(value))
+
 def formatPercentage(value):
-    if value is None or value == "N/A":
+    if isMissing(value):
         return "-"
     return f"{value:.2f}%"
 
 def formatRatio(value):
-    if value is None or value == "N/A":
+    if isMissing(value):
         return "-"
     return f"{value:.2f}"
 
+def formatVolume(value):
+    # Volumes are fractional after some splits, whole volumes are shown without decimals
+    if isMissing(value):
+        return "-"
+    return f"{float(value):.4f}".rstrip('0').rstrip('.')
+
 def formatTickerGroup(tickerGroup):
     if not tickerGroup:
         return "-"
     if isinstance(tickerGroup, list):
         return ', '.join(tickerGroup)
     return tickerGroup
+
+def formatAge(fetchedAt, now=None):
+    """
+    Format how long ago a quote was fetched, eg. '45s', '12m', '3h', '2d'
+
+    Params:
+    - fetchedAt: epoch seconds the quote was fetched at
+    - now: epoch seconds to compare against. Default: current time
+    """
+    if isMissing(fetchedAt):
+        return "-"
+    now = now if now is not None else time.time()
+    seconds = max(0, int(now - fetchedAt))
+    if seconds < 60:
+        return f"{seconds}s"
+    elif seconds < 60 * 60:
+        return f"{seconds // 60}m"
+    elif seconds < 24 * 60 * 60:
+        return f"{seconds // (60 * 60)}h"
+    else:
+        return f"{seconds // (24 * 60 * 60)}d"
+
+def formatQuoteStatus(label, quoteStatus):
+    """
+    Append the marker for a quote status to a row label, eg. 'IVV.AX!' for a last known price,
+    'IVV.AX?' for an unavailable price or 'IVV.AX~' for an offline quote
+    """
+    return f"{label}{QUOTE_STATUS_MARKERS.get(quoteStatus, '')}"
+
+def formatAsOf(fetchedAt):
+    """
+    Format the local time a quote was fetched at, eg. '2026-10-18 09:30'
+    """
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(fetchedAt))
+
+def formatQuoteStatusNotes(quoteStatuses, fetchedAts=None):
+    """
+    Get the notes explaining each marker used in a table, one per line. Empty if every quote is live.
+
+    Params:
+    - quoteStatuses: iterable of the `quoteStatus` of each row
+    - fetchedAts: iterable of the `fetchedAt` of each row. If given, the offline note includes
+      when the oldest offline quote was fetched. Default: None
+    """
+    quoteStatuses = list(quoteStatuses)
+    notes = {status: note for status, note in QUOTE_STATUS_NOTES.items() if status in quoteStatuses}
+
+    if QUOTE_STATUS_OFFLINE in notes and fetchedAts is not None:
+        offlineFetchedAts = [
+            fetchedAt for quoteStatus, fetchedAt in zip(quoteStatuses, fetchedAts)
+            if quoteStatus == QUOTE_STATUS_OFFLINE and not isMissing(fetchedAt)
+        ]
+        if offlineFetchedAts:
+            notes[QUOTE_STATUS_OFFLINE] += f" as of {formatAsOf(min(offlineFetchedAts))}"
+
+    return "\n".join(notes.values())
+
+
+class StreamingTable:
+    """
+    Prints a table a row at a time, in the same style as tabulate's 'rounded_grid' format,
+    so rows can be shown as soon as their data is ready instead of once the whole table is built.
+
+    Column widths are fixed up front from `maxColWidths`, longer cells are wrapped over several lines.
+    """
+    def __init__(self, columns, maxColWidths, colAlign):
+        self.columns = columns
+        self.maxColWidths = maxColWidths
+        self.colAlign = colAlign
+        self.widths = [max(len(column), width) for column, width in zip(columns, maxColWidths)]
+        self._lock = threading.Lock()
+
+    def _border(self, left, middle, right):
+        return left + middle.join('─' * (width + 2) for width in self.widths) + right
+
+    def _lines(self, cells, wrapWidths):
+        wrapped = [textwrap.wrap('' if cell is None else str(cell), width) or [''] for cell, width in zip(cells, wrapWidths)]
+        lines = []
+        for i in range(max(len(cellLines) for cellLines in wrapped)):
+            parts = []
+            for cellLines, width, align in zip(wrapped, self.widths, self.colAlign):
+                text = cellLines[i] if i < len(cellLines) else ''
+                parts.append(text.rjust(width) if align == 'right' else text.ljust(width))
+            lines.append('│ ' + ' │ '.join(parts) + ' │')
+        return lines
+
+    def printHeader(self):
+        print(self._border('╭', '┬', '╮'))
+        print("\n".join(self._lines(self.columns, self.widths)))
+
+    def printRow(self, row):
+        """
+        Print a row below the rows already printed. Safe to call from several threads.
+        """
+        with self._lock:
+            print(self._border('├', '┼', '┤'))
+            print("\n".join(self._lines(row, self.maxColWidths)))
+
+    def printFooter(self):
+        print(self._border('╰', '┴', '╯'))